@@ -0,0 +1,153 @@
+# Mirrored in interview_py/src and internal_py/src, which are built from
+# separate contexts. Keep both copies identical.
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+import json
+import struct
+import sys
+
+# Version byte at the start of every encoded buffer
+FORMAT_VERSION = 1
+
+# version, capacity, size, head
+_HEADER = struct.Struct("<BIII")
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Stored instead of epoch seconds for entries without a timestamp
+UNTIMED = -(2**63)
+
+
+def _to_epoch_seconds(timestamp: Any) -> int:
+    """Convert a datetime (or its ISO string) to integer epoch seconds"""
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    if timestamp.tzinfo is not None:
+        # Aware timestamps are stored as naive UTC
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return int((timestamp - _EPOCH).total_seconds())
+
+
+def _from_epoch_seconds(seconds: int) -> Optional[datetime]:
+    if seconds == UNTIMED:
+        return None
+    return _EPOCH + timedelta(seconds=seconds)
+
+
+def _little_endian(values: array) -> array:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+class HistoryBuffer:
+    """
+    Fixed-capacity ring buffer of (timestamp, value) pairs for object state
+
+    Encoded as a small header followed by packed little-endian int64 epoch
+    seconds and float64 values, instead of a JSON list of dicts.
+    """
+
+    def __init__(self, capacity: int = 100):
+        self.capacity = capacity
+        self.size = 0
+        self.head = 0  # slot the next value is written to
+        self._times = array("q", bytes(8 * capacity))
+        self._values = array("d", bytes(8 * capacity))
+
+    @classmethod
+    def from_state(cls, state: Optional[bytes], capacity: int = 100) -> "HistoryBuffer":
+        """Decode object state, migrating legacy JSON lists of data points"""
+        if not state:
+            return cls(capacity)
+
+        if state[:1] == b"[":
+            # Legacy JSON state: data point dicts, or bare values without timestamps
+            buffer = cls(capacity)
+            for item in json.loads(state):
+                if isinstance(item, dict):
+                    buffer.append(item["timestamp"], item["value"])
+                else:
+                    buffer._append_raw(UNTIMED, item)
+            return buffer
+
+        version, stored_capacity, size, head = _HEADER.unpack_from(state)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported history state version {version}")
+
+        offset = _HEADER.size
+        times = array("q")
+        times.frombytes(state[offset : offset + 8 * stored_capacity])
+        offset += 8 * stored_capacity
+        values = array("d")
+        values.frombytes(state[offset : offset + 8 * stored_capacity])
+
+        stored = cls(stored_capacity)
+        stored._times = _little_endian(times)
+        stored._values = _little_endian(values)
+        stored.size, stored.head = size, head
+
+        if stored_capacity == capacity:
+            return stored
+
+        # Re-pack into the requested capacity, keeping the newest entries
+        buffer = cls(capacity)
+        for seconds, value in stored._entries():
+            buffer._append_raw(seconds, value)
+        return buffer
+
+    def to_state(self) -> bytes:
+        """Encode the buffer for object state"""
+        return (
+            _HEADER.pack(FORMAT_VERSION, self.capacity, self.size, self.head)
+            + _little_endian(self._times).tobytes()
+            + _little_endian(self._values).tobytes()
+        )
+
+    def _append_raw(self, seconds: int, value: float) -> Optional[float]:
+        evicted = self._values[self.head] if self.size == self.capacity else None
+        self._times[self.head] = seconds
+        self._values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return evicted
+
+    def append(self, timestamp: Any, value: float) -> Optional[float]:
+        """
+        Add a value, overwriting the oldest entry once full
+
+        Returns:
+            The overwritten value, or None while the buffer is not yet full
+        """
+        return self._append_raw(_to_epoch_seconds(timestamp), value)
+
+    def extend(self, data_points: Iterable[Dict[str, Any]]) -> None:
+        """Add data points with "timestamp" and "value" keys in order"""
+        for data_point in data_points:
+            self.append(data_point["timestamp"], data_point["value"])
+
+    def _entries(self):
+        start = (self.head - self.size) % self.capacity
+        for offset in range(self.size):
+            slot = (start + offset) % self.capacity
+            yield self._times[slot], self._values[slot]
+
+    def values(self) -> List[float]:
+        """Values in insertion order"""
+        return [value for _, value in self._entries()]
+
+    def to_points(self) -> List[Dict[str, Any]]:
+        """
+        Entries in insertion order as data points with datetime timestamps
+
+        Values migrated from legacy state without timestamps have None.
+        """
+        return [
+            {"timestamp": _from_epoch_seconds(seconds), "value": value}
+            for seconds, value in self._entries()
+        ]
+
+    def __len__(self) -> int:
+        return self.size
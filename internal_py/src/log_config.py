@@ -0,0 +1,185 @@
+# Mirrored in interview_py/src and internal_py/src, which are built from
+# separate contexts. Keep both copies identical.
+"""
+Non-blocking logging for the worker and scripts
+
+Loggers only put records on a bounded queue; a QueueListener thread formats
+and writes them, so handlers never wait on stream I/O. When the queue is full
+records are dropped and counted instead of blocking. Per-point messages are
+logged with extra=SAMPLED and only one in LOG_SAMPLE_RATE of them is kept per
+call site, next to unsampled per-window summary lines.
+"""
+
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Callable, Dict, Optional
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+# text, or json for one JSON object per line
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+
+# Records waiting for the writer thread before new ones are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Keep one in this many sampled records per call site (1 keeps all)
+LOG_SAMPLE_RATE = int(os.getenv("LOG_SAMPLE_RATE", "100"))
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Pass as extra= to mark a per-point record for sampling
+SAMPLED = {"sampled": True}
+
+# LogRecord attributes that are not user-supplied extra fields
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message",
+    "asctime",
+    "sampled",
+}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including extra= fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep the first and then every rate-th SAMPLED record of each call site"""
+
+    def __init__(self, rate: int, on_discard: Optional[Callable[[str], None]] = None):
+        super().__init__()
+        self.rate = max(rate, 1)
+        self.on_discard = on_discard
+        self.suppressed = 0
+        self._seen: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate == 1 or not getattr(record, "sampled", False):
+            return True
+
+        # Keyed by the unformatted message, so arguments do not split the count
+        key = (record.name, record.msg)
+        with self._lock:
+            seen = self._seen.get(key, 0)
+            self._seen[key] = seen + 1
+            keep = seen % self.rate == 0
+            if not keep:
+                self.suppressed += 1
+
+        if keep:
+            record.sample_rate = self.rate
+        elif self.on_discard is not None:
+            self.on_discard("sampled")
+        return keep
+
+
+class BoundedQueueHandler(QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of blocking"""
+
+    def __init__(
+        self, log_queue: queue.Queue, on_discard: Optional[Callable[[str], None]] = None
+    ):
+        super().__init__(log_queue)
+        self.on_discard = on_discard
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Unlike QueueHandler, leave %-formatting to the listener thread. Records
+        # stay in-process, so the arguments are passed along unformatted
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            if self.on_discard is not None:
+                self.on_discard("queue_full")
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Wait for room, a full queue must not stop the shutdown flush
+        self.queue.put(self._sentinel)
+
+
+_handler: Optional[BoundedQueueHandler] = None
+_filter: Optional[SamplingFilter] = None
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging(
+    level: str = LOG_LEVEL,
+    fmt: str = TEXT_FORMAT,
+    json_output: Optional[bool] = None,
+    sample_rate: int = LOG_SAMPLE_RATE,
+    queue_size: int = LOG_QUEUE_SIZE,
+    on_discard: Optional[Callable[[str], None]] = None,
+) -> QueueListener:
+    """
+    Route the root logger through a bounded queue to a background writer
+
+    Args:
+        level: Root log level
+        fmt: %-style format of text output
+        json_output: Write JSON lines, defaults to LOG_FORMAT == "json"
+        sample_rate: Keep one in this many SAMPLED records per call site
+        queue_size: Maximum queued records before records are dropped
+        on_discard: Called with "sampled" or "queue_full" per discarded record
+
+    Returns:
+        The started listener (the same one on repeated calls), stopped at exit
+    """
+    global _handler, _filter, _listener
+    if _listener is not None:
+        return _listener
+
+    if json_output is None:
+        json_output = LOG_FORMAT == "json"
+
+    stream = logging.StreamHandler()
+    stream.setFormatter(JsonFormatter() if json_output else logging.Formatter(fmt))
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    _handler = BoundedQueueHandler(log_queue, on_discard)
+    _filter = SamplingFilter(sample_rate, on_discard)
+    _handler.addFilter(_filter)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_handler)
+    root.setLevel(level)
+
+    _listener = _Listener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
+
+
+def discard_counts() -> Dict[str, int]:
+    """Records discarded since configure_logging, by reason"""
+    return {
+        "sampled": _filter.suppressed if _filter is not None else 0,
+        "queue_full": _handler.dropped if _handler is not None else 0,
+    }
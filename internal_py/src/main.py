@@ -1,15 +1,22 @@
 # internal_py/src/main.py
 import logging
+import os
 import uuid
+import numpy as np
 import restate
-from pydantic import BaseModel
+from restate.serde import BytesSerde
+from pydantic import BaseModel, field_validator
+from datetime import datetime
 from typing import List, Optional
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="[%(asctime)s] [%(process)d] [%(levelname)s] - %(message)s",
-)
+from history_buffer import HistoryBuffer
+from log_config import SAMPLED, configure_logging
+from rolling_stats import RollingStats
+from validation_rules import ValidationRule, load_validation_rules
+
+# Configure logging: records are written by a background thread and
+# per-point lines are sampled (see log_config)
+configure_logging(fmt="[%(asctime)s] [%(process)d] [%(levelname)s] - %(message)s")
 logger = logging.getLogger(__name__)
 
 
@@ -33,26 +40,36 @@ class ValueValidationResult(BaseModel):
     adjusted_value: Optional[float] = None
 
 
+class SolarProductionBatch(BaseModel):
+    readings: List[SolarProductionData]
+
+
+class SolarBatchResult(BaseModel):
+    process_id: str
+    results: List[ValueValidationResult]
+
+
 # ----- First Service: Solar Production ETL -----
 solar_etl_service = restate.Service("SolarETLService")
 
+# Constants for validation
+MIN_VALID_VALUE = 0.0
+MAX_VALID_VALUE = 5000.0  # Example max value for a solar plant in kW
+
 
 @solar_etl_service.handler()
 async def process_solar_data(
     ctx: restate.Context, data: SolarProductionData
 ) -> ValueValidationResult:
     """Process solar production data, validate it, and log the result."""
-    # Constants for validation
-    MIN_VALID_VALUE = 0.0
-    MAX_VALID_VALUE = 5000.0  # Example max value for a solar plant in kW
-
     # Generate a stable ID for idempotency
     process_id = await ctx.run("process_id", lambda: str(uuid.uuid4()))
 
-    # Validate the data
+    # Validate the data (journaled as JSON, read back as the model)
     validation_result = await ctx.run(
         "validate_solar_data",
         lambda: validate_solar_data(data, MIN_VALID_VALUE, MAX_VALID_VALUE),
+        type_hint=ValueValidationResult,
     )
 
     # Log the result as if saving to a database
@@ -63,6 +80,26 @@ async def process_solar_data(
     return validation_result
 
 
+@solar_etl_service.handler()
+async def process_solar_batch(
+    ctx: restate.Context, batch: SolarProductionBatch
+) -> SolarBatchResult:
+    """Process many solar readings with one process ID and one journaled write."""
+    # One ID for the batch, rows are addressed as <process_id>/<index>
+    process_id = await ctx.run("process_id", lambda: str(uuid.uuid4()))
+
+    # Validation is deterministic, so it runs on replay instead of being journaled
+    results = validate_solar_batch(batch.readings, MIN_VALID_VALUE, MAX_VALID_VALUE)
+
+    # Log all results as a single write
+    await ctx.run(
+        "log_results",
+        lambda: log_db_batch(process_id, batch.readings, results),
+    )
+
+    return SolarBatchResult(process_id=process_id, results=results)
+
+
 def validate_solar_data(
     data: SolarProductionData, min_val: float, max_val: float
 ) -> ValueValidationResult:
@@ -85,6 +122,39 @@ def validate_solar_data(
         return ValueValidationResult(is_valid=True, original_value=data.value)
 
 
+def validate_solar_batch(
+    readings: List[SolarProductionData], min_val: float, max_val: float
+) -> List[ValueValidationResult]:
+    """Validate solar readings against min/max bounds in one vectorized pass."""
+    values = np.fromiter((reading.value for reading in readings), np.float64)
+    below = values < min_val
+    above = values > max_val
+    adjusted = np.clip(values, min_val, max_val)
+
+    results = []
+    for index, reading in enumerate(readings):
+        if below[index]:
+            reason = f"Value below minimum threshold ({min_val})"
+        elif above[index]:
+            reason = f"Value above maximum threshold ({max_val})"
+        else:
+            results.append(
+                ValueValidationResult(is_valid=True, original_value=reading.value)
+            )
+            continue
+
+        results.append(
+            ValueValidationResult(
+                is_valid=False,
+                reason=reason,
+                original_value=reading.value,
+                adjusted_value=float(adjusted[index]),
+            )
+        )
+
+    return results
+
+
 def log_db_operation(
     process_id: str, data: SolarProductionData, result: ValueValidationResult
 ):
@@ -97,86 +167,271 @@ def log_db_operation(
 
     if result.is_valid:
         logger.info(
-            f"[DB_SAVE] Process ID: {process_id} - Saved valid solar data: "
-            f"Plant: {data.plant_id}, Time: {data.timestamp}, Value: {value_to_save} kW"
+            "[DB_SAVE] Process ID: %s - Saved valid solar data: "
+            "Plant: %s, Time: %s, Value: %s kW",
+            process_id,
+            data.plant_id,
+            data.timestamp,
+            value_to_save,
+            extra=SAMPLED,
         )
     else:
         logger.info(
-            f"[DB_SAVE] Process ID: {process_id} - Saved adjusted solar data: "
-            f"Plant: {data.plant_id}, Time: {data.timestamp}, Value: {value_to_save} kW "
-            f"(Original: {result.original_value} kW, Reason: {result.reason})"
+            "[DB_SAVE] Process ID: %s - Saved adjusted solar data: "
+            "Plant: %s, Time: %s, Value: %s kW (Original: %s kW, Reason: %s)",
+            process_id,
+            data.plant_id,
+            data.timestamp,
+            value_to_save,
+            result.original_value,
+            result.reason,
+            extra=SAMPLED,
         )
 
 
+def log_db_batch(
+    process_id: str,
+    readings: List[SolarProductionData],
+    results: List[ValueValidationResult],
+):
+    """Log a batch as if saving it to a database in one write."""
+    for index, (reading, result) in enumerate(zip(readings, results)):
+        log_db_operation(f"{process_id}/{index}", reading, result)
+
+    rejected = sum(1 for result in results if not result.is_valid)
+    logger.info(
+        "[DB_SAVE] Process ID: %s - Saved batch of %d readings (%d adjusted)",
+        process_id,
+        len(results),
+        rejected,
+    )
+
+
 # ----- Second Service: Time Series Validation -----
 time_series_validator = restate.VirtualObject("TimeSeriesValidator")
 
+# Number of recent values kept per metric
+HISTORY_CAPACITY = 100
+
+# Largest accepted change from the previous value in the threshold mode
+MAX_JUMP = 100.0
+
+DEFAULT_RULE = ValidationRule(max_jump=MAX_JUMP)
+
+# Per-metric rules, e.g. VALIDATION_RULES='{"power": {"mode": "statistical"}}'
+VALIDATION_RULES = load_validation_rules(os.getenv("VALIDATION_RULES"), DEFAULT_RULE)
+
+
+def rule_for(metric_name: str) -> ValidationRule:
+    """Validation rule configured for a metric, the threshold rule by default."""
+    return VALIDATION_RULES.get(metric_name, DEFAULT_RULE)
+
 
 class TimeSeriesData(BaseModel):
     timestamp: str
     metric_name: str
     value: float
 
+    @field_validator("timestamp")
+    @classmethod
+    def check_timestamp(cls, timestamp: str) -> str:
+        """Reject non-ISO timestamps, the SDK fails such calls terminally"""
+        datetime.fromisoformat(timestamp)
+        return timestamp
+
+
+class HistoryStats(BaseModel):
+    """Statistics of a metric's history window as returned by getSnapshot"""
+
+    count: int = 0
+    sum: float = 0.0
+    mean: Optional[float] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+    last: Optional[float] = None
+    # Sum of squared deviations from the mean (Welford) and the sample std
+    m2: float = 0.0
+    std: Optional[float] = None
+    # Exponentially weighted mean and variance of all accepted values
+    ewma: Optional[float] = None
+    ewm_var: float = 0.0
+
+    @classmethod
+    def from_rolling(cls, stats: RollingStats, values: List[float]) -> "HistoryStats":
+        """Summarize the rolling statistics of a window holding values"""
+        if not values:
+            return cls()
+        return cls(
+            count=stats.count,
+            sum=sum(values),
+            mean=stats.mean,
+            min=min(values),
+            max=max(values),
+            last=stats.last,
+            m2=stats.m2,
+            std=stats.std if stats.count > 1 else None,
+            ewma=stats.ewma,
+            ewm_var=stats.ewm_var,
+        )
+
+
+class HistoryPoint(BaseModel):
+    # None for values migrated from state without timestamps
+    timestamp: Optional[datetime] = None
+    value: float
+
+
+class SnapshotRequest(BaseModel):
+    metric_names: List[str]
+
+
+class MetricSnapshot(BaseModel):
+    metric_name: str
+    history: List[HistoryPoint]
+    stats: HistoryStats
+
+
+class SnapshotResponse(BaseModel):
+    snapshots: List[MetricSnapshot]
+
+
+async def load_stats(
+    ctx: restate.ObjectSharedContext,
+    metric_name: str,
+    history: HistoryBuffer,
+    alpha: float,
+) -> RollingStats:
+    """Read the rolling statistics of a metric's history, rebuilding them if missing"""
+    stats = RollingStats.from_state(
+        await ctx.get(f"rolling_stats_{metric_name}", serde=BytesSerde()),
+        HISTORY_CAPACITY,
+        alpha,
+    )
+
+    # History written before rolling stats were kept gets them computed once
+    if stats is None or len(stats) != len(history):
+        stats = RollingStats.from_values(history.values(), HISTORY_CAPACITY, alpha)
+    return stats
+
 
 @time_series_validator.handler("addValue")
 async def add_value(
     ctx: restate.ObjectContext, data: TimeSeriesData
 ) -> ValueValidationResult:
     """Add a value to the time series and validate it against previous values."""
-    # Get historical values for this metric
-    history = await ctx.get(f"history_{data.metric_name}") or []
+    rule = rule_for(data.metric_name)
+
+    # Get historical values for this metric (packed ring buffer, read once)
+    state_key = f"history_{data.metric_name}"
+    stats_key = f"rolling_stats_{data.metric_name}"
+    history = HistoryBuffer.from_state(
+        await ctx.get(state_key, serde=BytesSerde()), HISTORY_CAPACITY
+    )
+
+    stats = await load_stats(ctx, data.metric_name, history, rule.ewma_alpha)
 
     # Validate the new value
-    result = validate_time_series_value(data.value, history)
+    result = validate_time_series_value(data.value, history.values(), rule, stats)
 
     # If valid, add to history
     if result.is_valid:
-        # Add the new value to history
-        history.append(data.value)
+        # Add the new value, the ring buffer keeps only the latest 100 values
+        evicted = history.append(data.timestamp, data.value)
+        stats.add(data.value, evicted)
 
-        # Keep only the latest 100 values to prevent excessive state size
-        if len(history) > 100:
-            history = history[-100:]
-
-        # Save updated history
-        ctx.set(f"history_{data.metric_name}", history)
+        # Save updated history and its statistics for snapshot reads
+        ctx.set(state_key, history.to_state(), serde=BytesSerde())
+        ctx.set(stats_key, stats.to_state(), serde=BytesSerde())
 
         logger.info(
-            f"Added valid value {data.value} for metric {data.metric_name} at {data.timestamp}. "
-            f"History now contains {len(history)} values."
+            "Added valid value %s for metric %s at %s. History now contains %d values.",
+            data.value,
+            data.metric_name,
+            data.timestamp,
+            len(history),
+            extra=SAMPLED,
         )
     else:
         logger.warning(
-            f"Rejected implausible value {data.value} for metric {data.metric_name} at {data.timestamp}. "
-            f"Reason: {result.reason}"
+            "Rejected implausible value %s for metric %s at %s. Reason: %s",
+            data.value,
+            data.metric_name,
+            data.timestamp,
+            result.reason,
         )
 
     return result
 
 
-# @time_series_validator.handler("getHistory", kind="shared")
-# async def get_history(
-#     ctx: restate.ObjectSharedContext, metric_name: str
-# ) -> List[float]:
-#     """Get the historical values for a metric."""
-#     history = await ctx.get(f"history_{metric_name}") or []
-#     print(history)
-#     return history
+@time_series_validator.handler("getSnapshot", kind="shared")
+async def get_snapshot(
+    ctx: restate.ObjectSharedContext, request: SnapshotRequest
+) -> SnapshotResponse:
+    """Get the history and statistics of several metrics without blocking addValue."""
+    snapshots = []
+    for metric_name in request.metric_names:
+        history = HistoryBuffer.from_state(
+            await ctx.get(f"history_{metric_name}", serde=BytesSerde()),
+            HISTORY_CAPACITY,
+        )
+        # Read-only, so history without stats is summarized on the fly
+        stats = await load_stats(
+            ctx, metric_name, history, rule_for(metric_name).ewma_alpha
+        )
+
+        snapshots.append(
+            MetricSnapshot(
+                metric_name=metric_name,
+                history=history.to_points(),
+                stats=HistoryStats.from_rolling(stats, history.values()),
+            )
+        )
+
+    return SnapshotResponse(snapshots=snapshots)
 
 
 def validate_time_series_value(
-    value: float, history: List[float]
+    value: float,
+    history: List[float],
+    rule: Optional[ValidationRule] = None,
+    stats: Optional[RollingStats] = None,
 ) -> ValueValidationResult:
     """Validate a time series value against its history."""
+    rule = rule or DEFAULT_RULE
+
     # If no history, accept the value
     if not history:
         return ValueValidationResult(is_valid=True, original_value=value)
 
+    # Statistical mode once the window has warmed up, O(1) per value
+    if (
+        rule.mode == "statistical"
+        and stats is not None
+        and stats.count >= rule.min_samples
+    ):
+        zscore = stats.zscore(value, rule.min_std)
+        if abs(zscore) > rule.max_zscore:
+            return ValueValidationResult(
+                is_valid=False,
+                reason=f"Z-score {zscore:.2f} outside +/-{rule.max_zscore} (window mean {stats.mean:.2f}, std {stats.std:.2f})",
+                original_value=value,
+            )
+
+        ewma_zscore = stats.ewma_zscore(value, rule.min_std)
+        if abs(ewma_zscore) > rule.max_ewma_zscore:
+            return ValueValidationResult(
+                is_valid=False,
+                reason=f"Rate of change {value - stats.ewma:.2f} from EWMA {stats.ewma:.2f} outside +/-{rule.max_ewma_zscore} std",
+                original_value=value,
+            )
+
+        return ValueValidationResult(is_valid=True, original_value=value)
+
     # Get the most recent value
     last_value = history[-1]
 
-    # Check for implausible jumps (more than 100)
-    if abs(value - last_value) > 100:
+    # Check for implausible jumps (more than max_jump, 100 by default)
+    if abs(value - last_value) > rule.max_jump:
         return ValueValidationResult(
             is_valid=False,
             reason=f"Value jump too large: {abs(value - last_value)} from previous value {last_value}",
@@ -0,0 +1,140 @@
+# Mirrored in interview_py/src and internal_py/src, which are built from
+# separate contexts. Keep both copies identical.
+from typing import Iterable, Optional
+import math
+import struct
+
+# Version byte at the start of every encoded state
+FORMAT_VERSION = 1
+
+# version, window, count, mean, m2, ewma, ewm_var, last
+_STATE = struct.Struct("<BIIddddd")
+
+
+def _scaled(deviation: float, std: float) -> float:
+    if std > 0:
+        return deviation / std
+    return math.copysign(math.inf, deviation) if deviation else 0.0
+
+
+class RollingStats:
+    """
+    Mean/variance over a sliding window plus an EWMA, updated in O(1) per value
+
+    The window statistics use Welford's update, extended to remove the value
+    that drops out of the window. They are meant to mirror a HistoryBuffer of
+    the same capacity: pass the value its append() overwrote as evicted.
+    The EWMA tracks an exponentially weighted mean and variance of all values.
+    """
+
+    def __init__(self, window: int = 100, alpha: float = 0.1):
+        self.window = window
+        self.alpha = alpha
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared deviations from the window mean
+        self.ewma = 0.0
+        self.ewm_var = 0.0
+        self.last: Optional[float] = None
+
+    @classmethod
+    def from_values(
+        cls, values: Iterable[float], window: int = 100, alpha: float = 0.1
+    ) -> "RollingStats":
+        """Build statistics for a history window (oldest value first)"""
+        stats = cls(window, alpha)
+        kept = []
+        for value in values:
+            evicted = kept[len(kept) - window] if len(kept) >= window else None
+            kept.append(value)
+            stats.add(value, evicted)
+        return stats
+
+    @classmethod
+    def from_state(
+        cls, state: Optional[bytes], window: int = 100, alpha: float = 0.1
+    ) -> Optional["RollingStats"]:
+        """Decode object state, None if there is none or it has another window"""
+        if not state:
+            return None
+
+        version, stored_window, count, mean, m2, ewma, ewm_var, last = (
+            _STATE.unpack_from(state)
+        )
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported rolling stats state version {version}")
+        if stored_window != window:
+            return None
+
+        stats = cls(window, alpha)
+        stats.count, stats.mean, stats.m2 = count, mean, m2
+        stats.ewma, stats.ewm_var = ewma, ewm_var
+        stats.last = last if count else None
+        return stats
+
+    def to_state(self) -> bytes:
+        """Encode the statistics for object state"""
+        return _STATE.pack(
+            FORMAT_VERSION,
+            self.window,
+            self.count,
+            self.mean,
+            self.m2,
+            self.ewma,
+            self.ewm_var,
+            0.0 if self.last is None else self.last,
+        )
+
+    def copy(self) -> "RollingStats":
+        stats = RollingStats(self.window, self.alpha)
+        stats.count, stats.mean, stats.m2 = self.count, self.mean, self.m2
+        stats.ewma, stats.ewm_var, stats.last = self.ewma, self.ewm_var, self.last
+        return stats
+
+    def add(self, value: float, evicted: Optional[float] = None) -> None:
+        """Add a value, removing evicted from the window if it dropped out"""
+        if self.count == 0:
+            self.ewma = value
+            self.ewm_var = 0.0
+        else:
+            delta = value - self.ewma
+            increment = self.alpha * delta
+            self.ewma += increment
+            self.ewm_var = (1 - self.alpha) * (self.ewm_var + delta * increment)
+
+        previous_mean = self.mean
+        if evicted is None:
+            self.count += 1
+            self.mean += (value - previous_mean) / self.count
+            self.m2 += (value - previous_mean) * (value - self.mean)
+        else:
+            self.mean += (value - evicted) / self.count
+            self.m2 += (value - evicted) * (value - self.mean + evicted - previous_mean)
+            # Rounding can leave a tiny negative sum for a constant window
+            self.m2 = max(self.m2, 0.0)
+
+        self.last = value
+
+    @property
+    def variance(self) -> float:
+        """Sample variance of the window"""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    @property
+    def ewm_std(self) -> float:
+        return math.sqrt(self.ewm_var)
+
+    def zscore(self, value: float, min_std: float = 0.0) -> float:
+        """Deviation of value from the window mean in standard deviations"""
+        return _scaled(value - self.mean, max(self.std, min_std))
+
+    def ewma_zscore(self, value: float, min_std: float = 0.0) -> float:
+        """Deviation of value from the EWMA in EW standard deviations"""
+        return _scaled(value - self.ewma, max(self.ewm_std, min_std))
+
+    def __len__(self) -> int:
+        return self.count
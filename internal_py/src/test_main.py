@@ -0,0 +1,222 @@
+import asyncio
+import inspect
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from restate.serde import DefaultSerde
+
+import main
+from history_buffer import HistoryBuffer
+from rolling_stats import RollingStats
+
+
+class FakeContext:
+    """In-memory Restate context that serializes results and state like the SDK"""
+
+    def __init__(self):
+        self.state = {}
+        self.journal = []
+
+    async def run(self, name, action, serde=None, type_hint=None, **kwargs):
+        if serde is None:
+            if type_hint is None:
+                type_hint = inspect.signature(action, eval_str=True).return_annotation
+            serde = DefaultSerde(type_hint)
+        result = action()
+        if inspect.isawaitable(result):
+            result = await result
+        self.journal.append(name)
+        # Callers see what a replay would read back from the journal
+        return serde.deserialize(serde.serialize(result))
+
+    async def get(self, name, serde=None, type_hint=None):
+        if name not in self.state:
+            return None
+        return (serde or DefaultSerde(type_hint)).deserialize(self.state[name])
+
+    def set(self, name, value, serde=None):
+        self.state[name] = (serde or DefaultSerde(type(value))).serialize(value)
+
+
+def solar_readings():
+    start = datetime(2025, 1, 1, 12, 0)
+    values = [-100.0, 0.0, 2500.5, 5000.0, 5000.1, 5200.0, 42.0]
+    return [
+        main.SolarProductionData(
+            timestamp=(start + timedelta(minutes=i)).isoformat(),
+            plant_id=f"plant-{i % 3}",
+            value=value,
+        )
+        for i, value in enumerate(values)
+    ]
+
+
+class TestSolarBatch:
+    def test_batch_matches_per_reading_results(self):
+        readings = solar_readings()
+
+        expected = [
+            asyncio.run(main.process_solar_data(FakeContext(), reading))
+            for reading in readings
+        ]
+        ctx = FakeContext()
+        result = asyncio.run(
+            main.process_solar_batch(ctx, main.SolarProductionBatch(readings=readings))
+        )
+
+        assert result.results == expected
+        assert [item.is_valid for item in result.results] == [
+            False,
+            True,
+            True,
+            True,
+            False,
+            False,
+            True,
+        ]
+        assert result.results[0].adjusted_value == main.MIN_VALID_VALUE
+        assert result.results[5].adjusted_value == main.MAX_VALID_VALUE
+        # One ID and one journaled write for the whole batch
+        assert ctx.journal == ["process_id", "log_results"]
+
+    def test_validate_batch_matches_validate_single(self):
+        readings = solar_readings()
+
+        assert main.validate_solar_batch(readings, 0.0, 5000.0) == [
+            main.validate_solar_data(reading, 0.0, 5000.0) for reading in readings
+        ]
+
+
+def add_values(ctx, metric_name, values, start=datetime(2025, 1, 1, 12, 0)):
+    return [
+        asyncio.run(
+            main.add_value(
+                ctx,
+                main.TimeSeriesData(
+                    timestamp=(start + timedelta(minutes=i)).isoformat(),
+                    metric_name=metric_name,
+                    value=value,
+                ),
+            )
+        )
+        for i, value in enumerate(values)
+    ]
+
+
+class TestSnapshot:
+    def test_snapshot_returns_stored_history_and_stats(self):
+        ctx = FakeContext()
+        add_values(ctx, "power", [10.0, 20.0, 500.0, 30.0])
+        add_values(ctx, "voltage", [230.0])
+
+        snapshot = asyncio.run(
+            main.get_snapshot(
+                ctx, main.SnapshotRequest(metric_names=["power", "voltage", "none"])
+            )
+        )
+
+        power, voltage, empty = snapshot.snapshots
+        stored = RollingStats.from_state(
+            ctx.state["rolling_stats_power"], main.HISTORY_CAPACITY
+        )
+        assert (power.stats.mean, power.stats.m2, power.stats.ewma) == (
+            stored.mean,
+            stored.m2,
+            stored.ewma,
+        )
+        assert (power.stats.count, power.stats.sum, power.stats.last) == (
+            3,
+            60.0,
+            30.0,
+        )
+        assert (power.stats.min, power.stats.max, power.stats.std) == (
+            10.0,
+            30.0,
+            10.0,
+        )
+        assert [point.value for point in power.history] == [10.0, 20.0, 30.0]
+        assert power.history[-1].timestamp == datetime(2025, 1, 1, 12, 3)
+        assert voltage.stats.mean == 230.0
+        assert empty.history == [] and empty.stats == main.HistoryStats()
+
+
+class TestHistoryStats:
+    def test_incremental_stats_match_recomputed_stats(self):
+        values = np.random.default_rng(7).normal(50.0, 20.0, 260).round(2).tolist()
+        history = HistoryBuffer(main.HISTORY_CAPACITY)
+        stats = RollingStats(main.HISTORY_CAPACITY, alpha=0.2)
+
+        for index, value in enumerate(values):
+            evicted = history.append(datetime(2025, 1, 1), value)
+            stats.add(value, evicted)
+
+            expected = main.HistoryStats.from_rolling(
+                RollingStats.from_values(
+                    history.values(), main.HISTORY_CAPACITY, alpha=0.2
+                ),
+                history.values(),
+            )
+            snapshot = main.HistoryStats.from_rolling(stats, history.values())
+            assert (snapshot.count, snapshot.min, snapshot.max, snapshot.last) == (
+                expected.count,
+                expected.min,
+                expected.max,
+                expected.last,
+            )
+            assert snapshot.mean == pytest.approx(expected.mean)
+            assert snapshot.m2 == pytest.approx(expected.m2)
+            assert snapshot.std == pytest.approx(expected.std)
+
+            # The EWMA covers every accepted value, not only the window
+            accepted = RollingStats.from_values(
+                values[: index + 1], main.HISTORY_CAPACITY, alpha=0.2
+            )
+            assert stats.ewma == pytest.approx(accepted.ewma)
+            assert stats.ewm_var == pytest.approx(accepted.ewm_var)
+
+        assert len(history) == main.HISTORY_CAPACITY
+
+    def test_stats_are_rebuilt_for_history_without_them(self):
+        ctx = FakeContext()
+        add_values(ctx, "power", [10.0, 20.0, 30.0])
+        del ctx.state["rolling_stats_power"]
+
+        add_values(ctx, "power", [40.0], start=datetime(2025, 1, 1, 13, 0))
+
+        stored = RollingStats.from_state(
+            ctx.state["rolling_stats_power"], main.HISTORY_CAPACITY
+        )
+        assert (stored.count, stored.mean, stored.last) == (4, 25.0, 40.0)
+
+
+class TestStatisticalMode:
+    def test_rejects_outliers_after_warm_up(self, monkeypatch):
+        rule = main.ValidationRule(mode="statistical", min_samples=20)
+        monkeypatch.setattr(main, "VALIDATION_RULES", {"power": rule})
+        ctx = FakeContext()
+        steady = [100.0 + (i % 5) for i in range(20)]
+
+        # While warming up, a spike within the jump limit is accepted
+        warm_up = add_values(ctx, "power", steady[:10] + [180.0])
+        assert all(result.is_valid for result in warm_up)
+
+        results = add_values(ctx, "power", steady[10:] + [180.0, 103.0])
+        assert [result.is_valid for result in results[-2:]] == [False, True]
+        assert "Z-score" in results[-2].reason
+
+    def test_threshold_mode_is_the_default(self):
+        stats = RollingStats.from_values([100.0] * 50, main.HISTORY_CAPACITY)
+
+        result = main.validate_time_series_value(180.0, [100.0] * 50, None, stats)
+
+        assert result.is_valid
+        assert not main.validate_time_series_value(250.0, [100.0], None, stats).is_valid
+
+    def test_configured_rules_default_to_the_threshold_rule(self):
+        rules = main.load_validation_rules(
+            '{"power": {"mode": "statistical"}}', main.DEFAULT_RULE
+        )
+
+        assert rules["power"].mode == "statistical"
+        assert rules["power"].max_jump == main.MAX_JUMP
@@ -0,0 +1,38 @@
+# Mirrored in interview_py/src and internal_py/src, which are built from
+# separate contexts. Keep both copies identical.
+from pydantic import BaseModel, Field
+from typing import Dict, Literal, Optional
+import json
+
+# Largest accepted change from the last accepted value, unless a project's
+# default rule sets its own
+MAX_JUMP = 200
+
+
+class ValidationRule(BaseModel):
+    """How the values of one metric are checked against their history"""
+
+    # threshold: reject jumps larger than max_jump from the last accepted value
+    # statistical: reject z-scores against the window mean/std and the EWMA
+    mode: Literal["threshold", "statistical"] = "threshold"
+    max_jump: float = MAX_JUMP
+    max_zscore: float = 4.0
+    max_ewma_zscore: float = 4.0
+    ewma_alpha: float = Field(0.1, gt=0, le=1)
+    # The threshold rule applies until the window holds this many values
+    min_samples: int = 10
+    # Floor for the standard deviations, so a flat history does not reject noise
+    min_std: float = Field(1.0, gt=0)
+
+
+def load_validation_rules(
+    config: Optional[str], default: Optional[ValidationRule] = None
+) -> Dict[str, ValidationRule]:
+    """Parse a JSON object of metric name to rule fields, unset ones from default"""
+    if not config:
+        return {}
+    base = default.model_dump() if default is not None else {}
+    return {
+        metric_name: ValidationRule.model_validate({**base, **rule})
+        for metric_name, rule in json.loads(config).items()
+    }
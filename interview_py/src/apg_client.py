@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+import httpx
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# Connection pool and timeout settings
+HTTP_CONNECT_TIMEOUT = float(os.getenv("APG_HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("APG_HTTP_READ_TIMEOUT", "20"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("APG_HTTP_MAX_CONNECTIONS", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("APG_HTTP_KEEPALIVE_EXPIRY", "60"))
+
+# Retry settings (attempts include the first request)
+HTTP_MAX_ATTEMPTS = int(os.getenv("APG_HTTP_MAX_ATTEMPTS", "4"))
+HTTP_BACKOFF_BASE = float(os.getenv("APG_HTTP_BACKOFF_BASE", "0.5"))
+HTTP_BACKOFF_MAX = float(os.getenv("APG_HTTP_BACKOFF_MAX", "8"))
+
+# Status codes worth retrying, everything else fails immediately
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class FetchResult(BaseModel):
+    content: bytes
+    status_code: int
+    latency_ms: float
+    attempts: int
+
+
+class APGClient:
+    """
+    HTTP client for the APG transparency API
+
+    Keeps one keep-alive connection pool per flavour: an async pool for
+    Restate handlers and a sync pool as a facade for scripts and callers
+    that are not async. Requests negotiate gzip/brotli, are bounded by
+    connect/read timeouts and retried with jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+        read_timeout: float = HTTP_READ_TIMEOUT,
+        max_connections: int = HTTP_MAX_CONNECTIONS,
+        keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY,
+        max_attempts: int = HTTP_MAX_ATTEMPTS,
+        backoff_base: float = HTTP_BACKOFF_BASE,
+        backoff_max: float = HTTP_BACKOFF_MAX,
+        transport: Optional[httpx.BaseTransport] = None,
+        async_transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._timeout = httpx.Timeout(
+            connect=connect_timeout,
+            read=read_timeout,
+            write=read_timeout,
+            pool=connect_timeout,
+        )
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._transport = transport
+        self._async_transport = async_transport
+        self._sync_client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._lock = threading.Lock()
+
+    def _client_options(self) -> Dict:
+        return {
+            "timeout": self._timeout,
+            "limits": self._limits,
+            "headers": {"Accept-Encoding": "gzip, br"},
+            "follow_redirects": True,
+        }
+
+    def _get_sync_client(self) -> httpx.Client:
+        with self._lock:
+            if self._sync_client is None:
+                self._sync_client = httpx.Client(
+                    transport=self._transport, **self._client_options()
+                )
+            return self._sync_client
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        # The async pool is bound to the event loop it was created on
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                transport=self._async_transport, **self._client_options()
+            )
+        return self._async_client
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given (1-based) attempt"""
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        )
+
+    def _should_retry(
+        self,
+        attempt: int,
+        response: Optional[httpx.Response],
+        error: Optional[Exception],
+    ) -> bool:
+        if attempt >= self.max_attempts:
+            return False
+        if error is not None:
+            return isinstance(error, httpx.TransportError)
+        return response.status_code in RETRYABLE_STATUS_CODES
+
+    def _result(
+        self, url: str, response: httpx.Response, started: float, attempts: int
+    ):
+        response.raise_for_status()
+        latency_ms = (time.perf_counter() - started) * 1000
+        logger.info(
+            "Fetched %s in %.1f ms (%d bytes, %d attempt(s))",
+            url,
+            latency_ms,
+            len(response.content),
+            attempts,
+        )
+        return FetchResult(
+            content=response.content,
+            status_code=response.status_code,
+            latency_ms=latency_ms,
+            attempts=attempts,
+        )
+
+    async def get(
+        self,
+        url: str,
+        params: Optional[Dict[str, str]] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> FetchResult:
+        """GET a URL with retries using the shared async connection pool"""
+        client = self._get_async_client()
+        started = time.perf_counter()
+        attempt = 0
+
+        while True:
+            attempt += 1
+            response, error = None, None
+            try:
+                response = await client.get(url, params=params, headers=headers)
+            except httpx.HTTPError as e:
+                error = e
+
+            if not self._should_retry(attempt, response, error):
+                if error is not None:
+                    raise error
+                return self._result(url, response, started, attempt)
+
+            delay = self._backoff_delay(attempt)
+            logger.warning(
+                "Retrying %s in %.2f s after attempt %d: %s",
+                url,
+                delay,
+                attempt,
+                error or response.status_code,
+            )
+            await asyncio.sleep(delay)
+
+    def get_sync(
+        self,
+        url: str,
+        params: Optional[Dict[str, str]] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> FetchResult:
+        """GET a URL with retries using the shared sync connection pool"""
+        client = self._get_sync_client()
+        started = time.perf_counter()
+        attempt = 0
+
+        while True:
+            attempt += 1
+            response, error = None, None
+            try:
+                response = client.get(url, params=params, headers=headers)
+            except httpx.HTTPError as e:
+                error = e
+
+            if not self._should_retry(attempt, response, error):
+                if error is not None:
+                    raise error
+                return self._result(url, response, started, attempt)
+
+            delay = self._backoff_delay(attempt)
+            logger.warning(
+                "Retrying %s in %.2f s after attempt %d: %s",
+                url,
+                delay,
+                attempt,
+                error or response.status_code,
+            )
+            time.sleep(delay)
+
+    def close(self) -> None:
+        """Close the sync connection pool"""
+        with self._lock:
+            if self._sync_client is not None:
+                self._sync_client.close()
+                self._sync_client = None
+
+    async def aclose(self) -> None:
+        """Close both connection pools"""
+        self.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+
+_client: Optional[APGClient] = None
+
+
+def get_client() -> APGClient:
+    """Return the process-wide APG client"""
+    global _client
+    if _client is None:
+        _client = APGClient()
+    return _client
@@ -1,21 +1,123 @@
-import requests
 from datetime import datetime, timedelta
-from models import ImbalanceResponse, ValueRow
-from typing import List, Dict, Any, Optional
+from models import ImbalanceResponse, ValueRow, parse_apg_date, parse_apg_minutes
+from typing import List, Dict, Any, Optional, Tuple
+import json
+import os
+import re
+import orjson
+import metrics
+import response_cache
+from lazy_imports import lazy_import
 
-# Constants
-APG_API_BASE_URL = "https://transparency.apg.at/api/v1/DRZ/Data/German/PT1M"
+# httpx is only loaded once data is actually fetched
+apg_client = lazy_import("apg_client")
+
+# Constants, the base URL can point at a stand-in (see benchmarks.apg_standin)
+APG_API_BASE_URL = os.getenv(
+    "APG_API_BASE_URL", "https://transparency.apg.at/api/v1/DRZ/Data/German/PT1M"
+)
+
+APG_REQUEST_HEADERS = {
+    "Accept": "application/json, text/plain, */*",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Cache-Control": "no-cache",
+    "Pragma": "no-cache",
+    "Referer": "https://transparency.apg.at/deltaregelzone/chart?p_drzMode=Operational&resolution=PT1M&language=German&embed=true",
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36",
+}
+
+APG_REQUEST_PARAMS = {"p_drzMode": "CurrentBalancingState", "resolution": "PT1M"}
+
+# Decode responses through the full pydantic models instead of the fast path
+APG_STRICT_DECODE = os.getenv("APG_STRICT_DECODE", "false").lower() == "true"
+
+# Metric of the first value column, the series the ETL has always stored
+APG_PRIMARY_METRIC_NAME = "apg_imbalance"
+
+# Metric names by value column InternalName (JSON object). Other columns are
+# stored as apg_<internal name>, except the first one (APG_PRIMARY_METRIC_NAME)
+APG_COLUMN_METRICS: Dict[str, str] = json.loads(os.getenv("APG_COLUMN_METRICS", "{}"))
+
+
+API_DATE_FORMAT = "%Y-%m-%dT%H%M%S"
 
 
 def format_date_for_api(dt: datetime) -> str:
     """Format datetime to APG API date format (YYYYMMDDThhmmss)"""
-    return dt.strftime("%Y-%m-%dT%H%M%S")
+    return dt.strftime(API_DATE_FORMAT)
+
+
+def parse_api_date(date: str) -> datetime:
+    """Parse an APG API date (see format_date_for_api) back to a datetime"""
+    return datetime.strptime(date, API_DATE_FORMAT)
+
+
+def build_imbalance_url(start_date: str, end_date: str) -> str:
+    """Build the APG API URL for a date range"""
+    return f"{APG_API_BASE_URL}/{start_date}/{end_date}"
+
+
+def fetch_imbalance_content(start_date: str, end_date: str) -> bytes:
+    """Fetch the raw APG API response body for a date range"""
+    result = apg_client.get_client().get_sync(
+        build_imbalance_url(start_date, end_date),
+        params=APG_REQUEST_PARAMS,
+        headers=APG_REQUEST_HEADERS,
+    )
+    return result.content
+
+
+async def fetch_imbalance_content_async(start_date: str, end_date: str) -> bytes:
+    """Fetch the raw APG API response body without blocking the event loop"""
+    result = await apg_client.get_client().get(
+        build_imbalance_url(start_date, end_date),
+        params=APG_REQUEST_PARAMS,
+        headers=APG_REQUEST_HEADERS,
+    )
+    return result.content
+
+
+def _fetch_content(start: datetime, end: datetime) -> bytes:
+    return fetch_imbalance_content(format_date_for_api(start), format_date_for_api(end))
+
+
+async def _fetch_content_async(start: datetime, end: datetime) -> bytes:
+    return await fetch_imbalance_content_async(
+        format_date_for_api(start), format_date_for_api(end)
+    )
+
+
+def _decode_response(content: Any) -> List[ImbalanceResponse]:
+    return [ImbalanceResponse.model_validate_json(bytes(content))]
+
+
+def merge_responses(
+    responses: List[ImbalanceResponse], start: datetime, end: datetime
+) -> ImbalanceResponse:
+    """Join per-bucket responses into one, keeping rows in [start, end)"""
+    rows = [
+        row
+        for response in responses
+        for row in response.ResponseData.ValueRows
+        if start <= row.timestamp < end
+    ]
+    response_data = responses[0].ResponseData.model_copy(update={"ValueRows": rows})
+    return ImbalanceResponse(ResponseData=response_data)
+
+
+def _in_range(
+    data_points: List[Dict[str, Any]], start: datetime, end: datetime
+) -> List[Dict[str, Any]]:
+    return [point for point in data_points if start <= point["timestamp"] < end]
 
 
 def fetch_imbalance_data(start_date: str, end_date: str) -> ImbalanceResponse:
     """
     Fetch imbalance data from APG transparency API
 
+    Synchronous facade over the pooled APG client. Served from the response
+    cache when APG_CACHE_DIR is set.
+
     Args:
         start_date: Start date in format "YYYY-MM-DDTHHMMSS"
         end_date: End date in format "YYYY-MM-DDTHHMMSS"
@@ -23,23 +125,84 @@ def fetch_imbalance_data(start_date: str, end_date: str) -> ImbalanceResponse:
     Returns:
         ImbalanceResponse object with parsed data
     """
-    url = f"{APG_API_BASE_URL}/{start_date}/{end_date}"
+    cache = response_cache.get_cache()
+    if cache is None:
+        content = fetch_imbalance_content(start_date, end_date)
+        return ImbalanceResponse.model_validate_json(content)
 
-    headers = {
-        "Accept": "application/json, text/plain, */*",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Cache-Control": "no-cache",
-        "Pragma": "no-cache",
-        "Referer": "https://transparency.apg.at/deltaregelzone/chart?p_drzMode=Operational&resolution=PT1M&language=German&embed=true",
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36",
-    }
+    start, end = parse_api_date(start_date), parse_api_date(end_date)
+    responses = cache.fetch(start, end, _fetch_content, _decode_response)
+    return merge_responses(responses, start, end)
 
-    params = {"p_drzMode": "CurrentBalancingState", "resolution": "PT1M"}
 
-    response = requests.get(url, headers=headers, params=params)
-    response.raise_for_status()
+async def fetch_imbalance_data_async(
+    start_date: str, end_date: str
+) -> ImbalanceResponse:
+    """
+    Fetch imbalance data from APG transparency API without blocking the event loop
+
+    Args:
+        start_date: Start date in format "YYYY-MM-DDTHHMMSS"
+        end_date: End date in format "YYYY-MM-DDTHHMMSS"
+
+    Returns:
+        ImbalanceResponse object with parsed data
+    """
+    cache = response_cache.get_cache()
+    if cache is None:
+        content = await fetch_imbalance_content_async(start_date, end_date)
+        return ImbalanceResponse.model_validate_json(content)
+
+    start, end = parse_api_date(start_date), parse_api_date(end_date)
+    responses = await cache.fetch_async(
+        start, end, _fetch_content_async, _decode_response
+    )
+    return merge_responses(responses, start, end)
+
+
+def _merge_series(
+    parts: List[Dict[str, List[Dict[str, Any]]]], start: datetime, end: datetime
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Join per-bucket series into one, keeping points in [start, end)"""
+    series = {}
+    for part in parts:
+        for metric_name, data_points in part.items():
+            series.setdefault(metric_name, []).extend(
+                _in_range(data_points, start, end)
+            )
+    return series
+
+
+async def fetch_series_async(
+    start_date: str, end_date: str
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Fetch a date range and decode every value column into its metric's series"""
+    cache = response_cache.get_cache()
+    if cache is not None:
+        # Buckets are decoded as they are read, so both count as the fetch
+        start, end = parse_api_date(start_date), parse_api_date(end_date)
+        with metrics.STAGE_DURATION.time(stage="apg_fetch"):
+            parts = await cache.fetch_async(
+                start, end, _fetch_content_async, lambda body: [decode_series(body)]
+            )
+        series = _merge_series(parts, start, end)
+    else:
+        with metrics.STAGE_DURATION.time(stage="apg_fetch"):
+            content = await fetch_imbalance_content_async(start_date, end_date)
 
-    return ImbalanceResponse.model_validate(response.json())
+        with metrics.STAGE_DURATION.time(stage="apg_decode"):
+            series = decode_series(content)
+
+    metrics.POINTS_FETCHED.inc(sum(len(points) for points in series.values()))
+    return series
+
+
+async def fetch_data_points_async(
+    start_date: str, end_date: str
+) -> List[Dict[str, Any]]:
+    """Fetch a date range and decode the first value column into data points"""
+    series = await fetch_series_async(start_date, end_date)
+    return next(iter(series.values()), [])
 
 
 def get_latest_data_window(window_minutes: int = 30) -> ImbalanceResponse:
@@ -61,21 +224,220 @@ def get_latest_data_window(window_minutes: int = 30) -> ImbalanceResponse:
     return fetch_imbalance_data(start_date, end_date)
 
 
-def transform_row_to_data_point(row: ValueRow) -> Dict[str, Any]:
-    """Transform a ValueRow to a standardized data point"""
-    # Extract the first value (APG provides a single value per row)
-    value = row.V[0].V if row.V and len(row.V) > 0 and row.V[0].V is not None else None
+def column_metric_names(internal_names: List[str]) -> List[str]:
+    """
+    Metric name of each value column, in column order
+
+    Names come from APG_COLUMN_METRICS when listed there. Otherwise the first
+    column is APG_PRIMARY_METRIC_NAME and the others apg_<internal name>.
+    """
+    # Responses without column metadata still carry the primary value
+    names = []
+    for index, internal_name in enumerate(internal_names or [""]):
+        if internal_name in APG_COLUMN_METRICS:
+            names.append(APG_COLUMN_METRICS[internal_name])
+        elif index == 0:
+            names.append(APG_PRIMARY_METRIC_NAME)
+        else:
+            slug = re.sub(r"[^0-9a-z]+", "_", internal_name.lower()).strip("_")
+            names.append(f"apg_{slug or index}")
+    return names
+
+
+def transform_row_to_data_point(row: ValueRow, column: int = 0) -> Dict[str, Any]:
+    """Transform a ValueRow to a standardized data point of one value column"""
+    value = (
+        row.V[column].V if len(row.V) > column and row.V[column].V is not None else None
+    )
 
     return {"timestamp": row.timestamp, "value": value}
 
 
-def extract_data_points(response: ImbalanceResponse) -> List[Dict[str, Any]]:
-    """Extract data points from ImbalanceResponse"""
-    data_points = []
+def extract_series(response: ImbalanceResponse) -> Dict[str, List[Dict[str, Any]]]:
+    """Extract the data points of every value column, keyed by metric name"""
+    names = column_metric_names(
+        [column.InternalName for column in response.ResponseData.ValueColumns]
+    )
+    series = {name: [] for name in names}
 
     for row in response.ResponseData.ValueRows:
-        if row.V and len(row.V) > 0 and row.V[0].V is not None:
-            data_point = transform_row_to_data_point(row)
-            data_points.append(data_point)
+        for name, item in zip(names, row.V):
+            if item.V is not None:
+                series[name].append({"timestamp": row.timestamp, "value": item.V})
+
+    return series
+
+
+def extract_data_points(response: ImbalanceResponse) -> List[Dict[str, Any]]:
+    """Extract data points of the first value column from ImbalanceResponse"""
+    return next(iter(extract_series(response).values()))
+
+
+def decode_series(
+    content: Any, strict: Optional[bool] = None
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Decode a raw APG response body into one series per value column
+
+    All columns are decoded in a single pass over the rows. The fast path
+    parses the JSON with orjson and builds timestamps from memoized dates
+    plus minute offsets, skipping the pydantic models. Strict mode validates
+    the full ImbalanceResponse first and gives identical output.
+
+    Args:
+        content: Raw response body (bytes or a memoryview of a cached bucket)
+        strict: Use the pydantic models, defaults to APG_STRICT_DECODE
+
+    Returns:
+        Lists of data points with "timestamp" and "value" keys by metric name
+    """
+    if strict is None:
+        strict = APG_STRICT_DECODE
+    if strict:
+        return extract_series(ImbalanceResponse.model_validate_json(bytes(content)))
+
+    response_data = orjson.loads(content)["ResponseData"]
+    names = column_metric_names(
+        [column["InternalName"] for column in response_data.get("ValueColumns", [])]
+    )
+    series = {name: [] for name in names}
+    columns = [series[name] for name in names]
+
+    for row in response_data["ValueRows"]:
+        timestamp = None
+        for data_points, item in zip(columns, row["V"]):
+            value = item.get("V")
+            if value is None:
+                continue
+
+            # Parsed once per row, shared by all columns
+            if timestamp is None:
+                timestamp = parse_apg_date(row["DF"]) + timedelta(
+                    minutes=parse_apg_minutes(row["TF"])
+                )
+            data_points.append({"timestamp": timestamp, "value": float(value)})
+
+    return series
+
+
+def decode_data_points(
+    content: Any, strict: Optional[bool] = None
+) -> List[Dict[str, Any]]:
+    """
+    Decode the first value column of a raw APG response body into data points
+
+    Args:
+        content: Raw response body (bytes or a memoryview of a cached bucket)
+        strict: Use the pydantic models, defaults to APG_STRICT_DECODE
+
+    Returns:
+        List of data points with "timestamp" and "value" keys
+    """
+    return next(iter(decode_series(content, strict).values()))
+
+
+def timestamp_key(timestamp: Any) -> str:
+    """Normalize a data point timestamp (datetime or ISO string) to an ISO string"""
+    if isinstance(timestamp, datetime):
+        return timestamp.isoformat()
+    return datetime.fromisoformat(timestamp).isoformat()
+
+
+def compute_fetch_window(
+    end_time: datetime,
+    watermark: Optional[str],
+    overlap_minutes: int,
+    initial_window_minutes: int = 30,
+    max_catchup_minutes: int = 1440,
+) -> Tuple[datetime, datetime]:
+    """
+    Compute the range to request after the last stored timestamp
+
+    Args:
+        end_time: End of the range (usually now)
+        watermark: ISO timestamp of the last successfully stored point, if any
+        overlap_minutes: Minutes before the watermark to re-request for late corrections
+        initial_window_minutes: Window to fetch when there is no watermark yet
+        max_catchup_minutes: Upper bound on how far back a single tick reaches
+
+    Returns:
+        Tuple of (start_time, end_time)
+    """
+    if watermark is None:
+        return end_time - timedelta(minutes=initial_window_minutes), end_time
+
+    start_time = datetime.fromisoformat(watermark) - timedelta(minutes=overlap_minutes)
+    earliest = end_time - timedelta(minutes=max_catchup_minutes)
+    return max(start_time, earliest), end_time
+
+
+def skip_unchanged_points(
+    data_points: List[Dict[str, Any]],
+    watermark: Optional[str],
+    known_values: Dict[str, float],
+) -> List[Dict[str, Any]]:
+    """
+    Drop points at or before the watermark whose stored value is unchanged
+
+    Args:
+        data_points: Extracted data points
+        watermark: ISO timestamp of the last processed point, if any
+        known_values: Stored and rejected values keyed by ISO timestamp
+
+    Returns:
+        Data points that are new or carry a corrected value
+    """
+    if watermark is None:
+        return data_points
+
+    watermark_time = datetime.fromisoformat(watermark)
+    changed_points = []
+
+    for data_point in data_points:
+        key = timestamp_key(data_point["timestamp"])
+        if (
+            datetime.fromisoformat(key) <= watermark_time
+            and known_values.get(key) == data_point["value"]
+        ):
+            continue
+        changed_points.append(data_point)
+
+    return changed_points
+
+
+def advance_watermark(
+    watermark: Optional[str], data_points: List[Dict[str, Any]]
+) -> Optional[str]:
+    """Return the later of the watermark and the newest processed data point"""
+    keys = [timestamp_key(data_point["timestamp"]) for data_point in data_points]
+    if watermark is not None:
+        keys.append(watermark)
+    if not keys:
+        return None
+    return max(keys, key=datetime.fromisoformat)
+
+
+def has_watermark_gap(
+    watermark: Optional[str], data_points: List[Dict[str, Any]], gap_minutes: int
+) -> bool:
+    """
+    Check whether incoming data leaves a gap after the watermark
+
+    Args:
+        watermark: ISO timestamp of the last processed point, if any
+        data_points: Incoming data points
+        gap_minutes: Largest distance after the watermark that is not a gap
+
+    Returns:
+        True if there is no watermark or the earliest point is beyond the gap
+    """
+    if watermark is None:
+        return True
+    if not data_points:
+        return False
 
-    return data_points
+    earliest = min(
+        datetime.fromisoformat(timestamp_key(data_point["timestamp"]))
+        for data_point in data_points
+    )
+    return earliest - datetime.fromisoformat(watermark) > timedelta(minutes=gap_minutes)
@@ -0,0 +1,270 @@
+"""
+Async variant of db_service for use inside Restate handlers
+
+Queries run on an asyncpg connection pool, so awaiting them inside a handler
+yields to the event loop instead of blocking it. Statements are built by
+db_statements as in db_service, and the metric/scope ID caches are shared.
+The sync functions in db_service remain for scripts, the backfill and tests.
+"""
+
+from sqlalchemy import Table
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from db_models import Metric, Scope, Actual
+from models import BatchWriteResult
+from datetime import datetime
+from uuid import UUID
+from typing import Optional, List, Dict, Any, Iterable
+import logging
+import os
+
+import db_service
+import db_statements
+from db_service import (
+    DB_USER,
+    DB_PASSWORD,
+    DB_HOST,
+    DB_PORT,
+    DB_NAME,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_RECYCLE_SECONDS,
+    DB_STATEMENT_TIMEOUT_MS,
+    QUERY_PAGE_SIZE,
+    UPSERT_CHUNK_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+ASYNC_DATABASE_URL = (
+    f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+)
+
+# Prepared statements kept per connection by asyncpg, keyed by SQL text
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(
+    os.getenv("DB_PREPARED_STATEMENT_CACHE_SIZE", "100")
+)
+
+# Created on first use (connections are opened lazily on the running loop)
+async_engine: Optional[AsyncEngine] = None
+
+
+def get_async_engine() -> AsyncEngine:
+    """Return the process-wide async engine, creating it on first use"""
+    global async_engine
+    if async_engine is None:
+        async_engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_recycle=DB_POOL_RECYCLE_SECONDS,
+            pool_pre_ping=True,
+            connect_args={
+                "prepared_statement_cache_size": DB_PREPARED_STATEMENT_CACHE_SIZE,
+                "server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)},
+            },
+        )
+    return async_engine
+
+
+async def get_metric_id(name: str, description: Optional[str] = None) -> UUID:
+    """Resolve a metric name to its ID, creating the metric if needed"""
+    metric_id = db_service.metric_id_cache.get(name)
+    if metric_id is None:
+        metric_id = await _get_or_create_id(
+            Metric.__table__, "metric_id", name, description
+        )
+        db_service.metric_id_cache.put(name, metric_id)
+    return metric_id
+
+
+async def get_scope_id(name: str, description: Optional[str] = None) -> UUID:
+    """Resolve a scope name to its ID, creating the scope if needed"""
+    scope_id = db_service.scope_id_cache.get(name)
+    if scope_id is None:
+        scope_id = await _get_or_create_id(
+            Scope.__table__, "scope_id", name, description
+        )
+        db_service.scope_id_cache.put(name, scope_id)
+    return scope_id
+
+
+async def _get_or_create_id(
+    table: Table, id_column: str, name: str, description: Optional[str]
+) -> UUID:
+    """Insert a named row unless it exists and return its ID, safe under races"""
+    async with AsyncSession(get_async_engine()) as session:
+        dialect = session.get_bind().dialect.name
+        row_id = (
+            await session.execute(
+                db_statements.insert_named_statement(
+                    dialect, table, id_column, name, description
+                )
+            )
+        ).scalar_one_or_none()
+
+        # Another writer created it first, read the winning row
+        if row_id is None:
+            row_id = (
+                await session.execute(
+                    db_statements.select_id_statement(table, id_column, name)
+                )
+            ).scalar_one()
+
+        await session.commit()
+        return row_id
+
+
+async def save_actual_batch(
+    points: Iterable[Dict[str, Any]], metric_id: UUID, scope_id: UUID
+) -> Optional[BatchWriteResult]:
+    """
+    Upsert a window of data points for one metric and scope
+
+    Same semantics as db_service.save_actual_batch. On PostgreSQL the whole
+    batch is sent as arrays to a single prepared unnest upsert, which asyncpg
+    prepares once per connection.
+
+    Args:
+        points: Data points with "timestamp" and "value" keys
+        metric_id: Metric the points belong to
+        scope_id: Scope the points belong to
+
+    Returns:
+        BatchWriteResult with inserted/updated/unchanged counts, or None on error
+    """
+    return await save_series_batch({(metric_id, scope_id): points})
+
+
+async def save_series_batch(
+    series: Dict[tuple[UUID, UUID], Iterable[Dict[str, Any]]],
+) -> Optional[BatchWriteResult]:
+    """
+    Upsert windows of several series in one transaction
+
+    Same semantics as db_service.save_series_batch. On PostgreSQL all series
+    go into the same unnest upsert.
+
+    Args:
+        series: Data points with "timestamp" and "value" keys by (metric_id, scope_id)
+
+    Returns:
+        BatchWriteResult with counts over all series, or None on error
+    """
+    rows_by_series = db_statements.to_series_rows(series)
+    rows = [row for series_rows in rows_by_series for row in series_rows]
+    if not rows:
+        return BatchWriteResult()
+
+    try:
+        async with AsyncSession(get_async_engine()) as session:
+            dialect = session.get_bind().dialect.name
+
+            if dialect == "postgresql":
+                inserted, updated = (
+                    await session.execute(
+                        db_statements.UNNEST_UPSERT,
+                        db_statements.unnest_parameters(rows),
+                    )
+                ).one()
+                result = BatchWriteResult(inserted=inserted, updated=updated)
+            else:
+                result = BatchWriteResult()
+                for series_rows in rows_by_series:
+                    for start in range(0, len(series_rows), UPSERT_CHUNK_SIZE):
+                        chunk = series_rows[start : start + UPSERT_CHUNK_SIZE]
+                        inserted, updated = await _upsert_chunk(session, dialect, chunk)
+                        result.inserted += inserted
+                        result.updated += updated
+
+            # Recompute only the rollup buckets holding the written points
+            if result.written:
+                for series_rows in rows_by_series:
+                    for statement in db_statements.rollup_refresh_statements(
+                        dialect, series_rows
+                    ):
+                        await session.execute(statement)
+
+            await session.commit()
+
+        result.unchanged = len(rows) - result.written
+        return result
+    except Exception:
+        logger.exception("Error saving batch")
+        return None
+
+
+async def _upsert_chunk(
+    session: AsyncSession, dialect: str, rows: List[Dict[str, Any]]
+) -> tuple[int, int]:
+    """Upsert rows without xmax and return (inserted, updated)"""
+    existing = (
+        await session.execute(db_statements.existing_count_statement(rows))
+    ).scalar_one()
+    statement = db_statements.upsert_statement(dialect, rows)
+    written = len(
+        (await session.execute(statement.returning(Actual.__table__.c.time))).all()
+    )
+    inserted = len(rows) - existing
+    return inserted, written - inserted
+
+
+async def save_actual_data(
+    time: datetime, data: float, metric_id: UUID, scope_id: UUID
+) -> bool:
+    """Save actual data to database, update if already exists"""
+    result = await save_actual_batch(
+        [{"timestamp": time, "value": data}], metric_id, scope_id
+    )
+    return result is not None
+
+
+async def get_recent_data(
+    metric_id: UUID, scope_id: UUID, limit: int = 5
+) -> List[Actual]:
+    """Get recent data points for a metric and scope"""
+    async with AsyncSession(get_async_engine()) as session:
+        # Bounded by time first, so only recent partitions are scanned
+        result = await session.execute(
+            db_statements.recent_data_statement(
+                metric_id, scope_id, limit, db_statements.recent_data_since()
+            )
+        )
+        recent = result.scalars().all()
+        if len(recent) < limit:
+            result = await session.execute(
+                db_statements.recent_data_statement(metric_id, scope_id, limit)
+            )
+            recent = result.scalars().all()
+        return recent
+
+
+async def query_series(
+    metric_id: UUID,
+    scope_id: UUID,
+    start: Any,
+    end: Any,
+    resolution: str = "raw",
+    limit: int = QUERY_PAGE_SIZE,
+    cursor: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Read one page of a series, see db_service.query_series"""
+    start, end, limit = db_statements.series_query_window(
+        start, end, resolution, limit, cursor
+    )
+
+    async with AsyncSession(get_async_engine()) as session:
+        dialect = session.get_bind().dialect.name
+        result = await session.execute(
+            db_statements.series_query_statement(
+                dialect, metric_id, scope_id, start, end, resolution, limit
+            )
+        )
+        rows = result.all()
+
+    return db_statements.series_page(rows, resolution, limit)
+
+
+async def dispose() -> None:
+    """Close all pooled connections"""
+    if async_engine is not None:
+        await async_engine.dispose()
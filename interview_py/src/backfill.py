@@ -0,0 +1,243 @@
+"""
+Historical backfill of APG imbalance data
+
+Splits a date range into API-sized chunks, fetches them with bounded
+concurrency and streams each chunk into the bulk write path. Rows pass the
+same missing-value, range and jump checks as live data first, within their
+chunk. Every value column of a chunk is stored as its own metric in a
+single write.
+Completed chunks are checkpointed so an interrupted run can be resumed.
+
+Usage:
+    python backfill.py 2024-01-01T00:00:00 2025-01-01T00:00:00
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+import apg_data_service
+import data_validator
+import db_service
+from log_config import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Backfill settings
+BACKFILL_CHUNK_MINUTES = int(os.getenv("APG_BACKFILL_CHUNK_MINUTES", "1440"))
+BACKFILL_CONCURRENCY = int(os.getenv("APG_BACKFILL_CONCURRENCY", "4"))
+BACKFILL_CHECKPOINT_PATH = os.getenv(
+    "APG_BACKFILL_CHECKPOINT", "apg_backfill_checkpoint.json"
+)
+
+
+class BackfillReport(BaseModel):
+    chunks_total: int = 0
+    chunks_skipped: int = 0
+    chunks_failed: int = 0
+    rows_fetched: int = 0
+    rows_rejected: int = 0
+    rows_written: int = 0
+    elapsed_seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        if self.elapsed_seconds <= 0:
+            return 0.0
+        return self.rows_fetched / self.elapsed_seconds
+
+
+class BackfillCheckpoint:
+    """Set of completed chunk start times persisted as JSON"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.completed: Set[str] = set()
+
+        if os.path.exists(path):
+            with open(path) as f:
+                self.completed = set(json.load(f).get("completed", []))
+
+    def is_done(self, chunk_start: datetime) -> bool:
+        return chunk_start.isoformat() in self.completed
+
+    def mark_done(self, chunk_start: datetime) -> None:
+        """Record a chunk and atomically rewrite the checkpoint file"""
+        self.completed.add(chunk_start.isoformat())
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"completed": sorted(self.completed)}, f)
+        os.replace(tmp_path, self.path)
+
+
+def split_range(
+    start: datetime, end: datetime, chunk_minutes: int = BACKFILL_CHUNK_MINUTES
+) -> List[Tuple[datetime, datetime]]:
+    """Split [start, end) into consecutive chunks of at most chunk_minutes"""
+    chunks = []
+    chunk_start = start
+
+    while chunk_start < end:
+        chunk_end = min(chunk_start + timedelta(minutes=chunk_minutes), end)
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = chunk_end
+
+    return chunks
+
+
+def validate_series(
+    series: Dict[str, List[Dict[str, Any]]],
+) -> Tuple[Dict[str, List[Dict[str, Any]]], int]:
+    """
+    Keep the points of each series that pass the live validation rules
+
+    Returns:
+        Tuple of (accepted points by metric name, number of rejected points)
+    """
+    accepted = {}
+    rejected = 0
+    for metric_name, data_points in series.items():
+        window = data_validator.validate_imbalance_window(
+            [data_point["timestamp"] for data_point in data_points],
+            [data_point["value"] for data_point in data_points],
+            max_jump=data_validator.rule_for(metric_name).max_jump,
+        )
+        accepted[metric_name] = [
+            data_point
+            for data_point, is_valid in zip(data_points, window.is_valid)
+            if is_valid
+        ]
+        rejected += len(data_points) - len(accepted[metric_name])
+    return accepted, rejected
+
+
+async def run_backfill(
+    start: datetime,
+    end: datetime,
+    scope_name: str = "austria",
+    chunk_minutes: int = BACKFILL_CHUNK_MINUTES,
+    concurrency: int = BACKFILL_CONCURRENCY,
+    checkpoint_path: Optional[str] = BACKFILL_CHECKPOINT_PATH,
+) -> BackfillReport:
+    """
+    Load APG imbalance history for a date range
+
+    Args:
+        start: Start of the range (inclusive)
+        end: End of the range (exclusive)
+        scope_name: Scope the rows of all value columns are stored under
+        chunk_minutes: Minutes of data requested per API call
+        concurrency: Maximum number of chunks in flight
+        checkpoint_path: JSON file with completed chunks, None disables resuming
+
+    Returns:
+        BackfillReport with row counts and throughput
+    """
+    started = time.perf_counter()
+    checkpoint = BackfillCheckpoint(checkpoint_path) if checkpoint_path else None
+
+    scope_id = await asyncio.to_thread(db_service.get_scope_id, scope_name)
+
+    # Past months get their partitions before the writes, not the default one
+    await asyncio.to_thread(db_service.ensure_partitions, start, end)
+
+    def write_series(series):
+        accepted, rejected = validate_series(series)
+
+        # Metric IDs are cached after the first chunk
+        return rejected, db_service.save_series_batch(
+            {
+                (db_service.get_metric_id(metric_name), scope_id): data_points
+                for metric_name, data_points in accepted.items()
+            }
+        )
+
+    chunks = split_range(start, end, chunk_minutes)
+    report = BackfillReport(chunks_total=len(chunks))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def load_chunk(chunk_start: datetime, chunk_end: datetime):
+        if checkpoint and checkpoint.is_done(chunk_start):
+            report.chunks_skipped += 1
+            return
+
+        async with semaphore:
+            try:
+                series = await apg_data_service.fetch_series_async(
+                    apg_data_service.format_date_for_api(chunk_start),
+                    apg_data_service.format_date_for_api(chunk_end),
+                )
+
+                # Validation and writes run in a worker thread so fetches keep flowing
+                rejected, write_result = await asyncio.to_thread(write_series, series)
+                if write_result is None:
+                    raise RuntimeError("database write failed")
+            except Exception as e:
+                report.chunks_failed += 1
+                logger.error(
+                    "Backfill chunk %s - %s failed: %s", chunk_start, chunk_end, e
+                )
+                return
+
+        rows = sum(len(data_points) for data_points in series.values())
+        report.rows_fetched += rows
+        report.rows_rejected += rejected
+        report.rows_written += write_result.written
+        if checkpoint:
+            checkpoint.mark_done(chunk_start)
+
+        elapsed = time.perf_counter() - started
+        logger.info(
+            "Backfilled %s - %s: %d rows, %d rejected (%.0f rows/s overall)",
+            chunk_start,
+            chunk_end,
+            rows,
+            rejected,
+            report.rows_fetched / elapsed,
+        )
+
+    await asyncio.gather(*(load_chunk(*chunk) for chunk in chunks))
+
+    report.elapsed_seconds = time.perf_counter() - started
+    return report
+
+
+if __name__ == "__main__":
+    configure_logging()
+
+    parser = argparse.ArgumentParser(description="Backfill APG imbalance history")
+    parser.add_argument("start", type=datetime.fromisoformat)
+    parser.add_argument("end", type=datetime.fromisoformat)
+    parser.add_argument("--chunk-minutes", type=int, default=BACKFILL_CHUNK_MINUTES)
+    parser.add_argument("--concurrency", type=int, default=BACKFILL_CONCURRENCY)
+    parser.add_argument("--checkpoint", default=BACKFILL_CHECKPOINT_PATH)
+    args = parser.parse_args()
+
+    db_service.init_db()
+    report = asyncio.run(
+        run_backfill(
+            args.start,
+            args.end,
+            chunk_minutes=args.chunk_minutes,
+            concurrency=args.concurrency,
+            checkpoint_path=args.checkpoint,
+        )
+    )
+    logger.info(
+        "Backfill finished: %d rows in %.1f s (%.0f rows/s), %d rejected, "
+        "%d chunks skipped, %d failed",
+        report.rows_fetched,
+        report.elapsed_seconds,
+        report.rows_per_second,
+        report.rows_rejected,
+        report.chunks_skipped,
+        report.chunks_failed,
+    )
@@ -0,0 +1,150 @@
+import argparse
+import asyncio
+import json
+import sys
+
+from benchmarks.load import load_report, register_deployments
+from benchmarks.runner import DEFAULT_SIZES, compare_results, run_benchmarks
+from benchmarks.startup import startup_report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks", description="APG ETL hot-path benchmarks"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Run the benchmarks")
+    run.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    run.add_argument("--repeats", type=int, default=3)
+    run.add_argument("--database-url", default=None)
+    run.add_argument("--output", default="benchmark_results.json")
+
+    compare = commands.add_parser("compare", help="Compare two result files")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=0.1)
+
+    startup = commands.add_parser(
+        "startup", help="Profile imports and cold start time to first response"
+    )
+    startup.add_argument("--repeats", type=int, default=3)
+    startup.add_argument(
+        "--target-ratio",
+        type=float,
+        default=None,
+        help="Fail unless lazy first response takes at most this share of eager",
+    )
+    startup.add_argument("--output", default="startup_profile.json")
+
+    standin = commands.add_parser(
+        "standin", help="Serve the local APG API stand-in (APG_STANDIN_* settings)"
+    )
+    standin.add_argument("--bind", default="0.0.0.0:8090")
+
+    load = commands.add_parser(
+        "load", help="Drive a handler through the Restate ingress at a target rate"
+    )
+    load.add_argument("--target", choices=["apg", "solar"], default="apg")
+    load.add_argument("--rate", type=float, default=5.0, help="Requests per second")
+    load.add_argument("--duration", type=float, default=60.0, help="Seconds")
+    load.add_argument("--concurrency", type=int, default=100)
+    load.add_argument("--ingress-url", default="http://localhost:8080")
+    load.add_argument("--admin-url", default="http://localhost:9070")
+    load.add_argument(
+        "--register",
+        nargs="*",
+        default=[],
+        help="Worker URIs to register with the admin API before the run",
+    )
+    load.add_argument("--database-url", default=None)
+    load.add_argument("--settle-seconds", type=float, default=5.0)
+    load.add_argument("--output", default="load_report.json")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run_benchmarks(args.sizes, args.repeats, args.database_url)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+        return 0
+
+    if args.command == "standin":
+        import hypercorn.asyncio
+        from hypercorn.config import Config
+
+        from benchmarks.apg_standin import app
+
+        config = Config()
+        config.bind = [args.bind]
+        asyncio.run(hypercorn.asyncio.serve(app, config))
+        return 0
+
+    if args.command == "load":
+        if args.register:
+            asyncio.run(register_deployments(args.admin_url, args.register))
+        report = load_report(
+            args.ingress_url,
+            args.target,
+            args.rate,
+            args.duration,
+            args.concurrency,
+            args.database_url,
+            args.settle_seconds,
+        )
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+        latency = report["latency_ms"]
+        print(
+            f"{report['succeeded']} of {report['requests']} requests succeeded "
+            f"at {report['achieved_rate']:.1f}/s (offered {args.rate:.1f}/s), "
+            f"p50 {latency['p50']:.1f} ms, p99 {latency['p99']:.1f} ms"
+        )
+        if "rows_written" in report:
+            print(
+                f"{report['rows_written']} rows written "
+                f"({report['rows_per_second']:.1f} rows/s end to end)"
+            )
+        print(f"Report written to {args.output}")
+        return 0 if report["failed"] == 0 else 1
+
+    if args.command == "startup":
+        report = startup_report(args.repeats, args.target_ratio)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+        for mode in ("eager", "lazy"):
+            timings = report[mode]
+            print(
+                f"{mode:<6} import {timings['import_seconds'] * 1000:>8.1f} ms  "
+                f"first response {timings['first_response_seconds'] * 1000:>8.1f} ms  "
+                f"handlers ready {timings['first_handler_seconds'] * 1000:>8.1f} ms"
+            )
+        for item in report["imports"]["lazy"]["slowest_self"][:10]:
+            print(f"  {item['module']:<40} {item['seconds'] * 1000:>8.1f} ms self")
+        print(
+            f"First response at {report['first_response_ratio']:.2f}x of eager "
+            f"(target {args.target_ratio}), profile written to {args.output}"
+        )
+        return 0 if report["target_met"] else 1
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    comparisons = compare_results(baseline, current, args.threshold)
+    for comparison in comparisons:
+        flag = "REGRESSION" if comparison["regression"] else "ok"
+        print(
+            f"{comparison['stage']:<28} {comparison['size']:>9} rows "
+            f"{comparison['ratio']:>6.2f}x  {flag}"
+        )
+
+    return 1 if any(comparison["regression"] for comparison in comparisons) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+Local stand-in for the APG transparency API
+
+Serves /api/v1/DRZ/Data/German/PT1M/{start}/{end} in the APG response shape,
+so the ETL can be load-tested offline by pointing APG_API_BASE_URL at it.
+Values are a deterministic function of the timestamp, so overlapping requests
+agree like the real API does, unless a revision rate simulates late
+corrections. Latency, error rate and payload width are configurable.
+
+Run with hypercorn (settings from APG_STANDIN_* environment variables):
+    hypercorn --bind 0.0.0.0:8090 benchmarks.apg_standin:app
+"""
+
+import asyncio
+import itertools
+import os
+import random
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import orjson
+from pydantic import BaseModel
+
+# Date format of the APG URL path segments (see format_date_for_api)
+_PATH_DATE_FORMAT = "%Y-%m-%dT%H%M%S"
+
+_ROUTE = re.compile(r"^/api/v1/DRZ/Data/German/PT1M/([^/]+)/([^/]+)/?$")
+
+_EPOCH = datetime(1970, 1, 1)
+
+_MINUTES_PER_DAY = 1440
+
+
+class StandinSettings(BaseModel):
+    latency_ms: float = 50.0  # added before every response
+    jitter_ms: float = 20.0  # uniform +/- around latency_ms
+    error_rate: float = 0.0  # share of requests answered with 503
+    extra_columns: int = 0  # value columns beyond the imbalance column
+    revision_rate: float = 0.0  # share of rows revised on each request
+    missing_rate: float = 0.001  # share of rows without a value
+    max_rows: int = 100_000  # rows served per request at most
+    recorded: Optional[str] = None  # APG response file to serve rows from
+
+    @classmethod
+    def from_env(cls) -> "StandinSettings":
+        """Settings from APG_STANDIN_<FIELD> environment variables"""
+        values = {}
+        for name in cls.model_fields:
+            value = os.getenv(f"APG_STANDIN_{name.upper()}")
+            if value is not None:
+                values[name] = value
+        return cls.model_validate(values)
+
+
+def _hash_unit(keys: np.ndarray, salt: int) -> np.ndarray:
+    """Deterministic pseudo-random numbers in [0, 1) per integer key"""
+    mixed = (keys.astype(np.uint64) + np.uint64(salt)) * np.uint64(0x9E3779B97F4A7C15)
+    mixed ^= mixed >> np.uint64(29)
+    mixed *= np.uint64(0xBF58476D1CE4E5B9)
+    mixed ^= mixed >> np.uint64(32)
+    return (mixed >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+
+def standin_values(
+    minutes: np.ndarray, revision: int = 0, revision_rate: float = 0.0
+) -> np.ndarray:
+    """
+    Synthetic imbalance values for minutes since the epoch
+
+    A daily cycle plus a faster oscillation and per-minute noise, within the
+    validator's range and mostly within its jump limit. A revision_rate share
+    of the rows, different per revision, is shifted as a late correction.
+    """
+    phase = 2 * np.pi * minutes.astype(np.float64)
+    values = (
+        250 * np.sin(phase / _MINUTES_PER_DAY)
+        + 80 * np.sin(phase / 61)
+        + 60 * (_hash_unit(minutes, 1) - 0.5)
+    )
+    if revision_rate > 0:
+        revised = _hash_unit(minutes, 1000 + revision) < revision_rate
+        values[revised] += 20 * (_hash_unit(minutes[revised], 2000 + revision) - 0.5)
+    return values.round(3)
+
+
+def _value_row(time_from: datetime, values: List[Optional[float]]) -> Dict[str, Any]:
+    time_to = time_from + timedelta(minutes=1)
+    return {
+        "DF": time_from.strftime("%d.%m.%Y"),
+        "TF": time_from.strftime("%H:%M"),
+        "DT": time_to.strftime("%d.%m.%Y"),
+        "TT": time_to.strftime("%H:%M"),
+        "V": [{"V": value, "E": False, "M": value is None} for value in values],
+    }
+
+
+def generate_range(
+    start: datetime, end: datetime, settings: StandinSettings, revision: int = 0
+) -> Dict[str, Any]:
+    """APG response with one row per minute in [start, end)"""
+    first = int((start - _EPOCH).total_seconds() // 60)
+    last = int((end - _EPOCH).total_seconds() // 60)
+    minutes = np.arange(first, max(first, min(last, first + settings.max_rows)))
+
+    columns = [standin_values(minutes, revision, settings.revision_rate)]
+    for column in range(settings.extra_columns):
+        columns.append((columns[0] * (0.5 + 0.1 * column)).round(3))
+    missing = _hash_unit(minutes, 3) < settings.missing_rate
+
+    value_rows = []
+    for index, minute in enumerate(minutes.tolist()):
+        row_values = [None if missing[index] else float(c[index]) for c in columns]
+        value_rows.append(_value_row(_EPOCH + timedelta(minutes=minute), row_values))
+
+    return {
+        "ResponseData": {
+            "Description": "APG stand-in imbalance",
+            "ValueColumns": [
+                {"InternalName": "imbalance" if column == 0 else f"column_{column}"}
+                for column in range(len(columns))
+            ],
+            "ValueRows": value_rows,
+        }
+    }
+
+
+class RecordedPayload:
+    """Rows of a recorded APG response, served by requested range"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.response = orjson.loads(f.read())
+
+        self.rows = []
+        for row in self.response["ResponseData"]["ValueRows"]:
+            day = datetime.strptime(row["DF"], "%d.%m.%Y")
+            hours, minutes = row["TF"].split(":")
+            self.rows.append(
+                (day + timedelta(hours=int(hours), minutes=int(minutes)), row)
+            )
+
+    def slice(self, start: datetime, end: datetime, max_rows: int) -> Dict[str, Any]:
+        rows = [row for timestamp, row in self.rows if start <= timestamp < end]
+        response_data = dict(self.response["ResponseData"], ValueRows=rows[:max_rows])
+        return {"ResponseData": response_data}
+
+
+def create_app(settings: Optional[StandinSettings] = None):
+    """ASGI app serving the APG imbalance route with the given settings"""
+    settings = settings or StandinSettings.from_env()
+    recorded = RecordedPayload(settings.recorded) if settings.recorded else None
+    revisions = itertools.count()
+
+    async def respond(send, status: int, body: bytes):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while (await receive())["type"] != "lifespan.shutdown":
+                await send({"type": "lifespan.startup.complete"})
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+        match = _ROUTE.match(scope["path"])
+        if scope["method"] != "GET" or match is None:
+            await respond(send, 404, b'{"error": "not found"}')
+            return
+
+        try:
+            start, end = (
+                datetime.strptime(segment, _PATH_DATE_FORMAT)
+                for segment in match.groups()
+            )
+        except ValueError:
+            await respond(send, 400, b'{"error": "invalid date range"}')
+            return
+
+        delay = settings.latency_ms + random.uniform(
+            -settings.jitter_ms, settings.jitter_ms
+        )
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+        if random.random() < settings.error_rate:
+            await respond(send, 503, b'{"error": "injected failure"}')
+            return
+
+        if recorded is not None:
+            payload = recorded.slice(start, end, settings.max_rows)
+        else:
+            payload = generate_range(start, end, settings, next(revisions))
+        await respond(send, 200, orjson.dumps(payload))
+
+    return app
+
+
+app = create_app()
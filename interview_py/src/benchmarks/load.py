@@ -0,0 +1,182 @@
+"""
+End-to-end load driver for the Restate services
+
+Calls a handler through the Restate ingress at a fixed target rate. The load
+is open loop, so slow responses do not lower the offered rate. Afterwards it
+waits for database writes to settle and reports throughput, ingress latency
+percentiles and the rows written.
+"""
+
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+import numpy as np
+from sqlalchemy import create_engine, text
+
+
+def _apg_payload(index: int) -> Dict[str, Any]:
+    return {}
+
+
+def _solar_payload(index: int) -> Dict[str, Any]:
+    # Mostly valid readings, a few outside the 0-5000 kW bounds
+    return {
+        "timestamp": (datetime(2025, 1, 1) + timedelta(minutes=index)).isoformat(),
+        "plant_id": f"plant-{index % 20}",
+        "value": round(random.uniform(-100.0, 5200.0), 1),
+    }
+
+
+# Target name: (ingress path, request body for the n-th call)
+TARGETS: Dict[str, tuple[str, Callable[[int], Dict[str, Any]]]] = {
+    "apg": ("/APGEtlService/fetch_and_process_data", _apg_payload),
+    "solar": ("/SolarETLService/process_solar_data", _solar_payload),
+}
+
+
+async def register_deployments(admin_url: str, uris: List[str]) -> None:
+    """Register worker endpoints with the Restate admin API"""
+    async with httpx.AsyncClient(base_url=admin_url, timeout=30) as client:
+        for uri in uris:
+            response = await client.post(
+                "/deployments", json={"uri": uri, "force": True}
+            )
+            response.raise_for_status()
+
+
+async def run_load(
+    ingress_url: str,
+    target: str,
+    rate: float,
+    duration: float,
+    concurrency: int = 100,
+    timeout: float = 30.0,
+    transport: Optional[httpx.AsyncBaseTransport] = None,
+) -> Dict[str, Any]:
+    """
+    Call a target handler at rate requests per second for duration seconds
+
+    Args:
+        ingress_url: Base URL of the Restate ingress
+        target: Key of TARGETS
+        rate: Requests started per second
+        duration: Seconds to keep starting requests
+        concurrency: Requests in flight at most, later ones queue
+        timeout: Per-request timeout in seconds
+        transport: httpx transport override (e.g. an ASGI app in tests)
+
+    Returns:
+        Request counts, achieved rate and latency percentiles in milliseconds
+    """
+    path, make_payload = TARGETS[target]
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    in_flight = asyncio.Semaphore(concurrency)
+
+    async def call(client: httpx.AsyncClient, index: int):
+        async with in_flight:
+            started = time.perf_counter()
+            try:
+                response = await client.post(path, json=make_payload(index))
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(
+        base_url=ingress_url, timeout=timeout, limits=limits, transport=transport
+    ) as client:
+        started = time.perf_counter()
+        calls = []
+        for index in range(int(rate * duration)):
+            # Start on schedule regardless of how earlier calls are doing
+            delay = started + index / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            calls.append(asyncio.create_task(call(client, index)))
+        await asyncio.gather(*calls)
+        elapsed = time.perf_counter() - started
+
+    latency_ms = np.array(latencies) * 1000
+    succeeded = sum(count for status, count in statuses.items() if status == "200")
+    return {
+        "target": target,
+        "offered_rate": rate,
+        "requests": len(latencies),
+        "succeeded": succeeded,
+        "failed": len(latencies) - succeeded,
+        "statuses": statuses,
+        "elapsed_seconds": elapsed,
+        "achieved_rate": succeeded / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "p50": float(np.percentile(latency_ms, 50)) if latencies else None,
+            "p99": float(np.percentile(latency_ms, 99)) if latencies else None,
+            "max": float(latency_ms.max()) if latencies else None,
+        },
+    }
+
+
+def count_actual_rows(database_url: str) -> int:
+    """Number of rows in the actual table"""
+    engine = create_engine(database_url)
+    try:
+        with engine.connect() as connection:
+            return connection.execute(
+                text("SELECT count(*) FROM public.actual")
+            ).scalar_one()
+    finally:
+        engine.dispose()
+
+
+def wait_for_rows(
+    database_url: str, settle_seconds: float = 5.0, max_wait_seconds: float = 300.0
+) -> int:
+    """Poll the row count until it stays unchanged for settle_seconds"""
+    deadline = time.monotonic() + max_wait_seconds
+    count = count_actual_rows(database_url)
+    stable_since = time.monotonic()
+    while time.monotonic() < deadline:
+        time.sleep(min(1.0, settle_seconds))
+        current = count_actual_rows(database_url)
+        if current != count:
+            count, stable_since = current, time.monotonic()
+        elif time.monotonic() - stable_since >= settle_seconds:
+            break
+    return count
+
+
+def load_report(
+    ingress_url: str,
+    target: str,
+    rate: float,
+    duration: float,
+    concurrency: int = 100,
+    database_url: Optional[str] = None,
+    settle_seconds: float = 5.0,
+) -> Dict[str, Any]:
+    """
+    Run the load and measure the rows it wrote to the database
+
+    Asynchronous work started by the calls (e.g. window processing sent by
+    fetch_and_process_data) is included by waiting until the row count of the
+    actual table settles. End-to-end throughput is rows written per second
+    from the first request until then.
+    """
+    rows_before = count_actual_rows(database_url) if database_url else None
+    started = time.perf_counter()
+    report = asyncio.run(run_load(ingress_url, target, rate, duration, concurrency))
+
+    if database_url:
+        rows_after = wait_for_rows(database_url, settle_seconds)
+        # Time until the last write, without the settle period itself
+        drained = max(time.perf_counter() - started - settle_seconds, 1e-9)
+        # New rows only, updates of existing rows do not change the count
+        report["rows_written"] = rows_after - rows_before
+        report["rows_per_second"] = report["rows_written"] / drained
+    return report
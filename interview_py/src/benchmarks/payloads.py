@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict
+
+import numpy as np
+import orjson
+
+# Start of every generated payload
+PAYLOAD_START = datetime(2025, 1, 1, 0, 0, 0)
+
+
+def generate_response_data(
+    rows: int, start: datetime = PAYLOAD_START, seed: int = 0
+) -> Dict[str, Any]:
+    """
+    Generate a synthetic APG ImbalanceResponse payload with PT1M rows
+
+    Values follow a bounded random walk, and roughly one row in a thousand
+    carries a missing value, like the real API around gaps.
+
+    Args:
+        rows: Number of one-minute value rows
+        start: Timestamp of the first row
+        seed: Random seed, the same seed gives the same payload
+
+    Returns:
+        Payload as a dict in the APG response shape
+    """
+    random = np.random.default_rng(seed)
+    values = np.clip(np.cumsum(random.normal(0, 15, rows)), -900, 900).round(3)
+    missing = random.random(rows) < 0.001
+
+    value_rows = []
+    for index in range(rows):
+        time_from = start + timedelta(minutes=index)
+        time_to = time_from + timedelta(minutes=1)
+        value = None if missing[index] else float(values[index])
+        value_rows.append(
+            {
+                "DF": time_from.strftime("%d.%m.%Y"),
+                "TF": time_from.strftime("%H:%M"),
+                "DT": time_to.strftime("%d.%m.%Y"),
+                "TT": time_to.strftime("%H:%M"),
+                "V": [{"V": value, "E": False, "M": value is None}],
+            }
+        )
+
+    return {
+        "ResponseData": {
+            "Description": "Synthetic imbalance",
+            "ValueColumns": [{"InternalName": "imbalance"}],
+            "ValueRows": value_rows,
+        }
+    }
+
+
+def generate_response_bytes(
+    rows: int, start: datetime = PAYLOAD_START, seed: int = 0
+) -> bytes:
+    """Generate a synthetic APG payload as raw JSON bytes"""
+    return orjson.dumps(generate_response_data(rows, start, seed))
@@ -0,0 +1,206 @@
+import platform
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from uuid import uuid4
+
+import orjson
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlmodel import SQLModel, create_engine
+
+import apg_data_service
+import data_validator
+import db_service
+from models import ImbalanceResponse
+
+from benchmarks.payloads import generate_response_bytes
+
+DEFAULT_SIZES = [30, 1_000, 100_000, 1_000_000]
+
+# Stages that would take minutes at full size only run up to these row counts
+STAGE_MAX_ROWS = {
+    "save_actual_data": 10_000,
+    "save_actual_batch": 100_000,
+}
+
+
+def sqlite_standin_engine(directory: str) -> Engine:
+    """File-backed SQLite engine with the "public" schema attached"""
+    engine = create_engine(f"sqlite:///{directory}/bench.db")
+
+    @event.listens_for(engine, "connect")
+    def attach_public_schema(dbapi_connection, connection_record):
+        dbapi_connection.execute(f"ATTACH DATABASE '{directory}/public.db' AS public")
+
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def time_stage(action: Callable[[], Any], repeats: int) -> float:
+    """Best wall-clock time of action over the given number of runs"""
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        action()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def _scalar_validation(data_points: List[Dict[str, Any]]):
+    history = []
+    for data_point in data_points:
+        result = data_validator.validate_imbalance_data(data_point, history)
+        if result.is_valid:
+            history = [data_point]
+
+
+def _save_point_by_point(data_points: List[Dict[str, Any]]):
+    metric_id = db_service.get_metric_id(f"bench_{uuid4()}")
+    scope_id = db_service.get_scope_id("bench")
+    for data_point in data_points:
+        db_service.save_actual_data(
+            data_point["timestamp"], data_point["value"], metric_id, scope_id
+        )
+
+
+def _save_batch(data_points: List[Dict[str, Any]]):
+    metric_id = db_service.get_metric_id(f"bench_{uuid4()}")
+    scope_id = db_service.get_scope_id("bench")
+    db_service.save_actual_batch(data_points, metric_id, scope_id)
+
+
+def run_benchmarks(
+    sizes: List[int] = DEFAULT_SIZES,
+    repeats: int = 3,
+    database_url: Optional[str] = None,
+    log: Callable[[str], None] = print,
+) -> Dict[str, Any]:
+    """
+    Time every ETL hot-path stage for synthetic payloads of the given sizes
+
+    Args:
+        sizes: Payload sizes in rows
+        repeats: Runs per stage, the best time is reported
+        database_url: Database for the write stages, a SQLite stand-in if None
+        log: Progress output
+
+    Returns:
+        Machine-readable results, see compare_results
+    """
+    results = []
+    previous_engine = db_service.engine
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_service.engine = (
+            create_engine(database_url)
+            if database_url
+            else sqlite_standin_engine(directory)
+        )
+        db_service.init_db()
+        db_service.invalidate_id_caches()
+
+        try:
+            _run_sizes(sizes, repeats, results, log)
+        finally:
+            db_service.engine.dispose()
+            db_service.engine = previous_engine
+            db_service.invalidate_id_caches()
+
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "database": "custom" if database_url else "sqlite",
+        },
+        "results": results,
+    }
+
+
+def _run_sizes(
+    sizes: List[int],
+    repeats: int,
+    results: List[Dict[str, Any]],
+    log: Callable[[str], None],
+):
+    """Time every stage for each payload size, appending to results"""
+    for size in sizes:
+        content = generate_response_bytes(size)
+        payload = orjson.loads(content)
+        response = ImbalanceResponse.model_validate(payload)
+        data_points = apg_data_service.decode_data_points(content, strict=False)
+        timestamps = [point["timestamp"] for point in data_points]
+        values = [point["value"] for point in data_points]
+
+        stages = {
+            "model_validate": lambda: ImbalanceResponse.model_validate(payload),
+            "extract_data_points": lambda: apg_data_service.extract_data_points(
+                response
+            ),
+            "decode_data_points": lambda: apg_data_service.decode_data_points(
+                content, strict=False
+            ),
+            "validate_imbalance_data": lambda: _scalar_validation(data_points),
+            "validate_imbalance_window": lambda: data_validator.validate_imbalance_window(
+                timestamps, values
+            ),
+            "save_actual_data": lambda: _save_point_by_point(data_points),
+            "save_actual_batch": lambda: _save_batch(data_points),
+        }
+
+        for stage, action in stages.items():
+            if size > STAGE_MAX_ROWS.get(stage, size):
+                continue
+
+            seconds = time_stage(action, repeats if size <= 100_000 else 1)
+            results.append(
+                {
+                    "stage": stage,
+                    "size": size,
+                    "seconds": seconds,
+                    "rows_per_second": size / seconds if seconds > 0 else None,
+                }
+            )
+            log(f"{stage:<28} {size:>9} rows {seconds * 1000:>12.2f} ms")
+
+
+def compare_results(
+    baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.1
+) -> List[Dict[str, Any]]:
+    """
+    Compare two benchmark runs stage by stage
+
+    Args:
+        baseline: Results of the reference run
+        current: Results of the run under test
+        threshold: Relative slowdown tolerated before flagging (0.1 = 10%)
+
+    Returns:
+        One entry per (stage, size) present in both runs, with a regression flag
+    """
+    baseline_times = {
+        (result["stage"], result["size"]): result["seconds"]
+        for result in baseline["results"]
+    }
+
+    comparisons = []
+    for result in current["results"]:
+        key = (result["stage"], result["size"])
+        if key not in baseline_times:
+            continue
+
+        ratio = result["seconds"] / baseline_times[key]
+        comparisons.append(
+            {
+                "stage": result["stage"],
+                "size": result["size"],
+                "baseline_seconds": baseline_times[key],
+                "seconds": result["seconds"],
+                "ratio": ratio,
+                "regression": ratio > 1 + threshold,
+            }
+        )
+
+    return comparisons
@@ -0,0 +1,141 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional
+
+# Directory holding main.py, the worker module under test
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORT_TIME_LINE = re.compile(r"^import time:\s*(\d+) \|\s*(\d+) \|( *)(\S+)")
+
+# Runs in a fresh interpreter: import the worker, answer the first request the
+# Restate server sends (service discovery), then load what handlers use lazily
+_FIRST_RESPONSE_PROBE = """
+import asyncio, json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def discover():
+    messages = []
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    async def send(message):
+        messages.append(message)
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/discover",
+        "raw_path": b"/discover", "query_string": b"", "root_path": "",
+        "headers": [(b"accept", b"application/vnd.restate.endpointmanifest.v2+json")],
+        "server": ("localhost", 9080), "client": ("127.0.0.1", 0),
+    }
+    await main.app(scope, receive, send)
+    return messages[0]["status"]
+
+status = asyncio.run(discover())
+responded = time.perf_counter()
+
+import restate_service
+restate_service.async_db_service.get_async_engine()
+restate_service.apg_data_service.apg_client.get_client()
+restate_service.data_validator.validate_imbalance_points
+handlers_ready = time.perf_counter()
+
+print(json.dumps({
+    "status": status,
+    "import_seconds": imported - started,
+    "first_response_seconds": responded - started,
+    "first_handler_seconds": handlers_ready - started,
+}))
+"""
+
+
+def _run_python(args: List[str], lazy: bool) -> subprocess.CompletedProcess:
+    env = dict(os.environ, LAZY_IMPORTS="1" if lazy else "0", PYTHONPATH=SRC_DIR)
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=SRC_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def profile_imports(module: str = "main", lazy: bool = True, top: int = 15):
+    """
+    Import a module under python -X importtime in a fresh interpreter
+
+    Returns:
+        Total import seconds, the slowest direct imports by cumulative time and
+        the slowest modules by their own (self) time
+    """
+    completed = _run_python(["-X", "importtime", "-c", f"import {module}"], lazy)
+
+    total = 0.0
+    direct_imports = []
+    pending = []
+    self_times = []
+    for line in completed.stderr.splitlines():
+        match = _IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative = int(match.group(2)) / 1e6
+        name = match.group(4)
+        self_times.append({"module": name, "seconds": int(match.group(1)) / 1e6})
+
+        # Children are listed before their parent, two spaces deeper
+        if len(match.group(3)) == 3:
+            pending.append({"module": name, "seconds": cumulative})
+        elif len(match.group(3)) == 1:
+            if name == module:
+                total = cumulative
+                direct_imports = pending
+            pending = []
+
+    direct_imports.sort(key=lambda item: item["seconds"], reverse=True)
+    self_times.sort(key=lambda item: item["seconds"], reverse=True)
+    return {
+        "total_seconds": total,
+        "slowest": direct_imports[:top],
+        "slowest_self": self_times[:top],
+    }
+
+
+def measure_first_response(lazy: bool = True, repeats: int = 3) -> Dict[str, Any]:
+    """Best-of-repeats cold start timings of the worker, see _FIRST_RESPONSE_PROBE"""
+    runs = [
+        json.loads(_run_python(["-c", _FIRST_RESPONSE_PROBE], lazy).stdout)
+        for _ in range(repeats)
+    ]
+    return {key: min(run[key] for run in runs) for key in runs[0]}
+
+
+def startup_report(repeats: int = 3, target_ratio: Optional[float] = None):
+    """
+    Compare cold start in lazy mode against the eager-import baseline
+
+    Args:
+        repeats: Fresh interpreters per mode, the best run is reported
+        target_ratio: Maximum lazy/eager first response time, None to only report
+
+    Returns:
+        Import profiles, timings for both modes and whether the target is met
+    """
+    eager = measure_first_response(lazy=False, repeats=repeats)
+    lazy = measure_first_response(lazy=True, repeats=repeats)
+    ratio = lazy["first_response_seconds"] / eager["first_response_seconds"]
+
+    return {
+        "imports": {
+            "lazy": profile_imports(lazy=True),
+            "eager": profile_imports(lazy=False),
+        },
+        "eager": eager,
+        "lazy": lazy,
+        "first_response_ratio": ratio,
+        "target_ratio": target_ratio,
+        "target_met": target_ratio is None or ratio <= target_ratio,
+    }
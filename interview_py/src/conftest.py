@@ -0,0 +1,88 @@
+import os
+import uuid
+
+import pytest
+from sqlalchemy import event, make_url, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import SQLModel, create_engine
+
+import async_db_service
+import db_service
+
+
+@pytest.fixture
+def sqlite_engine(monkeypatch, tmp_path):
+    """File-backed SQLite stand-in for the Postgres database"""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'main.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+
+    # Tables live in the "public" schema, so attach a database under that name
+    @event.listens_for(engine, "connect")
+    def attach_public_schema(dbapi_connection, connection_record):
+        dbapi_connection.execute(
+            f"ATTACH DATABASE '{tmp_path / 'public.db'}' AS public"
+        )
+
+    SQLModel.metadata.create_all(engine)
+    monkeypatch.setattr(db_service, "engine", engine)
+    db_service.invalidate_id_caches()
+    yield engine
+    db_service.invalidate_id_caches()
+    engine.dispose()
+
+
+@pytest.fixture
+def query_log(sqlite_engine):
+    """Collect every SQL statement sent to the SQLite stand-in"""
+    statements = []
+
+    @event.listens_for(sqlite_engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    return statements
+
+
+@pytest.fixture
+def async_sqlite_engine(monkeypatch, tmp_path, sqlite_engine):
+    """aiosqlite engine on the same files as sqlite_engine for async_db_service"""
+    # NullPool: each test drives the engine from its own asyncio.run loop
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'main.db'}", poolclass=NullPool
+    )
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def attach_public_schema(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"ATTACH DATABASE '{tmp_path / 'public.db'}' AS public")
+        cursor.close()
+
+    monkeypatch.setattr(async_db_service, "async_engine", engine)
+    yield engine
+
+
+@pytest.fixture
+def postgres_engine(monkeypatch):
+    """Scratch database on the server at TEST_DATABASE_URL, skipped if unset"""
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+
+    server = create_engine(url, isolation_level="AUTOCOMMIT")
+    name = f"test_{uuid.uuid4().hex}"
+    with server.connect() as connection:
+        connection.execute(text(f"CREATE DATABASE {name}"))
+
+    engine = create_engine(make_url(url).set(database=name))
+    monkeypatch.setattr(db_service, "engine", engine)
+    db_service.invalidate_id_caches()
+    yield engine
+    db_service.invalidate_id_caches()
+    engine.dispose()
+
+    with server.connect() as connection:
+        connection.execute(text(f"DROP DATABASE {name}"))
+    server.dispose()
@@ -1,10 +1,84 @@
 from models import ValidationResult
-from typing import Dict, Any, List
+from rolling_stats import RollingStats
+from validation_rules import ValidationRule, load_validation_rules
+from typing import Dict, Any, List, Optional, Sequence
+from collections import deque
 from datetime import datetime
+import math
+import os
+import numpy as np
+
+# Imbalance values outside +/- this bound are rejected
+MAX_ABS_VALUE = 1000
+
+# Changes larger than this between consecutive accepted values are rejected
+MAX_JUMP = 200
+
+# Initial search span when scanning for the end of an accept/reject run
+_RUN_SEARCH_SPAN = 64
+
+DEFAULT_RULE = ValidationRule(max_jump=MAX_JUMP)
+
+# Per-metric rules, e.g. VALIDATION_RULES='{"apg_imbalance": {"mode": "statistical"}}'
+VALIDATION_RULES = load_validation_rules(os.getenv("VALIDATION_RULES"), DEFAULT_RULE)
+
+
+def rule_for(metric_name: str) -> ValidationRule:
+    """Validation rule configured for a metric, the threshold rule by default"""
+    return VALIDATION_RULES.get(metric_name, DEFAULT_RULE)
+
+
+def _timestamp_key(timestamp: Any) -> datetime:
+    """
+    Sort key of a history timestamp
+
+    Timestamps arrive as datetimes or as ISO strings from the journal. Values
+    migrated without a timestamp (None) are older than any timed entry.
+    """
+    if timestamp is None:
+        return datetime.min
+    if isinstance(timestamp, str):
+        return datetime.fromisoformat(timestamp)
+    return timestamp
+
+
+def _latest_entry(history: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Return the entry sorted(history, key=timestamp)[-1] would, without sorting"""
+    latest = history[0]
+    latest_time = _timestamp_key(latest["timestamp"])
+    for item in history:
+        item_time = _timestamp_key(item["timestamp"])
+        if item_time >= latest_time:
+            latest, latest_time = item, item_time
+    return latest
+
+
+def _statistical_reason(
+    value: float, stats: RollingStats, rule: ValidationRule
+) -> Optional[str]:
+    """Rejection reason of the z-score checks, None if the value passes"""
+    zscore = stats.zscore(value, rule.min_std)
+    if abs(zscore) > rule.max_zscore:
+        return (
+            f"Z-score {zscore:.2f} of {value} outside +/-{rule.max_zscore} "
+            f"(window mean {stats.mean:.2f}, std {stats.std:.2f})"
+        )
+
+    ewma_zscore = stats.ewma_zscore(value, rule.min_std)
+    if abs(ewma_zscore) > rule.max_ewma_zscore:
+        return (
+            f"Rate of change {value - stats.ewma:.2f} from EWMA {stats.ewma:.2f} "
+            f"outside +/-{rule.max_ewma_zscore} std (z-score {ewma_zscore:.2f})"
+        )
+
+    return None
 
 
 def validate_imbalance_data(
-    data_point: Dict[str, Any], history: List[Dict[str, Any]] = None
+    data_point: Dict[str, Any],
+    history: List[Dict[str, Any]] = None,
+    rule: Optional[ValidationRule] = None,
+    stats: Optional[RollingStats] = None,
 ) -> ValidationResult:
     """
     Validate imbalance data point based on business rules
@@ -12,16 +86,20 @@ def validate_imbalance_data(
     Args:
         data_point: The data point to validate
         history: Optional list of recent data points for trend-based validation
+        rule: Validation rule of the metric, the threshold rule if None
+        stats: Rolling statistics of the history, used by the statistical mode
 
     Returns:
         ValidationResult with validation status and details
     """
+    rule = rule or DEFAULT_RULE
+
     # Extract key values
     timestamp = data_point.get("timestamp")
     value = data_point.get("value")
 
-    # Basic validation
-    if value is None:
+    # Basic validation, NaN is a missing value as in validate_imbalance_window
+    if value is None or math.isnan(value):
         return ValidationResult(is_valid=False, reason="Missing value")
 
     if timestamp is None:
@@ -30,21 +108,30 @@ def validate_imbalance_data(
     # Range validation (imbalance data should be within realistic ranges)
     # For APG imbalance data, typical ranges are approximately -500 to 500 MW
     # but can go higher in exceptional cases
-    if abs(value) > 1000:
+    if abs(value) > MAX_ABS_VALUE:
         return ValidationResult(
             is_valid=False,
-            reason=f"Value {value} outside acceptable range (-1000 to 1000)",
+            reason=f"Value {value} outside acceptable range (-{MAX_ABS_VALUE} to {MAX_ABS_VALUE})",
         )
 
+    # Statistical validation once the rolling window has warmed up, O(1) per point
+    if (
+        rule.mode == "statistical"
+        and stats is not None
+        and len(stats) >= rule.min_samples
+    ):
+        reason = _statistical_reason(value, stats, rule)
+        if reason is not None:
+            return ValidationResult(is_valid=False, reason=reason)
+
     # Trend validation (if history provided)
-    if history and len(history) > 0:
-        # Sort history by timestamp to ensure proper order
-        sorted_history = sorted(history, key=lambda x: x["timestamp"])
-        last_value = sorted_history[-1]["value"]
+    elif history and len(history) > 0:
+        # Compare against the most recent entry by timestamp
+        last_value = _latest_entry(history)["value"]
 
         # Check for sudden extreme changes (more than 200 MW change in 5 minutes)
         # This threshold can be adjusted based on domain knowledge
-        if abs(value - last_value) > 200:
+        if abs(value - last_value) > rule.max_jump:
             return ValidationResult(
                 is_valid=False,
                 reason=f"Suspicious jump from {last_value} to {value} (change: {value - last_value})",
@@ -54,3 +141,271 @@ def validate_imbalance_data(
     return ValidationResult(
         is_valid=True, processed_data={"timestamp": timestamp, "value": value}
     )
+
+
+def validate_imbalance_points(
+    data_points: List[Dict[str, Any]],
+    history: List[Dict[str, Any]] = None,
+    rule: Optional[ValidationRule] = None,
+    stats: Optional[RollingStats] = None,
+) -> List[ValidationResult]:
+    """
+    Validate a window of imbalance data points in order
+
+    Each accepted point becomes part of the history for the points after it,
+    exactly as if the points had been validated and stored one at a time.
+
+    Args:
+        data_points: The data points to validate, in processing order
+        history: Optional list of recent data points for trend-based validation
+        rule: Validation rule of the metric, the threshold rule if None
+        stats: Rolling statistics of the history, required by the statistical
+            mode and left unchanged (a copy is advanced per accepted point)
+
+    Returns:
+        One ValidationResult per data point, in input order
+    """
+    rule = rule or DEFAULT_RULE
+    if rule.mode == "statistical" and stats is not None:
+        return _validate_statistical_points(data_points, history, rule, stats)
+
+    timestamps = [data_point.get("timestamp") for data_point in data_points]
+    values = [data_point.get("value") for data_point in data_points]
+
+    # Windows that continue the history in time order take the vectorized path
+    if _continues_history(timestamps, history):
+        return validate_imbalance_window(
+            timestamps, values, history, rule.max_jump
+        ).to_validation_results()
+
+    accepted_history = list(history or [])
+    results = []
+
+    for data_point in data_points:
+        result = validate_imbalance_data(data_point, accepted_history, rule)
+        if result.is_valid:
+            accepted_history.append(data_point)
+        results.append(result)
+
+    return results
+
+
+def _validate_statistical_points(
+    data_points: List[Dict[str, Any]],
+    history: Optional[List[Dict[str, Any]]],
+    rule: ValidationRule,
+    stats: RollingStats,
+) -> List[ValidationResult]:
+    """Validate points one by one, advancing the statistics per accepted point"""
+    stats = stats.copy()
+    accepted_history = list(history or [])
+    # Values in the statistics window, to know which one each append evicts
+    window = deque(
+        (item["value"] for item in accepted_history[-stats.window :]),
+        maxlen=stats.window,
+    )
+    results = []
+
+    for data_point in data_points:
+        result = validate_imbalance_data(data_point, accepted_history, rule, stats)
+        if result.is_valid:
+            value = data_point["value"]
+            evicted = window[0] if len(window) == window.maxlen else None
+            window.append(value)
+            stats.add(value, evicted)
+            accepted_history.append(data_point)
+        results.append(result)
+
+    return results
+
+
+def _to_datetime64(timestamps: Sequence[Any]) -> np.ndarray:
+    """Convert datetimes or ISO strings (None for missing) to datetime64"""
+    return np.asarray(timestamps, dtype="datetime64[us]")
+
+
+def _continues_history(
+    timestamps: List[Any], history: Optional[List[Dict[str, Any]]]
+) -> bool:
+    """True if the window is time-ordered and starts at or after the history"""
+    try:
+        window_times = _to_datetime64(timestamps)
+        window_times = window_times[~np.isnat(window_times)]
+        if window_times.size == 0:
+            return True
+        if np.any(window_times[1:] < window_times[:-1]):
+            return False
+        if history:
+            history_times = _to_datetime64([item["timestamp"] for item in history])
+            return bool(window_times[0] >= history_times.max())
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+class WindowValidationResult:
+    """Per-point validation outcome of validate_imbalance_window"""
+
+    def __init__(
+        self,
+        timestamps: Sequence[Any],
+        values: Sequence[Any],
+        is_valid: np.ndarray,
+        reasons: List[Optional[str]],
+    ):
+        self.timestamps = timestamps
+        self.values = values
+        self.is_valid = is_valid
+        self.reasons = reasons
+
+    def __len__(self) -> int:
+        return len(self.is_valid)
+
+    def to_validation_results(self) -> List[ValidationResult]:
+        """Build one ValidationResult per point, as validate_imbalance_data would"""
+        results = []
+
+        for index, reason in enumerate(self.reasons):
+            if reason is None:
+                processed_data = {
+                    "timestamp": self.timestamps[index],
+                    "value": self.values[index],
+                }
+                results.append(
+                    ValidationResult(is_valid=True, processed_data=processed_data)
+                )
+            else:
+                results.append(ValidationResult(is_valid=False, reason=reason))
+
+        return results
+
+
+def _find_first(condition, start: int, stop: int) -> int:
+    """
+    Return the first index in [start, stop) where condition holds, else stop
+
+    condition(lo, hi) evaluates a boolean array for the slice [lo, hi). The
+    search span doubles on every miss, so scanning a run costs time
+    proportional to the run's length.
+    """
+    span = _RUN_SEARCH_SPAN
+    lo = start
+
+    while lo < stop:
+        hi = min(stop, lo + span)
+        hits = np.flatnonzero(condition(lo, hi))
+        if hits.size:
+            return lo + int(hits[0])
+        lo = hi
+        span *= 2
+
+    return stop
+
+
+def validate_imbalance_window(
+    timestamps: Sequence[Any],
+    values: Sequence[Any],
+    history: List[Dict[str, Any]] = None,
+    max_jump: float = MAX_JUMP,
+) -> WindowValidationResult:
+    """
+    Validate a time-ordered window of imbalance data in NumPy passes
+
+    Applies the same missing-value, range and jump rules as
+    validate_imbalance_data. The jump rule compares each point against the
+    previous accepted point, so accepted and rejected runs are located with
+    vectorized scans instead of a Python loop over every point.
+
+    Args:
+        timestamps: Point timestamps in ascending order (None for missing)
+        values: Point values (None or NaN for missing)
+        history: Optional list of recent data points preceding the window
+        max_jump: Largest accepted change from the previous accepted value
+
+    Returns:
+        WindowValidationResult with a validity mask and per-point reasons
+    """
+    count = len(values)
+    if isinstance(values, np.ndarray):
+        value_array = values.astype(np.float64, copy=False)
+    else:
+        value_array = np.array(
+            [np.nan if value is None else value for value in values],
+            dtype=np.float64,
+        )
+    missing_value = np.isnan(value_array)
+    missing_timestamp = np.isnat(_to_datetime64(timestamps)) & ~missing_value
+    out_of_range = ~missing_value & ~missing_timestamp
+    out_of_range[out_of_range] = np.abs(value_array[out_of_range]) > MAX_ABS_VALUE
+
+    # Only points passing the per-point rules take part in the jump chain
+    candidates = np.flatnonzero(~(missing_value | missing_timestamp | out_of_range))
+    candidate_values = value_array[candidates]
+    accepted = np.zeros(candidates.size, dtype=bool)
+
+    # Index of the accepted point each jump-rejected candidate was compared to,
+    # -1 meaning the latest history entry
+    anchor_of = np.full(candidates.size, -2, dtype=np.int64)
+
+    anchor_index = -2
+    anchor_value = None
+    history_last_value = None
+    if history:
+        history_last_value = _latest_entry(history)["value"]
+        anchor_index = -1
+        anchor_value = float(history_last_value)
+
+    position = 0
+    while position < candidates.size:
+        if anchor_value is not None and (
+            abs(candidate_values[position] - anchor_value) > max_jump
+        ):
+            # Reject every candidate until one is back within reach of the anchor
+            end = _find_first(
+                lambda lo, hi: np.abs(candidate_values[lo:hi] - anchor_value)
+                <= max_jump,
+                position,
+                candidates.size,
+            )
+            anchor_of[position:end] = anchor_index
+            position = end
+            continue
+
+        # Accept this candidate and every successor close to its predecessor
+        end = _find_first(
+            lambda lo, hi: np.abs(
+                candidate_values[lo:hi] - candidate_values[lo - 1 : hi - 1]
+            )
+            > max_jump,
+            position + 1,
+            candidates.size,
+        )
+        accepted[position:end] = True
+        anchor_index = int(candidates[end - 1])
+        anchor_value = candidate_values[end - 1]
+        position = end
+
+    is_valid = np.zeros(count, dtype=bool)
+    is_valid[candidates[accepted]] = True
+
+    # Build reason strings only for rejected points, from the original values
+    reasons: List[Optional[str]] = [None] * count
+    for index in np.flatnonzero(missing_value):
+        reasons[index] = "Missing value"
+    for index in np.flatnonzero(missing_timestamp):
+        reasons[index] = "Missing timestamp"
+    for index in np.flatnonzero(out_of_range):
+        value = values[index]
+        reasons[index] = (
+            f"Value {value} outside acceptable range (-{MAX_ABS_VALUE} to {MAX_ABS_VALUE})"
+        )
+    for position in np.flatnonzero(~accepted):
+        index = candidates[position]
+        anchor = anchor_of[position]
+        last_value = history_last_value if anchor == -1 else values[anchor]
+        value = values[index]
+        reasons[index] = (
+            f"Suspicious jump from {last_value} to {value} (change: {value - last_value})"
+        )
+
+    return WindowValidationResult(timestamps, values, is_valid, reasons)
@@ -0,0 +1,68 @@
+from sqlalchemy import Index, UniqueConstraint
+from sqlmodel import SQLModel, Field as SQLField
+from typing import Optional
+from uuid import UUID, uuid4
+from datetime import datetime
+
+
+# Database models
+class Metric(SQLModel, table=True):
+    __tablename__ = "metric"
+    __table_args__ = (
+        UniqueConstraint("name", name="uq_metric_name"),
+        {"schema": "public"},
+    )
+
+    metric_id: UUID = SQLField(default_factory=uuid4, primary_key=True)
+    name: str
+    description: Optional[str] = None
+
+
+class Scope(SQLModel, table=True):
+    __tablename__ = "scope"
+    __table_args__ = (
+        UniqueConstraint("name", name="uq_scope_name"),
+        {"schema": "public"},
+    )
+
+    scope_id: UUID = SQLField(default_factory=uuid4, primary_key=True)
+    name: str
+    description: Optional[str] = None
+
+
+class Actual(SQLModel, table=True):
+    __tablename__ = "actual"
+    __table_args__ = {"schema": "public"}
+
+    time: datetime = SQLField(primary_key=True)
+    data: float
+    metric_id: UUID = SQLField(foreign_key="public.metric.metric_id", primary_key=True)
+    scope_id: UUID = SQLField(foreign_key="public.scope.scope_id", primary_key=True)
+
+
+class ActualRollup(SQLModel, table=True):
+    """Aggregates of Actual rows per series and 15-minute or hourly bucket"""
+
+    __tablename__ = "actual_rollup"
+    __table_args__ = {"schema": "public"}
+
+    resolution: str = SQLField(primary_key=True)  # "15m" or "1h"
+    metric_id: UUID = SQLField(foreign_key="public.metric.metric_id", primary_key=True)
+    scope_id: UUID = SQLField(foreign_key="public.scope.scope_id", primary_key=True)
+    bucket: datetime = SQLField(primary_key=True)  # bucket start, epoch aligned
+    count: int
+    sum: float
+    min: float
+    max: float
+    first: float
+    last: float
+
+
+# Serves per-series range scans and "latest N" reads, which the primary key
+# order (time, metric_id, scope_id) cannot
+Index(
+    "ix_actual_series_time",
+    Actual.__table__.c.metric_id,
+    Actual.__table__.c.scope_id,
+    Actual.__table__.c.time.desc(),
+)
@@ -1,9 +1,42 @@
-from sqlmodel import SQLModel, create_engine, Session, select
-from models import Metric, Scope, Actual
-from datetime import datetime
+from sqlmodel import SQLModel, create_engine, Session
+from sqlalchemy import Table, delete, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateTable
+from db_models import Metric, Scope, Actual, ActualRollup
+from db_statements import (
+    QUERY_RESOLUTIONS,
+    ROLLUP_RESOLUTIONS,
+    UNNEST_UPSERT,
+    as_datetime,
+    bucket_ceil,
+    bucket_floor,
+    counted_upsert_sql,
+    existing_count_statement,
+    insert_named_statement,
+    recent_data_since,
+    recent_data_statement,
+    rollup_refresh_statement,
+    rollup_refresh_statements,
+    select_id_statement,
+    series_page,
+    series_query_statement,
+    series_query_window,
+    to_series_rows,
+    unnest_parameters,
+    upsert_statement,
+)
+from models import BatchWriteResult
+from collections import OrderedDict
+from datetime import datetime, timedelta
 from uuid import UUID
-from typing import Optional, List
+from typing import Optional, List, Dict, Any, Iterable, Callable
+import csv
+import io
+import logging
 import os
+import re
+import threading
+import time as time_module
 
 # Database connection settings
 DB_USER = os.getenv("DB_USER", "postgres")
@@ -14,83 +47,933 @@ DB_NAME = os.getenv("DB_NAME", "postgres")
 
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-# Create engine
-engine = create_engine(DATABASE_URL)
+# Batches with at least this many points are loaded via COPY into a staging table
+COPY_THRESHOLD = int(os.getenv("DB_COPY_THRESHOLD", "5000"))
 
+# Maximum number of rows per INSERT ... ON CONFLICT statement
+UPSERT_CHUNK_SIZE = 1000
+
+# Name -> ID cache settings for metrics and scopes
+ID_CACHE_SIZE = int(os.getenv("DB_ID_CACHE_SIZE", "1024"))
+ID_CACHE_TTL_SECONDS = float(os.getenv("DB_ID_CACHE_TTL_SECONDS", "3600"))
+
+# Connection pool settings, shared with the async engine in async_db_service
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+
+# Default number of buckets returned per query page
+QUERY_PAGE_SIZE = int(os.getenv("DB_QUERY_PAGE_SIZE", "1000"))
+
+
+# Range partitioning of public.actual by time (PostgreSQL only, see init_db)
+DB_ACTUAL_PARTITIONED = os.getenv("DB_ACTUAL_PARTITIONED", "false").lower() == "true"
+PARTITION_INTERVALS = ("month", "day")
+DB_PARTITION_INTERVAL = os.getenv("DB_PARTITION_INTERVAL", "month")
+# Partitions created ahead of the current one
+DB_PARTITION_PREMAKE = int(os.getenv("DB_PARTITION_PREMAKE", "3"))
+# Partitions ending more than this many days ago are retired, 0 keeps all
+DB_PARTITION_RETENTION_DAYS = int(os.getenv("DB_PARTITION_RETENTION_DAYS", "0"))
+# "detach" keeps retired partitions as standalone tables, "drop" deletes them
+DB_PARTITION_RETENTION_ACTION = os.getenv("DB_PARTITION_RETENTION_ACTION", "detach")
+# Hours of rows moved per transaction when partitioning an existing table
+DB_MIGRATION_CHUNK_HOURS = int(os.getenv("DB_MIGRATION_CHUNK_HOURS", "24"))
+
+logger = logging.getLogger(__name__)
+
+# Created on first use so importing this module never touches the driver
+engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> Engine:
+    """Return the process-wide engine, creating it on first use"""
+    global engine
+    if engine is None:
+        with _engine_lock:
+            if engine is None:
+                engine = create_engine(
+                    DATABASE_URL,
+                    pool_size=DB_POOL_SIZE,
+                    max_overflow=DB_MAX_OVERFLOW,
+                    pool_recycle=DB_POOL_RECYCLE_SECONDS,
+                    pool_pre_ping=True,
+                    connect_args={
+                        "options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+                    },
+                )
+    return engine
+
+
+class NameIdCache:
+    """Bounded, thread-safe name -> ID (or row) cache with TTL and LRU eviction"""
+
+    def __init__(
+        self,
+        max_size: int = ID_CACHE_SIZE,
+        ttl_seconds: float = ID_CACHE_TTL_SECONDS,
+        clock: Callable[[], float] = time_module.monotonic,
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[str, tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Optional[Any]:
+        """Return the cached value for name, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if self._clock() >= expires_at:
+                del self._entries[name]
+                return None
+
+            self._entries.move_to_end(name)
+            return value
+
+    def put(self, name: str, value: Any) -> None:
+        """Cache the value for name, evicting the least recently used entry if full"""
+        with self._lock:
+            self._entries[name] = (value, self._clock() + self.ttl_seconds)
+            self._entries.move_to_end(name)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """Drop a single name, or every entry when no name is given"""
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+metric_id_cache = NameIdCache()
+scope_id_cache = NameIdCache()
+
+# Detached Metric and Scope rows for get_or_create_metric/get_or_create_scope
+metric_row_cache = NameIdCache()
+scope_row_cache = NameIdCache()
+
+
+def init_db(partitioned: Optional[bool] = None):
+    """
+    Create tables if they don't exist
+
+    Args:
+        partitioned: Create public.actual range-partitioned by time on
+            PostgreSQL, defaults to DB_ACTUAL_PARTITIONED. An existing
+            unpartitioned table is kept (see migrate_actual_to_partitioned).
+    """
+    if partitioned is None:
+        partitioned = DB_ACTUAL_PARTITIONED
+    engine = get_engine()
+    partitioned = partitioned and engine.dialect.name == "postgresql"
+
+    if partitioned:
+        with engine.begin() as connection:
+            relkind = _relkind(connection, "actual")
+            if relkind is None:
+                SQLModel.metadata.create_all(
+                    connection, tables=[Metric.__table__, Scope.__table__]
+                )
+                _create_partitioned_actual(connection)
+            elif relkind != "p":
+                logger.warning(
+                    "public.actual is not partitioned, "
+                    "run maintain_partitions.py --migrate to convert it"
+                )
+                partitioned = False
 
-def init_db():
-    """Create tables if they don't exist"""
     SQLModel.metadata.create_all(engine)
 
+    # create_all skips indexes of tables that already exist
+    for index in Actual.__table__.indexes:
+        index.create(engine, checkfirst=True)
 
-def get_or_create_metric(name: str, description: Optional[str] = None) -> Metric:
-    """Get a metric by name or create it if it doesn't exist"""
-    with Session(engine) as session:
-        statement = select(Metric).where(Metric.name == name)
-        metric = session.exec(statement).first()
+    # Tables created before names were unique need the constraint added,
+    # after merging the duplicate names earlier racing writers created
+    if engine.dialect.name == "postgresql":
+        merged = []
+        with engine.begin() as connection:
+            for table, id_column in (("metric", "metric_id"), ("scope", "scope_id")):
+                constraint = f"uq_{table}_name"
+                if connection.execute(
+                    text("SELECT 1 FROM pg_constraint WHERE conname = :name"),
+                    {"name": constraint},
+                ).first():
+                    continue
 
-        if metric is None:
-            metric = Metric(name=name, description=description)
-            session.add(metric)
-            session.commit()
-            session.refresh(metric)
+                # Keep new duplicates from appearing until the constraint exists
+                connection.execute(
+                    text(f"LOCK TABLE public.{table} IN SHARE ROW EXCLUSIVE MODE")
+                )
+                moved = _merge_duplicate_names(connection, table, id_column)
+                if moved is not None:
+                    merged.append(moved)
+                connection.execute(text(f"""
+                        ALTER TABLE public.{table}
+                        ADD CONSTRAINT {constraint} UNIQUE (name)
+                        """))
+
+            # The unique constraint's index replaces the former plain index
+            for table in ("metric", "scope"):
+                connection.execute(
+                    text(f"DROP INDEX IF EXISTS public.ix_public_{table}_name")
+                )
+
+        if merged:
+            invalidate_id_caches()
+        for first, last in merged:
+            rebuild_rollups(first, last + timedelta(microseconds=1))
+
+    if partitioned:
+        maintain_partitions()
+
+
+def _merge_duplicate_names(
+    connection: Connection, table: str, id_column: str
+) -> Optional[tuple[datetime, datetime]]:
+    """
+    Repoint rows of duplicate metric or scope names to one row per name
+
+    The row with the lowest ID is kept. Actual rows of the duplicates move
+    to it, keeping its own value where both have one, and the duplicates'
+    rollups are dropped.
+
+    Returns:
+        (min, max) time of the moved Actual rows, whose rollups need a
+        rebuild, or None when nothing was moved
+    """
+    connection.execute(text(f"""
+            CREATE TEMP TABLE name_duplicates ON COMMIT DROP AS
+            SELECT duplicate_id, keep_id FROM (
+                SELECT {id_column} AS duplicate_id,
+                       first_value({id_column}) OVER (
+                           PARTITION BY name ORDER BY {id_column}
+                       ) AS keep_id
+                FROM public.{table}
+            ) ranked
+            WHERE duplicate_id <> keep_id
+            """))
+
+    duplicates = connection.execute(
+        text("SELECT count(*) FROM name_duplicates")
+    ).scalar_one()
+    moved = None
+    if duplicates:
+        logger.warning("Merging %d duplicate %s names", duplicates, table)
+        first, last = connection.execute(text(f"""
+                SELECT min(a.time), max(a.time) FROM public.actual a
+                JOIN name_duplicates d ON a.{id_column} = d.duplicate_id
+                """)).one()
+        if first is not None:
+            moved = (first, last)
+
+        columns = ", ".join(
+            "d.keep_id" if column == id_column else f"a.{column}"
+            for column in ("time", "data", "metric_id", "scope_id")
+        )
+        connection.execute(text(f"""
+                INSERT INTO public.actual (time, data, metric_id, scope_id)
+                SELECT {columns} FROM public.actual a
+                JOIN name_duplicates d ON a.{id_column} = d.duplicate_id
+                ON CONFLICT (time, metric_id, scope_id) DO NOTHING
+                """))
+        for child in ("actual", "actual_rollup", table):
+            connection.execute(text(f"""
+                    DELETE FROM public.{child} c USING name_duplicates d
+                    WHERE c.{id_column} = d.duplicate_id
+                    """))
+
+    connection.execute(text("DROP TABLE name_duplicates"))
+    return moved
+
+
+def partition_start(time: datetime, interval: str = DB_PARTITION_INTERVAL) -> datetime:
+    """Start of the partition holding time"""
+    if interval not in PARTITION_INTERVALS:
+        raise ValueError(
+            f"Unknown partition interval {interval!r}, expected one of "
+            f"{', '.join(PARTITION_INTERVALS)}"
+        )
+    day = time.replace(hour=0, minute=0, second=0, microsecond=0)
+    return day.replace(day=1) if interval == "month" else day
+
+
+def partition_end(start: datetime, interval: str = DB_PARTITION_INTERVAL) -> datetime:
+    """End (exclusive) of the partition starting at start"""
+    if interval == "day":
+        return start + timedelta(days=1)
+    return partition_start(start.replace(day=28) + timedelta(days=4), interval)
+
+
+def partition_name(start: datetime) -> str:
+    return f"actual_p{start:%Y%m%d}"
+
+
+def partition_starts(
+    start: datetime, end: datetime, interval: str = DB_PARTITION_INTERVAL
+) -> List[datetime]:
+    """Starts of the partitions holding the times in [start, end)"""
+    starts = []
+    partition = partition_start(start, interval)
+    while partition < end:
+        starts.append(partition)
+        partition = partition_end(partition, interval)
+    return starts
+
+
+def plan_partitions(
+    existing: Iterable[tuple[datetime, datetime]],
+    now: datetime,
+    interval: str = DB_PARTITION_INTERVAL,
+    premake: int = DB_PARTITION_PREMAKE,
+    retention_days: int = DB_PARTITION_RETENTION_DAYS,
+    unpartitioned: Optional[tuple[datetime, datetime]] = None,
+) -> tuple[List[datetime], List[tuple[datetime, datetime]]]:
+    """
+    Partitions to create and to retire
+
+    Args:
+        existing: (start, end) bounds of the attached partitions
+        now: Current time
+        interval: One of PARTITION_INTERVALS
+        premake: Partitions to have ready after the current one
+        retention_days: Retire partitions ending this many days before now,
+            0 keeps all
+        unpartitioned: (min, max) time of the rows in the default partition,
+            which get partitions of their own
+
+    Returns:
+        Tuple of (starts of missing partitions, bounds of expired partitions),
+        expired partitions include missing ones that are already past retention
+    """
+    existing = list(existing)
+    starts = {start for start, _ in existing}
+
+    wanted = set()
+    start = partition_start(now, interval)
+    for _ in range(premake + 1):
+        wanted.add(start)
+        start = partition_end(start, interval)
+    if unpartitioned is not None:
+        first, last = unpartitioned
+        wanted.update(
+            partition_starts(first, last + timedelta(microseconds=1), interval)
+        )
+    missing = sorted(wanted - starts)
+
+    expired = []
+    if retention_days > 0:
+        cutoff = now - timedelta(days=retention_days)
+        bounds = existing + [
+            (start, partition_end(start, interval)) for start in missing
+        ]
+        expired = sorted(bound for bound in bounds if bound[1] <= cutoff)
+
+    return missing, expired
+
+
+def _relkind(connection: Connection, name: str) -> Optional[str]:
+    """pg_class kind of a relation in public ("r" table, "p" partitioned)"""
+    return connection.execute(
+        text("""
+            SELECT c.relkind FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'public' AND c.relname = :name
+            """),
+        {"name": name},
+    ).scalar_one_or_none()
+
+
+def _create_partitioned_actual(connection: Connection) -> None:
+    """Create public.actual from its model, partitioned by time, plus a default partition"""
+    ddl = str(CreateTable(Actual.__table__).compile(dialect=connection.dialect))
+    connection.execute(text(f"{ddl.strip()} PARTITION BY RANGE (time)"))
+    connection.execute(
+        text("CREATE TABLE public.actual_default PARTITION OF public.actual DEFAULT")
+    )
+    for index in Actual.__table__.indexes:
+        index.create(connection, checkfirst=True)
+
+
+_PARTITION_BOUND = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def _actual_partitions(connection: Connection) -> Dict[str, tuple[datetime, datetime]]:
+    """Bounds of the attached range partitions by name, without the default"""
+    rows = connection.execute(text("""
+        SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        JOIN pg_namespace n ON n.oid = parent.relnamespace
+        WHERE n.nspname = 'public' AND parent.relname = 'actual'
+        """)).all()
+
+    partitions = {}
+    for name, bound in rows:
+        match = _PARTITION_BOUND.search(bound)
+        if match:
+            partitions[name] = (
+                datetime.fromisoformat(match.group(1)),
+                datetime.fromisoformat(match.group(2)),
+            )
+    return partitions
+
+
+def _create_partition(
+    connection: Connection, start: datetime, interval: str = DB_PARTITION_INTERVAL
+) -> str:
+    """
+    Attach the partition starting at start
+
+    Rows of its range that landed in the default partition are moved into
+    it, as PostgreSQL refuses to create a partition overlapping them.
+    """
+    end = partition_end(start, interval)
+    name = partition_name(start)
+    bounds = {"start": start, "end": end}
+
+    connection.execute(
+        text("""
+            CREATE TEMP TABLE actual_moving ON COMMIT DROP AS
+            WITH moved AS (
+                DELETE FROM public.actual_default
+                WHERE time >= :start AND time < :end
+                RETURNING time, data, metric_id, scope_id
+            )
+            SELECT * FROM moved
+            """),
+        bounds,
+    )
+    connection.execute(text(f"""
+            CREATE TABLE public.{name} PARTITION OF public.actual
+            FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')
+            """))
+    connection.execute(text("""
+            INSERT INTO public.actual (time, data, metric_id, scope_id)
+            SELECT time, data, metric_id, scope_id FROM actual_moving
+            """))
+    connection.execute(text("DROP TABLE actual_moving"))
+    return name
+
+
+def _create_missing_partitions(
+    connection: Connection, start: datetime, end: datetime, interval: str
+) -> List[str]:
+    """Create the partitions of [start, end) that do not exist yet"""
+    existing = {bounds[0] for bounds in _actual_partitions(connection).values()}
+    return [
+        _create_partition(connection, partition, interval)
+        for partition in partition_starts(start, end, interval)
+        if partition not in existing
+    ]
+
+
+def ensure_partitions(
+    start: datetime, end: datetime, interval: str = DB_PARTITION_INTERVAL
+) -> List[str]:
+    """
+    Create the partitions for writing [start, end), e.g. before a backfill
+
+    Returns:
+        Names of the created partitions, empty when the table is not
+        partitioned
+    """
+    engine = get_engine()
+    if engine.dialect.name != "postgresql":
+        return []
+
+    with engine.begin() as connection:
+        if _relkind(connection, "actual") != "p":
+            return []
+        created = _create_missing_partitions(connection, start, end, interval)
+
+    for name in created:
+        logger.info("Created partition %s", name)
+    return created
+
+
+def maintain_partitions(
+    now: Optional[datetime] = None,
+    interval: str = DB_PARTITION_INTERVAL,
+    premake: int = DB_PARTITION_PREMAKE,
+    retention_days: int = DB_PARTITION_RETENTION_DAYS,
+    action: str = DB_PARTITION_RETENTION_ACTION,
+) -> Dict[str, List[str]]:
+    """
+    Pre-create upcoming partitions of public.actual and retire expired ones
+
+    Run regularly (e.g. daily) when the table is partitioned. Rows in the
+    default partition are moved into partitions for their range, so they
+    are pruned and retired like the rest. Rollups of retired ranges are
+    kept, so downsampled queries still cover them.
 
-        return metric
+    Args:
+        now: Current time, defaults to datetime.now()
+        interval: One of PARTITION_INTERVALS
+        premake: Partitions to have ready after the current one
+        retention_days: Retire partitions ending this many days ago, 0 keeps all
+        action: "detach" to keep retired partitions as tables, or "drop"
+
+    Returns:
+        Dict with the names of the "created" and "retired" partitions, empty
+        when the table is not partitioned
+    """
+    if action not in ("detach", "drop"):
+        raise ValueError(f"Unknown retention action {action!r}")
+
+    result = {"created": [], "retired": []}
+    engine = get_engine()
+    if engine.dialect.name != "postgresql":
+        return result
+
+    with engine.begin() as connection:
+        if _relkind(connection, "actual") != "p":
+            return result
+
+        # Rows of ranges without a partition (e.g. backfilled history) are
+        # split out of the default partition into partitions of their own
+        unpartitioned = None
+        if _relkind(connection, "actual_default") is not None:
+            first, last = connection.execute(
+                text("SELECT min(time), max(time) FROM public.actual_default")
+            ).one()
+            if first is not None:
+                unpartitioned = (first, last)
+
+        missing, expired = plan_partitions(
+            _actual_partitions(connection).values(),
+            now or datetime.now(),
+            interval,
+            premake,
+            retention_days,
+            unpartitioned,
+        )
+
+        for start in missing:
+            result["created"].append(_create_partition(connection, start, interval))
+
+        names = {
+            bounds: name for name, bounds in _actual_partitions(connection).items()
+        }
+        for bounds in expired:
+            name = names[bounds]
+            connection.execute(
+                text(f"ALTER TABLE public.actual DETACH PARTITION public.{name}")
+            )
+            if action == "drop":
+                connection.execute(text(f"DROP TABLE public.{name}"))
+            result["retired"].append(name)
+
+    for name in result["created"]:
+        logger.info("Created partition %s", name)
+    for name in result["retired"]:
+        logger.info("Retired partition %s (%s)", name, action)
+    return result
+
+
+def migrate_actual_to_partitioned(
+    chunk_hours: int = DB_MIGRATION_CHUNK_HOURS,
+    interval: str = DB_PARTITION_INTERVAL,
+) -> int:
+    """
+    Convert an unpartitioned public.actual into a partitioned one
+
+    The table is renamed to actual_unpartitioned and a partitioned
+    public.actual takes its place, so writes continue during the migration.
+    Rows are then moved over in chunk_hours transactions; rows written to
+    the new table meanwhile win. Rerunning resumes an interrupted migration.
+
+    Returns:
+        Number of rows moved
+    """
+    engine = get_engine()
+    if engine.dialect.name != "postgresql":
+        raise ValueError("Partitioning requires PostgreSQL")
+
+    with engine.begin() as connection:
+        if _relkind(connection, "actual") == "r":
+            # Index names are per schema, so free them for the new table
+            connection.execute(
+                text("ALTER TABLE public.actual RENAME TO actual_unpartitioned")
+            )
+            connection.execute(text("""
+                    ALTER TABLE public.actual_unpartitioned
+                    RENAME CONSTRAINT actual_pkey TO actual_unpartitioned_pkey
+                    """))
+            connection.execute(text("""
+                    ALTER INDEX IF EXISTS public.ix_actual_series_time
+                    RENAME TO ix_actual_unpartitioned_series_time
+                    """))
+        if _relkind(connection, "actual") is None:
+            _create_partitioned_actual(connection)
+        if _relkind(connection, "actual_unpartitioned") is None:
+            return 0
+
+        first, last = connection.execute(
+            text("SELECT min(time), max(time) FROM public.actual_unpartitioned")
+        ).one()
+
+        # Every month of the old data gets its own partition up front
+        if first is not None:
+            _create_missing_partitions(
+                connection, first, last + timedelta(microseconds=1), interval
+            )
+
+    moved = 0
+    chunk_start = first
+    while first is not None and chunk_start <= last:
+        chunk_end = chunk_start + timedelta(hours=chunk_hours)
+        with engine.begin() as connection:
+            moved += connection.execute(
+                text("""
+                    WITH moved AS (
+                        DELETE FROM public.actual_unpartitioned
+                        WHERE time >= :start AND time < :end
+                        RETURNING time, data, metric_id, scope_id
+                    )
+                    INSERT INTO public.actual (time, data, metric_id, scope_id)
+                    SELECT time, data, metric_id, scope_id FROM moved
+                    ON CONFLICT (time, metric_id, scope_id) DO NOTHING
+                    """),
+                {"start": chunk_start, "end": chunk_end},
+            ).rowcount
+        logger.info("Migrated rows up to %s (%d so far)", chunk_end, moved)
+        chunk_start = chunk_end
+
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE public.actual_unpartitioned"))
+    return moved
+
+
+def invalidate_id_caches() -> None:
+    """Forget all cached metric and scope IDs"""
+    metric_id_cache.invalidate()
+    scope_id_cache.invalidate()
+    metric_row_cache.invalidate()
+    scope_row_cache.invalidate()
+
+
+def get_metric_id(name: str, description: Optional[str] = None) -> UUID:
+    """Resolve a metric name to its ID, creating the metric if needed"""
+    metric_id = metric_id_cache.get(name)
+    if metric_id is None:
+        metric_id = _get_or_create_id(Metric.__table__, "metric_id", name, description)
+        metric_id_cache.put(name, metric_id)
+    return metric_id
+
+
+def get_scope_id(name: str, description: Optional[str] = None) -> UUID:
+    """Resolve a scope name to its ID, creating the scope if needed"""
+    scope_id = scope_id_cache.get(name)
+    if scope_id is None:
+        scope_id = _get_or_create_id(Scope.__table__, "scope_id", name, description)
+        scope_id_cache.put(name, scope_id)
+    return scope_id
+
+
+def get_or_create_metric(name: str, description: Optional[str] = None) -> Metric:
+    """Get a metric by name or create it if it doesn't exist"""
+    metric = metric_row_cache.get(name)
+    if metric is None:
+        metric = _load_row(Metric, get_metric_id(name, description))
+        metric_row_cache.put(name, metric)
+    return metric
 
 
 def get_or_create_scope(name: str, description: Optional[str] = None) -> Scope:
     """Get a scope by name or create it if it doesn't exist"""
-    with Session(engine) as session:
-        statement = select(Scope).where(Scope.name == name)
-        scope = session.exec(statement).first()
+    scope = scope_row_cache.get(name)
+    if scope is None:
+        scope = _load_row(Scope, get_scope_id(name, description))
+        scope_row_cache.put(name, scope)
+    return scope
 
-        if scope is None:
-            scope = Scope(name=name, description=description)
-            session.add(scope)
-            session.commit()
-            session.refresh(scope)
 
-        return scope
+def _load_row(model: type, row_id: UUID) -> Any:
+    """Load a row by primary key, detached so it can be cached"""
+    with Session(get_engine()) as session:
+        row = session.get(model, row_id)
+        session.expunge(row)
+        return row
+
+
+def _get_or_create_id(
+    table: Table, id_column: str, name: str, description: Optional[str]
+) -> UUID:
+    """Insert a named row unless it exists and return its ID, safe under races"""
+    with Session(get_engine()) as session:
+        dialect = session.get_bind().dialect.name
+        row_id = session.execute(
+            insert_named_statement(dialect, table, id_column, name, description)
+        ).scalar_one_or_none()
+
+        # Another writer created it first, read the winning row
+        if row_id is None:
+            row_id = session.execute(
+                select_id_statement(table, id_column, name)
+            ).scalar_one()
+
+        session.commit()
+        return row_id
 
 
 def save_actual_data(
     time: datetime, data: float, metric_id: UUID, scope_id: UUID
 ) -> bool:
     """Save actual data to database, update if already exists"""
+    result = save_actual_batch(
+        [{"timestamp": time, "value": data}], metric_id, scope_id
+    )
+    return result is not None
+
+
+def save_actual_batch(
+    points: Iterable[Dict[str, Any]], metric_id: UUID, scope_id: UUID
+) -> Optional[BatchWriteResult]:
+    """
+    Upsert a window of data points for one metric and scope
+
+    Rows are written with INSERT ... ON CONFLICT (time, metric_id, scope_id)
+    DO UPDATE, which only touches rows whose value actually changed. On
+    PostgreSQL the batch is sent as arrays to a single unnest upsert, and
+    large batches are streamed with COPY into a staging table first.
+
+    Args:
+        points: Data points with "timestamp" and "value" keys
+        metric_id: Metric the points belong to
+        scope_id: Scope the points belong to
+
+    Returns:
+        BatchWriteResult with inserted/updated/unchanged counts, or None on error
+    """
+    return save_series_batch({(metric_id, scope_id): points})
+
+
+def save_series_batch(
+    series: Dict[tuple[UUID, UUID], Iterable[Dict[str, Any]]],
+) -> Optional[BatchWriteResult]:
+    """
+    Upsert windows of several series in one transaction
+
+    Same semantics as save_actual_batch, e.g. for all value columns decoded
+    from one APG response.
+
+    Args:
+        series: Data points with "timestamp" and "value" keys by (metric_id, scope_id)
+
+    Returns:
+        BatchWriteResult with counts over all series, or None on error
+    """
+    rows_by_series = to_series_rows(series)
+    rows = [row for series_rows in rows_by_series for row in series_rows]
+    if not rows:
+        return BatchWriteResult()
+
     try:
-        with Session(engine) as session:
-            # Check if record exists
-            statement = select(Actual).where(
-                Actual.time == time,
-                Actual.metric_id == metric_id,
-                Actual.scope_id == scope_id,
-            )
-            existing = session.exec(statement).first()
+        with Session(get_engine()) as session:
+            dialect = session.get_bind().dialect.name
 
-            if existing:
-                # Update existing record
-                existing.data = data
+            if (
+                dialect == "postgresql"
+                and len(rows) >= COPY_THRESHOLD
+                # COPY streaming needs psycopg2, other drivers use unnest
+                and session.get_bind().dialect.driver == "psycopg2"
+            ):
+                result = _copy_upsert(session, rows)
+            elif dialect == "postgresql":
+                inserted, updated = session.execute(
+                    UNNEST_UPSERT, unnest_parameters(rows)
+                ).one()
+                result = BatchWriteResult(inserted=inserted, updated=updated)
             else:
-                # Create new record
-                actual = Actual(
-                    time=time, data=data, metric_id=metric_id, scope_id=scope_id
-                )
-                session.add(actual)
+                result = BatchWriteResult()
+                for series_rows in rows_by_series:
+                    for start in range(0, len(series_rows), UPSERT_CHUNK_SIZE):
+                        chunk = series_rows[start : start + UPSERT_CHUNK_SIZE]
+                        inserted, updated = _upsert_chunk(session, dialect, chunk)
+                        result.inserted += inserted
+                        result.updated += updated
+
+            # Recompute only the rollup buckets holding the written points
+            if result.written:
+                for series_rows in rows_by_series:
+                    for statement in rollup_refresh_statements(dialect, series_rows):
+                        session.execute(statement)
 
             session.commit()
-            return True
-    except Exception as e:
-        print(f"Error saving data: {e}")
-        return False
+
+        result.unchanged = len(rows) - result.written
+        return result
+    except Exception:
+        logger.exception("Error saving batch")
+        return None
+
+
+def _upsert_chunk(
+    session: Session, dialect: str, rows: List[Dict[str, Any]]
+) -> tuple[int, int]:
+    """Upsert rows of one series without PostgreSQL and return (inserted, updated)"""
+    statement = upsert_statement(dialect, rows)
+
+    # Count the keys that already exist before writing
+    existing = session.execute(existing_count_statement(rows)).scalar_one()
+    written = len(session.execute(statement.returning(Actual.__table__.c.time)).all())
+    inserted = len(rows) - existing
+    return inserted, written - inserted
+
+
+def _copy_upsert(session: Session, rows: List[Dict[str, Any]]) -> BatchWriteResult:
+    """Stream rows into a temporary staging table with COPY, then upsert from it"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(
+            [row["time"].isoformat(), row["data"], row["metric_id"], row["scope_id"]]
+        )
+    buffer.seek(0)
+
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.execute(
+            "CREATE TEMP TABLE actual_staging "
+            "(LIKE public.actual INCLUDING DEFAULTS) ON COMMIT DROP"
+        )
+        cursor.copy_expert(
+            "COPY actual_staging (time, data, metric_id, scope_id) "
+            "FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+        cursor.execute(
+            counted_upsert_sql(
+                "SELECT time, data, metric_id, scope_id FROM actual_staging"
+            )
+        )
+        inserted, updated = cursor.fetchone()
+    finally:
+        cursor.close()
+
+    return BatchWriteResult(inserted=inserted, updated=updated)
 
 
 def get_recent_data(metric_id: UUID, scope_id: UUID, limit: int = 5) -> List[Actual]:
     """Get recent data points for a metric and scope"""
-    with Session(engine) as session:
-        statement = (
-            select(Actual)
-            .where(Actual.metric_id == metric_id, Actual.scope_id == scope_id)
-            .order_by(Actual.time.desc())
-            .limit(limit)
-        )
-        return session.exec(statement).all()
+    with Session(get_engine()) as session:
+        # Bounded by time first, so only recent partitions are scanned
+        recent = session.exec(
+            recent_data_statement(metric_id, scope_id, limit, recent_data_since())
+        ).all()
+        if len(recent) < limit:
+            recent = session.exec(
+                recent_data_statement(metric_id, scope_id, limit)
+            ).all()
+        return recent
+
+
+def query_series(
+    metric_id: UUID,
+    scope_id: UUID,
+    start: Any,
+    end: Any,
+    resolution: str = "raw",
+    limit: int = QUERY_PAGE_SIZE,
+    cursor: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Read one page of a series over [start, end), raw or downsampled
+
+    Aggregation runs in the database, and each bucket reports the min, max,
+    mean and last value of its rows. Buckets are aligned to the epoch, those
+    starting in [start, end) are returned whole, and 15-minute and hourly
+    buckets are read from the rollup table.
+
+    Args:
+        metric_id: Metric of the series
+        scope_id: Scope of the series
+        start: Start of the range (inclusive), datetime or ISO string
+        end: End of the range (exclusive), datetime or ISO string
+        resolution: One of QUERY_RESOLUTIONS ("raw", "5m", "15m", "1h")
+        limit: Maximum number of buckets per page
+        cursor: next_cursor of the previous page
+
+    Returns:
+        Dict with the resolution, the buckets in time order and next_cursor,
+        which is None on the last page
+    """
+    start, end, limit = series_query_window(start, end, resolution, limit, cursor)
+
+    with Session(get_engine()) as session:
+        dialect = session.get_bind().dialect.name
+        rows = session.execute(
+            series_query_statement(
+                dialect, metric_id, scope_id, start, end, resolution, limit
+            )
+        ).all()
+
+    return series_page(rows, resolution, limit)
+
+
+def rebuild_rollups(
+    start: Any,
+    end: Any,
+    metric_id: Optional[UUID] = None,
+    scope_id: Optional[UUID] = None,
+) -> int:
+    """
+    Recompute rollups from Actual rows for the buckets overlapping [start, end)
+
+    Existing rollup rows in the range are replaced, e.g. after loading data
+    that bypassed save_actual_batch or when introducing rollups over history.
+
+    Args:
+        start: Start of the range, datetime or ISO string
+        end: End of the range, datetime or ISO string
+        metric_id: Only rebuild this series (with scope_id), None for all
+        scope_id: Scope of the series to rebuild
+
+    Returns:
+        Number of rollup rows written
+    """
+    start, end = as_datetime(start), as_datetime(end)
+    rollup = ActualRollup.__table__
+    written = 0
+
+    with Session(get_engine()) as session:
+        dialect = session.get_bind().dialect.name
+
+        for resolution, seconds in ROLLUP_RESOLUTIONS.items():
+            bucket_start = bucket_floor(start, seconds)
+            bucket_end = bucket_ceil(end, seconds)
+
+            stale = delete(rollup).where(
+                rollup.c.resolution == resolution,
+                rollup.c.bucket >= bucket_start,
+                rollup.c.bucket < bucket_end,
+            )
+            if metric_id is not None:
+                stale = stale.where(
+                    rollup.c.metric_id == metric_id, rollup.c.scope_id == scope_id
+                )
+            session.execute(stale)
+
+            written += session.execute(
+                rollup_refresh_statement(
+                    dialect, resolution, bucket_start, bucket_end, metric_id, scope_id
+                )
+            ).rowcount
+
+        session.commit()
+
+    return written
@@ -0,0 +1,511 @@
+"""
+SQL statements over Actual and its rollups, shared by db_service and
+async_db_service
+
+Only builds statements and shapes their rows, executing them is up to the
+sync and async services.
+"""
+
+from sqlmodel import select
+from sqlalchemy import DateTime, Integer, Table, and_, cast, func, literal_column
+from sqlalchemy import bindparam, literal, text, true, type_coerce
+from sqlalchemy.dialects import postgresql, sqlite
+from db_models import Actual, ActualRollup
+from datetime import datetime, timedelta
+from uuid import UUID, uuid4
+from typing import Optional, List, Dict, Any, Iterable
+import os
+
+# Bucket widths in seconds of the query resolutions, None returns raw rows
+QUERY_RESOLUTIONS = {"raw": None, "5m": 300, "15m": 900, "1h": 3600}
+
+# Aggregates maintained in actual_rollup on every write, in bucket width seconds
+ROLLUP_RESOLUTIONS = {"15m": 900, "1h": 3600}
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Maximum number of buckets returned per query page
+QUERY_MAX_PAGE_SIZE = 10000
+
+# Reads of the latest rows look this far back first, so a partitioned table
+# only scans its recent partitions unless the series has gone quiet
+DB_RECENT_LOOKBACK_DAYS = int(os.getenv("DB_RECENT_LOOKBACK_DAYS", "7"))
+
+
+def dialect_insert(dialect: str, table: Table):
+    """INSERT construct supporting ON CONFLICT for the given dialect"""
+    if dialect == "postgresql":
+        return postgresql.insert(table)
+    if dialect == "sqlite":
+        return sqlite.insert(table)
+    raise ValueError(f"ON CONFLICT inserts not supported for {dialect}")
+
+
+def insert_named_statement(
+    dialect: str, table: Table, id_column: str, name: str, description: Optional[str]
+):
+    """INSERT of a named row returning its ID, or nothing if the name exists"""
+    return (
+        dialect_insert(dialect, table)
+        .values({id_column: uuid4(), "name": name, "description": description})
+        .on_conflict_do_nothing(index_elements=[table.c.name])
+        .returning(table.c[id_column])
+    )
+
+
+def select_id_statement(table: Table, id_column: str, name: str):
+    return select(table.c[id_column]).where(table.c.name == name)
+
+
+def as_datetime(value: Any) -> datetime:
+    """Accept datetimes as well as their ISO strings (e.g. after journaling)"""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def to_actual_rows(
+    points: Iterable[Dict[str, Any]], metric_id: UUID, scope_id: UUID
+) -> List[Dict[str, Any]]:
+    """Convert data points to Actual rows, the last value per timestamp wins"""
+    # ON CONFLICT cannot touch the same row twice within one statement
+    values_by_time = {}
+    for point in points:
+        values_by_time[as_datetime(point["timestamp"])] = point["value"]
+
+    return [
+        {"time": time, "data": data, "metric_id": metric_id, "scope_id": scope_id}
+        for time, data in sorted(values_by_time.items())
+    ]
+
+
+def to_series_rows(
+    series: Dict[tuple[UUID, UUID], Iterable[Dict[str, Any]]],
+) -> List[List[Dict[str, Any]]]:
+    """Actual rows of each non-empty series"""
+    rows_by_series = [
+        to_actual_rows(points, metric_id, scope_id)
+        for (metric_id, scope_id), points in series.items()
+    ]
+    return [rows for rows in rows_by_series if rows]
+
+
+def upsert_statement(dialect: str, rows: List[Dict[str, Any]]):
+    """INSERT ... ON CONFLICT DO UPDATE that skips rows whose value is unchanged"""
+    table = Actual.__table__
+
+    statement = dialect_insert(dialect, table).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.time, table.c.metric_id, table.c.scope_id],
+        set_={"data": statement.excluded.data},
+        where=table.c.data.is_distinct_from(statement.excluded.data),
+    )
+
+
+def existing_count_statement(rows: List[Dict[str, Any]]):
+    """Count the rows of one metric and scope that already exist"""
+    table = Actual.__table__
+    return (
+        select(func.count())
+        .select_from(table)
+        .where(
+            table.c.metric_id == rows[0]["metric_id"],
+            table.c.scope_id == rows[0]["scope_id"],
+            table.c.time.in_([row["time"] for row in rows]),
+        )
+    )
+
+
+def counted_upsert_sql(source: str) -> str:
+    """
+    PostgreSQL upsert of the rows selected by source, returning (inserted, updated)
+
+    Existing rows are counted on the snapshot the statement starts from,
+    since xmax cannot be returned from a partitioned table.
+    """
+    return f"""
+        WITH batch AS ({source}),
+        existing AS (
+            SELECT count(*) AS count
+            FROM public.actual JOIN batch USING (time, metric_id, scope_id)
+        ),
+        upserted AS (
+            INSERT INTO public.actual (time, data, metric_id, scope_id)
+            SELECT time, data, metric_id, scope_id FROM batch
+            ON CONFLICT (time, metric_id, scope_id) DO UPDATE
+            SET data = EXCLUDED.data
+            WHERE public.actual.data IS DISTINCT FROM EXCLUDED.data
+            RETURNING 1
+        ),
+        counts AS (
+            SELECT
+                (SELECT count(*) FROM batch) - existing.count AS inserted,
+                (SELECT count(*) FROM upserted) AS written
+            FROM existing
+        )
+        SELECT inserted, written - inserted FROM counts
+        """
+
+
+# One fixed statement for any batch size and number of series, so drivers
+# that prepare statements do so once instead of per distinct VALUES list
+UNNEST_UPSERT = text(counted_upsert_sql("""
+        SELECT time, data, metric_id, scope_id
+        FROM unnest(
+            CAST(:times AS timestamp[]),
+            CAST(:values AS float8[]),
+            CAST(:metric_ids AS uuid[]),
+            CAST(:scope_ids AS uuid[])
+        ) AS arrays (time, data, metric_id, scope_id)
+        """)).bindparams(
+    bindparam("metric_ids", type_=postgresql.ARRAY(postgresql.UUID(as_uuid=True))),
+    bindparam("scope_ids", type_=postgresql.ARRAY(postgresql.UUID(as_uuid=True))),
+)
+
+
+def unnest_parameters(rows: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """Column arrays of rows for UNNEST_UPSERT"""
+    return {
+        "times": [row["time"] for row in rows],
+        "values": [row["data"] for row in rows],
+        "metric_ids": [row["metric_id"] for row in rows],
+        "scope_ids": [row["scope_id"] for row in rows],
+    }
+
+
+def recent_data_statement(
+    metric_id: UUID, scope_id: UUID, limit: int, since: Optional[datetime] = None
+):
+    statement = select(Actual).where(
+        Actual.metric_id == metric_id, Actual.scope_id == scope_id
+    )
+    if since is not None:
+        statement = statement.where(Actual.time >= since)
+    return statement.order_by(Actual.time.desc()).limit(limit)
+
+
+def recent_data_since() -> datetime:
+    return datetime.now() - timedelta(days=DB_RECENT_LOOKBACK_DAYS)
+
+
+def bucket_expression(dialect: str, seconds: int):
+    """Start of the seconds-wide bucket holding Actual.time, aligned to the epoch"""
+    time_column = Actual.__table__.c.time
+    # Literal widths, so GROUP BY matches the selected expression exactly
+    width = literal_column(str(int(seconds)))
+
+    if dialect == "postgresql":
+        return func.date_bin(
+            literal_column(f"interval '{int(seconds)} seconds'"),
+            time_column,
+            literal_column("TIMESTAMP '1970-01-01'"),
+        )
+    if dialect == "sqlite":
+        epoch = cast(func.strftime("%s", time_column), Integer)
+        # Same text format SQLAlchemy stores datetimes in, so comparisons hold
+        bucket = func.datetime(epoch // width * width, "unixepoch")
+        return type_coerce(bucket.concat(".000000"), DateTime)
+    raise ValueError(f"Bucketed queries not supported for {dialect}")
+
+
+def series_query_window(
+    start: Any, end: Any, resolution: str, limit: int, cursor: Optional[str]
+) -> tuple[datetime, datetime, int]:
+    """Validate query arguments and return the (start, end, limit) of this page"""
+    if resolution not in QUERY_RESOLUTIONS:
+        raise ValueError(
+            f"Unknown resolution {resolution!r}, expected one of "
+            f"{', '.join(QUERY_RESOLUTIONS)}"
+        )
+    start, end = as_datetime(start), as_datetime(end)
+    limit = max(1, min(limit, QUERY_MAX_PAGE_SIZE))
+    seconds = QUERY_RESOLUTIONS[resolution]
+
+    # Buckets starting in [start, end) are returned whole
+    if seconds:
+        start, end = bucket_ceil(start, seconds), bucket_ceil(end, seconds)
+
+    # The cursor is the last bucket of the previous page, continue after it
+    if cursor is not None:
+        after = as_datetime(cursor) + (
+            timedelta(seconds=seconds) if seconds else timedelta(microseconds=1)
+        )
+        start = max(start, after)
+
+    return start, end, limit
+
+
+def series_query_statement(
+    dialect: str,
+    metric_id: UUID,
+    scope_id: UUID,
+    start: datetime,
+    end: datetime,
+    resolution: str,
+    limit: int,
+):
+    """
+    SELECT of one page of buckets in [start, end), fetching one extra row
+
+    Raw rows are (bucket, data). Downsampled rows are (bucket, min, max,
+    mean, count, last), read from actual_rollup for ROLLUP_RESOLUTIONS and
+    aggregated from Actual otherwise, where last is looked up by primary key
+    from the newest time of each bucket.
+    """
+    table = Actual.__table__
+    in_range = (
+        table.c.metric_id == metric_id,
+        table.c.scope_id == scope_id,
+        table.c.time >= start,
+        table.c.time < end,
+    )
+
+    seconds = QUERY_RESOLUTIONS[resolution]
+    if seconds is None:
+        return (
+            select(table.c.time.label("bucket"), table.c.data)
+            .where(*in_range)
+            .order_by(table.c.time)
+            .limit(limit + 1)
+        )
+
+    if resolution in ROLLUP_RESOLUTIONS:
+        rollup = ActualRollup.__table__
+        return (
+            select(
+                rollup.c.bucket,
+                rollup.c.min,
+                rollup.c.max,
+                (rollup.c.sum / rollup.c.count).label("mean"),
+                rollup.c.count,
+                rollup.c.last,
+            )
+            .where(
+                rollup.c.resolution == resolution,
+                rollup.c.metric_id == metric_id,
+                rollup.c.scope_id == scope_id,
+                rollup.c.bucket >= start,
+                rollup.c.bucket < end,
+            )
+            .order_by(rollup.c.bucket)
+            .limit(limit + 1)
+        )
+
+    bucket = bucket_expression(dialect, seconds).label("bucket")
+    buckets = (
+        select(
+            bucket,
+            func.min(table.c.data).label("min"),
+            func.max(table.c.data).label("max"),
+            func.avg(table.c.data).label("mean"),
+            func.count().label("count"),
+            func.max(table.c.time).label("last_time"),
+        )
+        .where(*in_range)
+        .group_by(bucket)
+        .order_by(bucket)
+        .limit(limit + 1)
+        .subquery()
+    )
+    latest = table.alias("latest")
+    return (
+        select(
+            buckets.c.bucket,
+            buckets.c.min,
+            buckets.c.max,
+            buckets.c.mean,
+            buckets.c.count,
+            latest.c.data.label("last"),
+        )
+        .join_from(
+            buckets,
+            latest,
+            and_(
+                latest.c.metric_id == metric_id,
+                latest.c.scope_id == scope_id,
+                latest.c.time == buckets.c.last_time,
+                # Lets a partitioned table prune the lookup side as well
+                latest.c.time >= start,
+                latest.c.time < end,
+            ),
+        )
+        .order_by(buckets.c.bucket)
+    )
+
+
+def series_page(rows: List[Any], resolution: str, limit: int) -> Dict[str, Any]:
+    """Shape query rows as buckets plus the cursor of the next page"""
+    page = rows[:limit]
+
+    if QUERY_RESOLUTIONS[resolution] is None:
+        buckets = [
+            {
+                "bucket": row.bucket.isoformat(),
+                "min": row.data,
+                "max": row.data,
+                "mean": row.data,
+                "last": row.data,
+                "count": 1,
+            }
+            for row in page
+        ]
+    else:
+        buckets = [
+            {
+                "bucket": as_datetime(row.bucket).isoformat(),
+                "min": row.min,
+                "max": row.max,
+                "mean": float(row.mean),
+                "last": row.last,
+                "count": row.count,
+            }
+            for row in page
+        ]
+
+    next_cursor = buckets[-1]["bucket"] if len(rows) > limit else None
+    return {"resolution": resolution, "buckets": buckets, "next_cursor": next_cursor}
+
+
+def bucket_floor(time: datetime, seconds: int) -> datetime:
+    """Start of the epoch-aligned bucket holding time"""
+    return _EPOCH + (time - _EPOCH) // timedelta(seconds=seconds) * timedelta(
+        seconds=seconds
+    )
+
+
+def bucket_ceil(time: datetime, seconds: int) -> datetime:
+    """First bucket start at or after time"""
+    floor = bucket_floor(time, seconds)
+    return floor if floor == time else floor + timedelta(seconds=seconds)
+
+
+def bucket_ranges(
+    times: Iterable[datetime], seconds: int
+) -> List[tuple[datetime, datetime]]:
+    """Merge the buckets holding times into contiguous [start, end) ranges"""
+    width = timedelta(seconds=seconds)
+    ranges = []
+
+    for bucket in sorted({bucket_floor(time, seconds) for time in times}):
+        if ranges and ranges[-1][1] == bucket:
+            ranges[-1] = (ranges[-1][0], bucket + width)
+        else:
+            ranges.append((bucket, bucket + width))
+
+    return ranges
+
+
+def rollup_refresh_statement(
+    dialect: str,
+    resolution: str,
+    start: datetime,
+    end: datetime,
+    metric_id: Optional[UUID] = None,
+    scope_id: Optional[UUID] = None,
+):
+    """
+    INSERT ... SELECT recomputing the rollup buckets in [start, end)
+
+    Covers one series, or every series when metric_id and scope_id are None.
+    start and end must be bucket aligned.
+    """
+    table = Actual.__table__
+    rollup = ActualRollup.__table__
+
+    in_range = [table.c.time >= start, table.c.time < end]
+    if metric_id is not None:
+        in_range += [table.c.metric_id == metric_id, table.c.scope_id == scope_id]
+
+    bucket = bucket_expression(dialect, ROLLUP_RESOLUTIONS[resolution]).label("bucket")
+    buckets = (
+        select(
+            table.c.metric_id,
+            table.c.scope_id,
+            bucket,
+            func.count().label("count"),
+            func.sum(table.c.data).label("sum"),
+            func.min(table.c.data).label("min"),
+            func.max(table.c.data).label("max"),
+            func.min(table.c.time).label("first_time"),
+            func.max(table.c.time).label("last_time"),
+        )
+        .where(*in_range)
+        .group_by(table.c.metric_id, table.c.scope_id, bucket)
+        .subquery()
+    )
+
+    # First and last values by primary key lookup of the bucket's edge rows
+    first_row, last_row = table.alias("first_row"), table.alias("last_row")
+    source = (
+        select(
+            literal(resolution),
+            buckets.c.metric_id,
+            buckets.c.scope_id,
+            buckets.c.bucket,
+            buckets.c.count,
+            buckets.c.sum,
+            buckets.c.min,
+            buckets.c.max,
+            first_row.c.data,
+            last_row.c.data,
+        )
+        .join_from(
+            buckets,
+            first_row,
+            and_(
+                first_row.c.time == buckets.c.first_time,
+                first_row.c.metric_id == buckets.c.metric_id,
+                first_row.c.scope_id == buckets.c.scope_id,
+                # Lets a partitioned table prune the lookup side as well
+                first_row.c.time >= start,
+                first_row.c.time < end,
+            ),
+        )
+        .join(
+            last_row,
+            and_(
+                last_row.c.time == buckets.c.last_time,
+                last_row.c.metric_id == buckets.c.metric_id,
+                last_row.c.scope_id == buckets.c.scope_id,
+                last_row.c.time >= start,
+                last_row.c.time < end,
+            ),
+        )
+        # SQLite needs a WHERE to tell ON CONFLICT apart from a join constraint
+        .where(true())
+    )
+
+    columns = [
+        "resolution",
+        "metric_id",
+        "scope_id",
+        "bucket",
+        "count",
+        "sum",
+        "min",
+        "max",
+        "first",
+        "last",
+    ]
+    statement = dialect_insert(dialect, rollup).from_select(columns, source)
+    return statement.on_conflict_do_update(
+        index_elements=[
+            rollup.c.resolution,
+            rollup.c.metric_id,
+            rollup.c.scope_id,
+            rollup.c.bucket,
+        ],
+        set_={column: statement.excluded[column] for column in columns[4:]},
+    )
+
+
+def rollup_refresh_statements(dialect: str, rows: List[Dict[str, Any]]):
+    """Statements recomputing every rollup bucket that holds one of rows"""
+    times = [row["time"] for row in rows]
+    metric_id, scope_id = rows[0]["metric_id"], rows[0]["scope_id"]
+
+    return [
+        rollup_refresh_statement(dialect, resolution, start, end, metric_id, scope_id)
+        for resolution, seconds in ROLLUP_RESOLUTIONS.items()
+        for start, end in bucket_ranges(times, seconds)
+    ]
@@ -0,0 +1,285 @@
+"""
+Streaming Parquet export of Actual time series
+
+Reads one metric and scope over a time range with a server-side cursor in
+fixed-size chunks and writes them to Parquet files partitioned by day:
+
+    <output>/metric=<metric>/scope=<scope>/date=<YYYY-MM-DD>/part-<first time>.parquet
+
+Only one chunk and one open file are held at a time, so memory stays flat
+for any range. Incremental exports continue after the last exported
+timestamp recorded in the series directory and only add new part files.
+Corrections of already exported minutes are not picked up incrementally,
+re-export those days in full instead: a full export replaces the part files
+of every day it writes, so its range should cover whole days.
+
+Usage:
+    python export_parquet.py exports --start 2025-01-01T00:00:00 --end 2025-02-01T00:00:00
+    python export_parquet.py exports --metric apg_imbalance --scope austria --incremental
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pydantic import BaseModel
+from sqlalchemy import select
+
+import db_service
+import db_statements
+from db_models import Actual, Metric, Scope
+from log_config import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched from the cursor and written per row group
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "50000"))
+
+EXPORT_SCHEMA = pa.schema(
+    [("time", pa.timestamp("us")), ("value", pa.float64())],
+    metadata={"source": "public.actual"},
+)
+
+STATE_FILE = "_export_state.json"
+
+
+class ExportReport(BaseModel):
+    rows: int = 0
+    files: int = 0
+    last_time: Optional[datetime] = None
+    elapsed_seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        if self.elapsed_seconds <= 0:
+            return 0.0
+        return self.rows / self.elapsed_seconds
+
+
+def series_directory(output: str, metric_name: str, scope_name: str) -> str:
+    return os.path.join(output, f"metric={metric_name}", f"scope={scope_name}")
+
+
+def read_last_exported(directory: str) -> Optional[datetime]:
+    """Last timestamp written by a previous export of the series, if any"""
+    path = os.path.join(directory, STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return datetime.fromisoformat(json.load(f)["last_time"])
+
+
+def write_last_exported(directory: str, last_time: datetime) -> None:
+    """Atomically record the last exported timestamp of the series"""
+    path = os.path.join(directory, STATE_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"last_time": last_time.isoformat()}, f)
+    os.replace(tmp_path, path)
+
+
+def remove_day_parts(directory: str, day: date) -> None:
+    """Delete the part files of an exported day before it is written again"""
+    day_directory = os.path.join(directory, f"date={day.isoformat()}")
+    if not os.path.isdir(day_directory):
+        return
+    for name in os.listdir(day_directory):
+        if name.endswith(".parquet"):
+            os.remove(os.path.join(day_directory, name))
+
+
+class _DayWriter:
+    """
+    Parquet file of one day, renamed into place once complete
+
+    A run that dies mid-file leaves only a .tmp file behind, which the next
+    run overwrites.
+    """
+
+    def __init__(self, directory: str, day: date, first_time: datetime):
+        day_directory = os.path.join(directory, f"date={day.isoformat()}")
+        os.makedirs(day_directory, exist_ok=True)
+        self.day = day
+        self.path = os.path.join(
+            day_directory, f"part-{first_time:%Y%m%dT%H%M%S}.parquet"
+        )
+        self.writer = pq.ParquetWriter(f"{self.path}.tmp", EXPORT_SCHEMA)
+
+    def write(self, times: List[datetime], values: List[float]) -> None:
+        self.writer.write_table(
+            pa.Table.from_arrays(
+                [
+                    pa.array(times, type=pa.timestamp("us")),
+                    pa.array(values, type=pa.float64()),
+                ],
+                schema=EXPORT_SCHEMA,
+            )
+        )
+
+    def close(self) -> None:
+        self.writer.close()
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+def _series_ids(metric_name: str, scope_name: str) -> tuple[Any, Any]:
+    """Look up existing metric and scope IDs without creating them"""
+    with db_service.get_engine().connect() as connection:
+        metric_id = connection.execute(
+            db_statements.select_id_statement(
+                Metric.__table__, "metric_id", metric_name
+            )
+        ).scalar_one_or_none()
+        scope_id = connection.execute(
+            db_statements.select_id_statement(Scope.__table__, "scope_id", scope_name)
+        ).scalar_one_or_none()
+
+    if metric_id is None or scope_id is None:
+        raise ValueError(f"Unknown series {metric_name}/{scope_name}")
+    return metric_id, scope_id
+
+
+def export_series(
+    output: str,
+    metric_name: str,
+    scope_name: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    incremental: bool = False,
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+) -> ExportReport:
+    """
+    Export a series over [start, end) to day-partitioned Parquet files
+
+    Args:
+        output: Root directory of the export
+        metric_name: Metric of the series
+        scope_name: Scope of the series
+        start: Start of the range (inclusive), None for the first row
+        end: End of the range (exclusive), None for the last row
+        incremental: Only export rows after the last exported timestamp
+        chunk_rows: Rows fetched from the cursor and written at a time
+
+    Returns:
+        ExportReport with the rows and files written
+    """
+    started = time.perf_counter()
+    directory = series_directory(output, metric_name, scope_name)
+    metric_id, scope_id = _series_ids(metric_name, scope_name)
+
+    table = Actual.__table__
+    statement = select(table.c.time, table.c.data).where(
+        table.c.metric_id == metric_id, table.c.scope_id == scope_id
+    )
+    if start is not None:
+        statement = statement.where(table.c.time >= start)
+    if end is not None:
+        statement = statement.where(table.c.time < end)
+
+    last_exported = read_last_exported(directory)
+    if incremental and last_exported is not None:
+        statement = statement.where(table.c.time > last_exported)
+
+    # A full export only moves the recorded timestamp forward, and only when
+    # it continues the exported range, so incremental runs neither repeat
+    # rows nor skip a gap before it
+    advances_state = (
+        incremental
+        or start is None
+        or (last_exported is not None and start <= last_exported)
+    )
+
+    report = ExportReport()
+    day_writer: Optional[_DayWriter] = None
+
+    def finish_day():
+        day_writer.close()
+        report.files += 1
+        if advances_state and (
+            last_exported is None or report.last_time > last_exported
+        ):
+            write_last_exported(directory, report.last_time)
+
+    # yield_per streams through a server-side cursor on PostgreSQL
+    with db_service.get_engine().connect() as connection:
+        result = connection.execution_options(yield_per=chunk_rows).execute(
+            statement.order_by(table.c.time)
+        )
+        try:
+            for chunk in result.partitions():
+                index = 0
+                while index < len(chunk):
+                    day = chunk[index][0].date()
+                    if day_writer is not None and day_writer.day != day:
+                        finish_day()
+                        day_writer = None
+                    if day_writer is None:
+                        if not incremental:
+                            remove_day_parts(directory, day)
+                        day_writer = _DayWriter(directory, day, chunk[index][0])
+
+                    # Rows of this day within the chunk (rows are time ordered)
+                    day_end = datetime.combine(
+                        day + timedelta(days=1), datetime.min.time()
+                    )
+                    stop = index
+                    while stop < len(chunk) and chunk[stop][0] < day_end:
+                        stop += 1
+
+                    rows = chunk[index:stop]
+                    day_writer.write([row[0] for row in rows], [row[1] for row in rows])
+                    report.rows += len(rows)
+                    report.last_time = rows[-1][0]
+                    index = stop
+
+            if day_writer is not None:
+                finish_day()
+        finally:
+            result.close()
+
+    report.elapsed_seconds = time.perf_counter() - started
+    return report
+
+
+if __name__ == "__main__":
+    configure_logging()
+
+    parser = argparse.ArgumentParser(description="Export a series to Parquet")
+    parser.add_argument("output", help="Root directory of the export")
+    parser.add_argument("--metric", default="apg_imbalance")
+    parser.add_argument("--scope", default="austria")
+    parser.add_argument("--start", type=datetime.fromisoformat)
+    parser.add_argument("--end", type=datetime.fromisoformat)
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Continue after the last exported timestamp",
+    )
+    parser.add_argument("--chunk-rows", type=int, default=EXPORT_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    if args.start is None and not args.incremental:
+        parser.error("--start is required unless exporting incrementally")
+
+    report = export_series(
+        args.output,
+        args.metric,
+        args.scope,
+        args.start,
+        args.end,
+        incremental=args.incremental,
+        chunk_rows=args.chunk_rows,
+    )
+    logger.info(
+        "Exported %d rows to %d files in %.1f s (%.0f rows/s), last time %s",
+        report.rows,
+        report.files,
+        report.elapsed_seconds,
+        report.rows_per_second,
+        report.last_time,
+    )
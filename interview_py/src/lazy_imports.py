@@ -0,0 +1,32 @@
+import importlib
+import importlib.util
+import os
+import sys
+from types import ModuleType
+
+# Startup mode: "1" defers executing heavy modules until their first use,
+# "0" imports everything eagerly (e.g. to surface import errors at boot)
+LAZY_IMPORTS = os.getenv("LAZY_IMPORTS", "1") != "0"
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Import a module whose body only runs on first attribute access
+
+    Only use the returned module via attribute access (module.func), a
+    "from module import name" elsewhere loads it immediately.
+    """
+    module = sys.modules.get(name)
+    if module is not None or not LAZY_IMPORTS:
+        return module or importlib.import_module(name)
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -1,25 +1,40 @@
 import restate
 import logging
-from db_service import init_db
+import metrics
+from log_config import configure_logging
+from metrics import with_metrics_endpoint
 from restate_service import (
     apg_etl_service,
     data_processor,
     time_series_object,
     health_service,
+    query_service,
 )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# Configure logging: records are written by a background thread, per-point
+# lines are sampled and discarded records are counted in /metrics
+configure_logging(
+    on_discard=lambda reason: metrics.LOG_RECORDS_DISCARDED.inc(reason=reason)
 )
 logger = logging.getLogger(__name__)
 
-# Create Restate app with all services
-app = restate.app(
-    services=[apg_etl_service, data_processor, time_series_object, health_service]
+# Create Restate app with all services, plus a Prometheus /metrics endpoint
+app = with_metrics_endpoint(
+    restate.app(
+        services=[
+            apg_etl_service,
+            data_processor,
+            time_series_object,
+            health_service,
+            query_service,
+        ]
+    )
 )
 
 if __name__ == "__main__":
+    # Only needed here, workers create the engine on first use
+    from db_service import init_db
+
     # Initialize database
     logger.info("Initializing database...")
     init_db()
@@ -0,0 +1,76 @@
+"""
+Maintain the monthly (or daily) partitions of public.actual
+
+Pre-creates upcoming partitions and retires those older than the retention
+(DB_PARTITION_* settings). Run it daily, e.g. from cron. With --migrate an
+existing unpartitioned table is converted first, in chunks.
+
+Usage:
+    python maintain_partitions.py
+    python maintain_partitions.py --migrate --chunk-hours 24
+    python maintain_partitions.py --retention-days 730 --action drop
+"""
+
+import argparse
+import logging
+import time
+
+import db_service
+from log_config import configure_logging
+
+logger = logging.getLogger(__name__)
+
+
+if __name__ == "__main__":
+    configure_logging()
+
+    parser = argparse.ArgumentParser(description="Maintain Actual partitions")
+    parser.add_argument(
+        "--migrate",
+        action="store_true",
+        help="Convert an unpartitioned table to a partitioned one first",
+    )
+    parser.add_argument(
+        "--chunk-hours", type=int, default=db_service.DB_MIGRATION_CHUNK_HOURS
+    )
+    parser.add_argument(
+        "--interval",
+        choices=db_service.PARTITION_INTERVALS,
+        default=db_service.DB_PARTITION_INTERVAL,
+    )
+    parser.add_argument("--premake", type=int, default=db_service.DB_PARTITION_PREMAKE)
+    parser.add_argument(
+        "--retention-days",
+        type=int,
+        default=db_service.DB_PARTITION_RETENTION_DAYS,
+        help="Retire partitions ending this many days ago, 0 keeps all",
+    )
+    parser.add_argument(
+        "--action",
+        choices=("detach", "drop"),
+        default=db_service.DB_PARTITION_RETENTION_ACTION,
+    )
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.migrate:
+        moved = db_service.migrate_actual_to_partitioned(
+            args.chunk_hours, args.interval
+        )
+        logger.info(
+            "Moved %d rows into the partitioned table in %.1f s",
+            moved,
+            time.perf_counter() - started,
+        )
+
+    result = db_service.maintain_partitions(
+        interval=args.interval,
+        premake=args.premake,
+        retention_days=args.retention_days,
+        action=args.action,
+    )
+    logger.info(
+        "Partitions created: %s, retired: %s",
+        ", ".join(result["created"]) or "none",
+        ", ".join(result["retired"]) or "none",
+    )
@@ -0,0 +1,339 @@
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from sub-millisecond state work to slow API calls
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _label_key(labelnames: Sequence[str], labels: Dict[str, str]) -> Tuple[str, ...]:
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: Sequence[str], key: Tuple[str, ...], **extra) -> str:
+    pairs = list(zip(labelnames, key)) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, optionally split by labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(self.labelnames, labels), 0)
+
+    def snapshot(self) -> Any:
+        return _snapshot_by_labels(self.labelnames, dict(self._values))
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Fixed-bucket distribution of observed values (e.g. latencies in seconds)"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label key: [bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(self.labelnames, labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = ([0] * (len(self.buckets) + 1), [0.0])
+                self._series[key] = series
+            series[0][index] += 1
+            series[1][0] += value
+
+    def time(self, **labels) -> "_Timer":
+        """Context manager observing the elapsed wall-clock time"""
+        return _Timer(self, labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(_label_key(self.labelnames, labels))
+        return sum(series[0]) if series else 0
+
+    def snapshot(self) -> Any:
+        summaries = {}
+        for key, (counts, total) in self._series.items():
+            observations = sum(counts)
+            summaries[key] = {
+                "count": observations,
+                "sum": total[0],
+                "mean": total[0] / observations if observations else 0.0,
+                "p50": self._quantile(counts, 0.5),
+                "p99": self._quantile(counts, 0.99),
+            }
+        return _snapshot_by_labels(self.labelnames, summaries)
+
+    def _quantile(self, counts: List[int], quantile: float) -> Optional[float]:
+        """Upper bound of the bucket holding the quantile (None beyond the last)"""
+        observations = sum(counts)
+        if not observations:
+            return None
+        rank = quantile * observations
+        cumulative = 0
+        for index, count in enumerate(counts[:-1]):
+            cumulative += count
+            if cumulative >= rank:
+                return self.buckets[index]
+        return None
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for key, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, le=bound)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            cumulative += counts[-1]
+            labels = _format_labels(self.labelnames, key, le="+Inf")
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total[0]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+def _snapshot_by_labels(labelnames: Sequence[str], values: Dict[Tuple, Any]) -> Any:
+    if not labelnames:
+        return values.get((), 0)
+    return {",".join(key): value for key, value in sorted(values.items())}
+
+
+class MetricsRegistry:
+    """In-process collection of metrics, rendered as JSON or Prometheus text"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """All metrics as a JSON-serializable dict"""
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def render_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# ETL pipeline metrics
+STAGE_DURATION = registry.histogram(
+    "etl_stage_duration_seconds", "Duration of ETL pipeline stages", ["stage"]
+)
+POINTS_FETCHED = registry.counter(
+    "etl_points_fetched_total", "Data points decoded from APG responses"
+)
+POINTS_SKIPPED = registry.counter(
+    "etl_points_skipped_total", "Fetched data points skipped as already stored"
+)
+POINTS_SAVED = registry.counter(
+    "etl_points_saved_total", "Validated data points written to the database"
+)
+VALIDATION_REJECTIONS = registry.counter(
+    "etl_validation_rejections_total", "Data points rejected by reason", ["reason"]
+)
+ROWS_WRITTEN = registry.counter(
+    "etl_db_rows_total", "Rows handled by batch writes by outcome", ["outcome"]
+)
+LAST_SUCCESS = registry.gauge(
+    "etl_last_success_timestamp_seconds", "Unix time of the last successful write"
+)
+LOG_RECORDS_DISCARDED = registry.counter(
+    "log_records_discarded_total",
+    "Log records sampled out or dropped on a full queue",
+    ["reason"],
+)
+
+
+def rejection_reason(reason: Optional[str]) -> str:
+    """Map a validation reason message to a low-cardinality label"""
+    if not reason:
+        return "unknown"
+    if reason.startswith("Missing value"):
+        return "missing_value"
+    if reason.startswith("Missing timestamp"):
+        return "missing_timestamp"
+    if "outside acceptable range" in reason:
+        return "out_of_range"
+    if reason.startswith("Suspicious jump"):
+        return "jump"
+    if reason.startswith("Z-score"):
+        return "zscore"
+    if reason.startswith("Rate of change"):
+        return "rate_of_change"
+    if reason == "Database error":
+        return "database_error"
+    return "other"
+
+
+def record_validation(results):
+    """Count rejected ValidationResults by reason and pass the results through"""
+    for result in results:
+        if not result.is_valid:
+            VALIDATION_REJECTIONS.inc(reason=rejection_reason(result.reason))
+    return results
+
+
+def record_write(result):
+    """Count the outcome of a batch write and pass the result through"""
+    if result is not None:
+        ROWS_WRITTEN.inc(result.inserted, outcome="inserted")
+        ROWS_WRITTEN.inc(result.updated, outcome="updated")
+        ROWS_WRITTEN.inc(result.unchanged, outcome="unchanged")
+        POINTS_SAVED.inc(result.inserted + result.updated + result.unchanged)
+        LAST_SUCCESS.set(time.time())
+    return result
+
+
+def instrument(stage: str, action: Callable[[], Any]) -> Callable[[], Any]:
+    """Wrap a ctx.run action so its duration is recorded under stage"""
+    if inspect.iscoroutinefunction(action):
+
+        async def timed_async():
+            with STAGE_DURATION.time(stage=stage):
+                return await action()
+
+        return timed_async
+
+    def timed():
+        with STAGE_DURATION.time(stage=stage):
+            return action()
+
+    return timed
+
+
+def with_metrics_endpoint(app, path: str = "/metrics"):
+    """Wrap an ASGI app so GET path serves the registry in Prometheus format"""
+
+    async def metrics_app(scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == path:
+            body = registry.render_prometheus().encode()
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": [
+                        (b"content-type", b"text/plain; version=0.0.4; charset=utf-8"),
+                        (b"content-length", str(len(body)).encode()),
+                    ],
+                }
+            )
+            await send({"type": "http.response.body", "body": body})
+            return
+        await app(scope, receive, send)
+
+    return metrics_app
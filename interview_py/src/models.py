@@ -1,8 +1,20 @@
 from pydantic import BaseModel, Field
-from sqlmodel import SQLModel, Field as SQLField
 from typing import List, Optional, Dict, Any
-from uuid import UUID, uuid4
-from datetime import datetime
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+
+@lru_cache(maxsize=4096)
+def parse_apg_date(date: str) -> datetime:
+    """Parse an APG date (DD.MM.YYYY) to midnight of that day, memoized per date"""
+    day, month, year = date.split(".")
+    return datetime(int(year), int(month), int(day))
+
+
+def parse_apg_minutes(time: str) -> int:
+    """Convert an APG time of day (HH:MM) to minutes of the day"""
+    hours, minutes = time.split(":")
+    return int(hours) * 60 + int(minutes)
 
 
 # API response models
@@ -22,19 +34,17 @@ class ValueRow(BaseModel):
     @property
     def minutes_from(self) -> int:
         """Convert TF time to minutes of the day"""
-        hours, minutes = map(int, self.TF.split(":"))
-        return hours * 60 + minutes
+        return parse_apg_minutes(self.TF)
 
     @property
     def minutes_to(self) -> int:
         """Convert TT time to minutes of the day"""
-        hours, minutes = map(int, self.TT.split(":"))
-        return hours * 60 + minutes
+        return parse_apg_minutes(self.TT)
 
     @property
     def timestamp(self) -> datetime:
         """Convert DF and TF to datetime"""
-        return datetime.strptime(f"{self.DF} {self.TF}", "%d.%m.%Y %H:%M")
+        return parse_apg_date(self.DF) + timedelta(minutes=self.minutes_from)
 
 
 class ValueColumn(BaseModel):
@@ -51,35 +61,6 @@ class ImbalanceResponse(BaseModel):
     ResponseData: ResponseData
 
 
-# Database models
-class Metric(SQLModel, table=True):
-    __tablename__ = "metric"
-    __table_args__ = {"schema": "public"}
-
-    metric_id: UUID = SQLField(default_factory=uuid4, primary_key=True)
-    name: str = SQLField(index=True)
-    description: Optional[str] = None
-
-
-class Scope(SQLModel, table=True):
-    __tablename__ = "scope"
-    __table_args__ = {"schema": "public"}
-
-    scope_id: UUID = SQLField(default_factory=uuid4, primary_key=True)
-    name: str = SQLField(index=True)
-    description: Optional[str] = None
-
-
-class Actual(SQLModel, table=True):
-    __tablename__ = "actual"
-    __table_args__ = {"schema": "public"}
-
-    time: datetime = SQLField(primary_key=True)
-    data: float
-    metric_id: UUID = SQLField(foreign_key="public.metric.metric_id", primary_key=True)
-    scope_id: UUID = SQLField(foreign_key="public.scope.scope_id", primary_key=True)
-
-
 # Restate service request/response models
 class FetchDataRequest(BaseModel):
     start_date: str
@@ -92,7 +73,47 @@ class ProcessDataRequest(BaseModel):
     data_point: Dict[str, Any]
 
 
+class ProcessWindowRequest(BaseModel):
+    metric_name: str = "apg_imbalance"
+    scope_name: str = "austria"
+    data_points: List[Dict[str, Any]]
+
+
+class SeriesQueryRequest(BaseModel):
+    metric_name: str = "apg_imbalance"
+    scope_name: str = "austria"
+    start: str  # ISO timestamp, inclusive
+    end: str  # ISO timestamp, exclusive
+    resolution: str = "raw"  # raw, 5m, 15m or 1h
+    limit: int = 1000
+    cursor: Optional[str] = None  # next_cursor of the previous page
+
+
 class ValidationResult(BaseModel):
     is_valid: bool
     reason: Optional[str] = None
     processed_data: Optional[Dict[str, Any]] = None
+
+
+class BatchWriteResult(BaseModel):
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+
+    @property
+    def written(self) -> int:
+        """Number of rows actually touched by the write"""
+        return self.inserted + self.updated
+
+
+# Database models live in db_models so that importing the API and request
+# models does not pull in SQLModel/SQLAlchemy
+_DB_MODELS = {"Metric", "Scope", "Actual", "ActualRollup"}
+
+
+def __getattr__(name: str):
+    if name in _DB_MODELS:
+        import db_models
+
+        return getattr(db_models, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,52 @@
+"""
+Rebuild the 15-minute and hourly rollups of Actual data
+
+Rollups are maintained on every write; rebuild them for a range after
+loading data that bypassed db_service, or once over existing history.
+
+Usage:
+    python rebuild_rollups.py 2024-01-01T00:00:00 2025-01-01T00:00:00
+    python rebuild_rollups.py 2025-05-01T00:00:00 2025-05-02T00:00:00 \\
+        --metric apg_imbalance --scope austria
+"""
+
+import argparse
+import logging
+import time
+from datetime import datetime
+
+import db_service
+from log_config import configure_logging
+
+logger = logging.getLogger(__name__)
+
+
+if __name__ == "__main__":
+    configure_logging()
+
+    parser = argparse.ArgumentParser(description="Rebuild Actual rollups")
+    parser.add_argument("start", type=datetime.fromisoformat)
+    parser.add_argument("end", type=datetime.fromisoformat)
+    parser.add_argument("--metric", help="Metric name, all series if omitted")
+    parser.add_argument("--scope", help="Scope name, required with --metric")
+    args = parser.parse_args()
+
+    if bool(args.metric) != bool(args.scope):
+        parser.error("--metric and --scope must be given together")
+
+    db_service.init_db()
+
+    metric_id = scope_id = None
+    if args.metric:
+        metric_id = db_service.get_metric_id(args.metric)
+        scope_id = db_service.get_scope_id(args.scope)
+
+    started = time.perf_counter()
+    written = db_service.rebuild_rollups(args.start, args.end, metric_id, scope_id)
+    logger.info(
+        "Rebuilt %d rollup rows for %s - %s in %.1f s",
+        written,
+        args.start,
+        args.end,
+        time.perf_counter() - started,
+    )
@@ -0,0 +1,315 @@
+"""
+On-disk cache of raw APG responses per aligned time bucket
+
+A requested range is split into fixed buckets (e.g. hours since midnight).
+Cached buckets are served from disk and only runs of missing buckets go to
+the network, one request per run, whose response is split back into bucket
+files. Buckets that ended more than APG_CACHE_SETTLE_MINUTES ago and hold
+a row for every APG_CACHE_ROW_MINUTES are immutable and memory-mapped on
+read. Newer buckets can still receive late corrections and incomplete ones
+can still be published, so they expire after APG_CACHE_OPEN_TTL_SECONDS.
+The directory
+is bounded to APG_CACHE_MAX_BYTES by evicting the least recently used
+bucket files.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+import mmap
+import os
+import threading
+import time
+
+import orjson
+
+import metrics
+from models import parse_apg_date, parse_apg_minutes
+
+# Directory of the cache, the cache is disabled when unset
+APG_CACHE_DIR = os.getenv("APG_CACHE_DIR")
+APG_CACHE_BUCKET_MINUTES = int(os.getenv("APG_CACHE_BUCKET_MINUTES", "60"))
+APG_CACHE_MAX_BYTES = int(os.getenv("APG_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+APG_CACHE_OPEN_TTL_SECONDS = float(os.getenv("APG_CACHE_OPEN_TTL_SECONDS", "30"))
+
+# APG corrects recent minutes for a while (see WATERMARK_OVERLAP_MINUTES)
+APG_CACHE_SETTLE_MINUTES = int(os.getenv("APG_CACHE_SETTLE_MINUTES", "15"))
+
+# Resolution of the APG rows (PT1M), a complete bucket has one row per step
+APG_CACHE_ROW_MINUTES = int(os.getenv("APG_CACHE_ROW_MINUTES", "1"))
+
+_FILE_TIME_FORMAT = "%Y%m%dT%H%M"
+
+CACHE_LOOKUPS = metrics.registry.counter(
+    "apg_cache_lookups_total", "APG response cache bucket lookups", ["result"]
+)
+CACHE_EVICTIONS = metrics.registry.counter(
+    "apg_cache_evictions_total", "Bucket files evicted from the APG response cache"
+)
+
+# A bucket to fetch or read: [start, end, path of a usable file or None]
+_Bucket = List[Any]
+
+
+class ResponseCache:
+    """Size-bounded LRU cache of APG responses, one file per time bucket"""
+
+    def __init__(
+        self,
+        directory: str,
+        bucket_minutes: int = APG_CACHE_BUCKET_MINUTES,
+        max_bytes: int = APG_CACHE_MAX_BYTES,
+        open_ttl_seconds: float = APG_CACHE_OPEN_TTL_SECONDS,
+        settle_minutes: int = APG_CACHE_SETTLE_MINUTES,
+        row_minutes: int = APG_CACHE_ROW_MINUTES,
+        clock: Callable[[], datetime] = datetime.now,
+    ):
+        self.directory = directory
+        self.bucket = timedelta(minutes=bucket_minutes)
+        self.max_bytes = max_bytes
+        self.open_ttl_seconds = open_ttl_seconds
+        self.settle = timedelta(minutes=settle_minutes)
+        self.expected_rows = bucket_minutes // row_minutes
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        # File name -> size, least recently used first
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.name.endswith(".json"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        self._files = OrderedDict((name, size) for _, name, size in sorted(entries))
+        self._size = sum(self._files.values())
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
+
+    def _bucket_start(self, timestamp: datetime) -> datetime:
+        midnight = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+        return midnight + (timestamp - midnight) // self.bucket * self.bucket
+
+    def _file_name(self, bucket_start: datetime, closed: bool) -> str:
+        minutes = int(self.bucket.total_seconds() // 60)
+        suffix = "" if closed else ".open"
+        return f"{bucket_start.strftime(_FILE_TIME_FORMAT)}-{minutes}{suffix}.json"
+
+    def _is_closed(self, bucket_end: datetime) -> bool:
+        return bucket_end <= self.clock() - self.settle
+
+    def _lookup(self, bucket_start: datetime, bucket_end: datetime) -> Optional[str]:
+        """Path of a usable cached file for the bucket, counting hits and misses"""
+        closed = self._is_closed(bucket_end)
+
+        with self._lock:
+            # A settled bucket stays open while its response is incomplete
+            name = self._file_name(bucket_start, True)
+            if not closed or name not in self._files:
+                closed = False
+                name = self._file_name(bucket_start, False)
+            path = os.path.join(self.directory, name)
+
+            usable = name in self._files
+            if usable and not closed:
+                try:
+                    age = time.time() - os.stat(path).st_mtime
+                    usable = age < self.open_ttl_seconds
+                except FileNotFoundError:
+                    usable = False
+            if usable:
+                self._files.move_to_end(name)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        CACHE_LOOKUPS.inc(result="hit" if usable else "miss")
+        return path if usable else None
+
+    def _plan(self, start: datetime, end: datetime) -> List[_Bucket]:
+        buckets = []
+        bucket_start = self._bucket_start(start)
+        while bucket_start < end:
+            bucket_end = bucket_start + self.bucket
+            buckets.append(
+                [bucket_start, bucket_end, self._lookup(bucket_start, bucket_end)]
+            )
+            bucket_start = bucket_end
+        return buckets
+
+    @staticmethod
+    def _missing_runs(buckets: List[_Bucket]) -> List[Tuple[datetime, datetime]]:
+        """Contiguous ranges of uncached buckets, each fetched with one request"""
+        runs = []
+        for bucket_start, bucket_end, path in buckets:
+            if path is not None:
+                continue
+            if runs and runs[-1][1] == bucket_start:
+                runs[-1] = (runs[-1][0], bucket_end)
+            else:
+                runs.append((bucket_start, bucket_end))
+        return runs
+
+    def store(
+        self, start: datetime, end: datetime, content: bytes
+    ) -> Dict[datetime, bytes]:
+        """
+        Split a response for the bucket-aligned range [start, end) into buckets
+
+        Returns:
+            The stored body of each bucket by bucket start
+        """
+        response_data = orjson.loads(content)["ResponseData"]
+
+        rows_by_bucket = {}
+        for row in response_data["ValueRows"]:
+            timestamp = parse_apg_date(row["DF"]) + timedelta(
+                minutes=parse_apg_minutes(row["TF"])
+            )
+            rows_by_bucket.setdefault(self._bucket_start(timestamp), []).append(row)
+
+        bodies = {}
+        bucket_start = start
+        while bucket_start < end:
+            bucket_end = bucket_start + self.bucket
+            rows = rows_by_bucket.get(bucket_start, [])
+            body = orjson.dumps({"ResponseData": dict(response_data, ValueRows=rows)})
+            # Gaps and empty responses are fetched again once the TTL expires
+            closed = self._is_closed(bucket_end) and len(rows) >= self.expected_rows
+            self._write(self._file_name(bucket_start, closed), body)
+            if closed:
+                self._remove(self._file_name(bucket_start, False))
+            bodies[bucket_start] = body
+            bucket_start = bucket_end
+        return bodies
+
+    def _write(self, name: str, body: bytes) -> None:
+        path = os.path.join(self.directory, name)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(body)
+        os.replace(temporary, path)
+
+        with self._lock:
+            self._size += len(body) - self._files.pop(name, 0)
+            self._files[name] = len(body)
+            evicted = []
+            while self._size > self.max_bytes and len(self._files) > 1:
+                old_name, old_size = self._files.popitem(last=False)
+                self._size -= old_size
+                evicted.append(old_name)
+            self.evictions += len(evicted)
+
+        for old_name in evicted:
+            try:
+                os.remove(os.path.join(self.directory, old_name))
+            except FileNotFoundError:
+                pass
+        if evicted:
+            CACHE_EVICTIONS.inc(len(evicted))
+
+    def _remove(self, name: str) -> None:
+        """Drop a bucket file, e.g. the open file of a bucket that is now closed"""
+        with self._lock:
+            if name not in self._files:
+                return
+            self._size -= self._files.pop(name)
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def _read(self, path: str) -> Iterator[Any]:
+        """Cached bucket body, memory-mapped for immutable buckets"""
+        with open(path, "rb") as f:
+            if path.endswith(".open.json"):
+                yield f.read()
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    yield view
+                finally:
+                    view.release()
+
+    def _decode_cached(
+        self, buckets: List[_Bucket], decode: Callable[[Any], List[Any]]
+    ) -> Dict[datetime, List[Any]]:
+        """Decode the cached buckets, marking files removed meanwhile as missing"""
+        decoded = {}
+        for bucket in buckets:
+            if bucket[2] is None:
+                continue
+            try:
+                with self._read(bucket[2]) as body:
+                    decoded[bucket[0]] = decode(body)
+            except FileNotFoundError:
+                bucket[2] = None
+        return decoded
+
+    @staticmethod
+    def _in_order(
+        buckets: List[_Bucket], decoded: Dict[datetime, List[Any]]
+    ) -> List[Any]:
+        return [item for bucket in buckets for item in decoded[bucket[0]]]
+
+    def fetch(
+        self,
+        start: datetime,
+        end: datetime,
+        fetch: Callable[[datetime, datetime], bytes],
+        decode: Callable[[Any], List[Any]],
+    ) -> List[Any]:
+        """
+        Decoded items of every bucket overlapping [start, end)
+
+        Args:
+            start: Start of the requested range
+            end: End of the requested range (exclusive)
+            fetch: Downloads the raw response for a bucket-aligned range
+            decode: Turns a response body (bytes or memoryview) into items
+
+        Returns:
+            Items of all overlapping buckets in time order, which can reach
+            beyond [start, end) at the edges
+        """
+        buckets = self._plan(start, end)
+        decoded = self._decode_cached(buckets, decode)
+        for run_start, run_end in self._missing_runs(buckets):
+            bodies = self.store(run_start, run_end, fetch(run_start, run_end))
+            for bucket_start, body in bodies.items():
+                decoded[bucket_start] = decode(body)
+        return self._in_order(buckets, decoded)
+
+    async def fetch_async(
+        self,
+        start: datetime,
+        end: datetime,
+        fetch: Callable[[datetime, datetime], Awaitable[bytes]],
+        decode: Callable[[Any], List[Any]],
+    ) -> List[Any]:
+        """Like fetch, awaiting the downloads (bucket files are small local reads)"""
+        buckets = self._plan(start, end)
+        decoded = self._decode_cached(buckets, decode)
+        for run_start, run_end in self._missing_runs(buckets):
+            bodies = self.store(run_start, run_end, await fetch(run_start, run_end))
+            for bucket_start, body in bodies.items():
+                decoded[bucket_start] = decode(body)
+        return self._in_order(buckets, decoded)
+
+
+_cache: Optional[ResponseCache] = None
+
+
+def get_cache() -> Optional[ResponseCache]:
+    """Return the process-wide cache, None when APG_CACHE_DIR is not set"""
+    global _cache
+    if _cache is None and APG_CACHE_DIR:
+        _cache = ResponseCache(APG_CACHE_DIR)
+    return _cache
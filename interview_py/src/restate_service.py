@@ -1,24 +1,55 @@
+import os
 import uuid
-from restate import Service, Context
+from restate import Service, Context, ObjectSharedContext, TerminalError
 from restate.object import VirtualObject
+from restate.serde import BytesSerde
 from datetime import datetime, timedelta
 from typing import Dict, Any, List
 import logging
 
-import db_service
-from models import FetchDataRequest, ProcessDataRequest, ValidationResult
-import apg_data_service
-import data_validator
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+from log_config import SAMPLED
+from models import (
+    FetchDataRequest,
+    ProcessDataRequest,
+    ProcessWindowRequest,
+    SeriesQueryRequest,
+    ValidationResult,
+)
+import metrics
+from history_buffer import HistoryBuffer
+from rolling_stats import RollingStats
+from lazy_imports import lazy_import
+
+# Heavy dependencies (SQLAlchemy, asyncpg, httpx, NumPy) load on first use
+async_db_service = lazy_import("async_db_service")
+db_service = lazy_import("db_service")
+apg_data_service = lazy_import("apg_data_service")
+data_validator = lazy_import("data_validator")
+
+# Handlers are configured by the entry point (see log_config.configure_logging)
 logger = logging.getLogger(__name__)
 
+# Primary series of the APG ETL, further value columns share its scope
+APG_METRIC_NAME = "apg_imbalance"
+APG_SCOPE_NAME = "austria"
+
+# Incremental fetching: minutes re-requested before the watermark for late corrections
+WATERMARK_OVERLAP_MINUTES = int(os.getenv("APG_WATERMARK_OVERLAP_MINUTES", "3"))
+INITIAL_WINDOW_MINUTES = int(os.getenv("APG_INITIAL_WINDOW_MINUTES", "30"))
+MAX_CATCHUP_MINUTES = int(os.getenv("APG_MAX_CATCHUP_MINUTES", "1440"))
+
+# Number of recent data points kept in TimeSeriesObject state
+HISTORY_CAPACITY = 100
+
+# Reload history from the database when incoming data starts this far after the watermark
+HISTORY_GAP_MINUTES = int(os.getenv("APG_HISTORY_GAP_MINUTES", "5"))
+
 # Initialize Restate services
 apg_etl_service = Service("APGEtlService")
 data_processor = Service("DataProcessorService")
 time_series_object = VirtualObject("TimeSeriesObject")
 health_service = Service("HealthService")
+query_service = Service("QueryService")
 
 
 @apg_etl_service.handler()
@@ -37,14 +68,28 @@ async def schedule_data_collection(ctx: Context, interval_minutes: int = 1):
 
 @apg_etl_service.handler()
 async def fetch_and_process_data(ctx: Context):
-    """Fetch data from APG and send for processing"""
+    """Fetch data from APG and send every value column for processing"""
     # Generate request ID for tracing
     request_id = await ctx.run("generate_id", lambda: str(uuid.uuid4()))
-    logger.info(f"Starting data fetch with request ID: {request_id}")
-
-    # Calculate time window (last 30 minutes)
-    end_time = datetime.now()
-    start_time = end_time - timedelta(minutes=30)
+    logger.info("Starting data fetch with request ID: %s", request_id)
+
+    # Look up the last stored timestamp of the primary series, which drives
+    # the fetch window of all columns
+    watermark_state = await ctx.object_call(
+        get_watermark,
+        key=f"{APG_METRIC_NAME}_{APG_SCOPE_NAME}",
+        arg=WATERMARK_OVERLAP_MINUTES,
+    )
+    watermark = watermark_state["watermark"]
+
+    # Calculate time window (after the watermark, with a small overlap)
+    start_time, end_time = apg_data_service.compute_fetch_window(
+        datetime.now(),
+        watermark,
+        WATERMARK_OVERLAP_MINUTES,
+        INITIAL_WINDOW_MINUTES,
+        MAX_CATCHUP_MINUTES,
+    )
 
     start_date = await ctx.run(
         "format_start_date", lambda: apg_data_service.format_date_for_api(start_time)
@@ -54,58 +99,110 @@ async def fetch_and_process_data(ctx: Context):
         "format_end_date", lambda: apg_data_service.format_date_for_api(end_time)
     )
 
-    # Fetch data
-    response = await ctx.run(
-        "fetch_imbalance_data",
-        lambda: apg_data_service.fetch_imbalance_data(start_date, end_date),
+    # One request over the shared async connection pool feeds every series,
+    # journaled with ISO timestamps
+    async def fetch_series():
+        fetched = await apg_data_service.fetch_series_async(start_date, end_date)
+        return {
+            metric_name: [
+                {
+                    "timestamp": apg_data_service.timestamp_key(point["timestamp"]),
+                    "value": point["value"],
+                }
+                for point in data_points
+            ]
+            for metric_name, data_points in fetched.items()
+        }
+
+    series = await ctx.run(
+        "fetch_data_points", metrics.instrument("fetch_data_points", fetch_series)
     )
 
-    # Extract data points
-    data_points = await ctx.run(
-        "extract_data_points", lambda: apg_data_service.extract_data_points(response)
+    fetched_count = skipped_count = 0
+    series_counts = {}
+    for metric_name, fetched in series.items():
+        if metric_name != APG_METRIC_NAME:
+            watermark_state = await ctx.object_call(
+                get_watermark,
+                key=f"{metric_name}_{APG_SCOPE_NAME}",
+                arg=WATERMARK_OVERLAP_MINUTES,
+            )
+
+        # Drop overlap rows that are already stored with the same value,
+        # journaled so replays do not count the skipped rows again
+        def skip_unchanged():
+            data_points = apg_data_service.skip_unchanged_points(
+                fetched, watermark_state["watermark"], watermark_state["values"]
+            )
+            metrics.POINTS_SKIPPED.inc(len(fetched) - len(data_points))
+            return data_points
+
+        data_points = await ctx.run(f"skip_unchanged_{metric_name}", skip_unchanged)
+        fetched_count += len(fetched)
+        skipped_count += len(fetched) - len(data_points)
+        series_counts[metric_name] = len(data_points)
+
+        # Process the whole window of each series in a single invocation
+        if data_points:
+            ctx.service_send(
+                process_data_window,
+                arg=ProcessWindowRequest(
+                    metric_name=metric_name,
+                    scope_name=APG_SCOPE_NAME,
+                    data_points=data_points,
+                ),
+            )
+
+    logger.info(
+        "Fetched %d data points in %d series, %d new or changed",
+        fetched_count,
+        len(series),
+        fetched_count - skipped_count,
     )
 
-    logger.info(f"Fetched {len(data_points)} data points")
+    return {
+        "request_id": request_id,
+        "data_points_count": fetched_count - skipped_count,
+        "skipped_count": skipped_count,
+        "series": series_counts,
+    }
 
-    # Process each data point
-    for data_point in data_points:
-        ctx.service_send(
-            process_data_point,
-            arg=ProcessDataRequest(
-                metric_name="apg_imbalance", scope_name="austria", data_point=data_point
-            ),
+
+async def resolve_series(ctx: Context, metric_name: str, scope_name: str):
+    """Resolve metric and scope IDs"""
+
+    # Get metric and scope IDs (served from the in-process cache once known)
+    async def get_metric_id():
+        return str(
+            await async_db_service.get_metric_id(
+                metric_name, f"APG imbalance data for {metric_name}"
+            )
         )
 
-    return {"request_id": request_id, "data_points_count": len(data_points)}
+    async def get_scope_id():
+        return str(
+            await async_db_service.get_scope_id(
+                scope_name, f"Geographic scope for {scope_name}"
+            )
+        )
+
+    metric_id = await ctx.run(
+        "get_metric_id", metrics.instrument("get_metric_id", get_metric_id)
+    )
+    scope_id = await ctx.run(
+        "get_scope_id", metrics.instrument("get_scope_id", get_scope_id)
+    )
+
+    return metric_id, scope_id
 
 
 @data_processor.handler()
 async def process_data_point(ctx: Context, request: ProcessDataRequest):
     """Process a single data point"""
-    logger.info(f"Processing data point: {request.data_point}")
-
-    # Get metric and scope
-    metric = await ctx.run(
-        "get_or_create_metric",
-        lambda: db_service.get_or_create_metric(
-            request.metric_name, f"APG imbalance data for {request.metric_name}"
-        ),
-    )
+    logger.info("Processing data point: %s", request.data_point, extra=SAMPLED)
 
-    scope = await ctx.run(
-        "get_or_create_scope",
-        lambda: db_service.get_or_create_scope(
-            request.scope_name, f"Geographic scope for {request.scope_name}"
-        ),
-    )
-
-    # Get recent data for validation context
-    recent_data = await ctx.run(
-        "get_recent_data",
-        lambda: [
-            {"timestamp": item.time, "value": item.data}
-            for item in db_service.get_recent_data(metric.metric_id, scope.scope_id)
-        ],
+    metric_id, scope_id = await resolve_series(
+        ctx, request.metric_name, request.scope_name
     )
 
     # Send to TimeSeriesObject for validation and storage
@@ -114,74 +211,405 @@ async def process_data_point(ctx: Context, request: ProcessDataRequest):
         key=f"{request.metric_name}_{request.scope_name}",
         arg={
             "data_point": request.data_point,
-            "metric_id": str(metric.metric_id),
-            "scope_id": str(scope.scope_id),
-            "recent_data": recent_data,
+            "metric_name": request.metric_name,
+            "metric_id": metric_id,
+            "scope_id": scope_id,
+        },
+    )
+
+
+@data_processor.handler()
+async def process_data_window(ctx: Context, request: ProcessWindowRequest):
+    """Process a whole window of data points for one metric and scope"""
+    logger.info("Processing window of %d data points", len(request.data_points))
+
+    metric_id, scope_id = await resolve_series(
+        ctx, request.metric_name, request.scope_name
+    )
+
+    # Send the whole window to TimeSeriesObject for validation and storage
+    return await ctx.object_call(
+        validate_and_store_window,
+        key=f"{request.metric_name}_{request.scope_name}",
+        arg={
+            "data_points": request.data_points,
+            "metric_name": request.metric_name,
+            "metric_id": metric_id,
+            "scope_id": scope_id,
+        },
+    )
+
+
+async def load_history(ctx: Context) -> HistoryBuffer:
+    """Read the packed history ring buffer from object state"""
+    state = await ctx.get("history", serde=BytesSerde())
+    return HistoryBuffer.from_state(state, HISTORY_CAPACITY)
+
+
+async def load_stats(
+    ctx: Context, history: HistoryBuffer, alpha: float
+) -> RollingStats:
+    """Read the rolling statistics of the history, rebuilding them if missing"""
+    state = await ctx.get("stats", serde=BytesSerde())
+    stats = RollingStats.from_state(state, HISTORY_CAPACITY, alpha)
+
+    # History written before statistics were kept, or by another code path
+    if stats is None or len(stats) != len(history):
+        stats = RollingStats.from_values(history.values(), HISTORY_CAPACITY, alpha)
+    return stats
+
+
+def store_history(ctx: Context, history: HistoryBuffer, stats: RollingStats):
+    """Write the packed history ring buffer and its statistics to object state"""
+    ctx.set("history", history.to_state(), serde=BytesSerde())
+    ctx.set("stats", stats.to_state(), serde=BytesSerde())
+
+
+def append_history(
+    history: HistoryBuffer, stats: RollingStats, data_points: List[Dict[str, Any]]
+):
+    """Add stored data points to the history, updating its statistics in O(1)"""
+    for data_point in data_points:
+        evicted = history.append(data_point["timestamp"], data_point["value"])
+        stats.add(data_point["value"], evicted)
+
+
+async def store_rejected(
+    ctx: Context, watermark: str, data_points: List[Dict[str, Any]]
+):
+    """
+    Remember rejected values inside the overlap before the watermark
+
+    get_watermark reports them with the stored values, so unchanged rejected
+    points re-fetched in the overlap are skipped instead of validated again.
+    """
+    rejected = await ctx.get("rejected") or {}
+    if not data_points and not rejected:
+        return
+
+    for data_point in data_points:
+        rejected[apg_data_service.timestamp_key(data_point["timestamp"])] = data_point[
+            "value"
+        ]
+    overlap_start = datetime.fromisoformat(watermark) - timedelta(
+        minutes=WATERMARK_OVERLAP_MINUTES
+    )
+    ctx.set(
+        "rejected",
+        {
+            key: value
+            for key, value in rejected.items()
+            if datetime.fromisoformat(key) >= overlap_start
         },
     )
 
 
+async def load_validation_context(
+    ctx: Context,
+    metric_id: str,
+    scope_id: str,
+    data_points: List[Dict[str, Any]],
+    rule: "data_validator.ValidationRule",
+):
+    """
+    Return the object's history, its statistics and watermark as the
+    validation window
+
+    Object state is authoritative; the database is only read when the state
+    is empty or the incoming data shows a gap after the watermark (e.g.
+    rows written by a backfill that bypassed this object).
+    """
+    history = await load_history(ctx)
+    watermark = await ctx.get("watermark")
+
+    if len(history) > 0 and not apg_data_service.has_watermark_gap(
+        watermark, data_points, HISTORY_GAP_MINUTES
+    ):
+        stats = await load_stats(ctx, history, rule.ewma_alpha)
+        return history, stats, watermark
+
+    async def load_recent_data():
+        recent = await async_db_service.get_recent_data(
+            uuid.UUID(metric_id), uuid.UUID(scope_id), HISTORY_CAPACITY
+        )
+        return [
+            {"timestamp": item.time.isoformat(), "value": item.data}
+            for item in reversed(recent)
+        ]
+
+    recent_data = await ctx.run(
+        "load_recent_data", metrics.instrument("load_recent_data", load_recent_data)
+    )
+    logger.info("Reloaded %d history points from the database", len(recent_data))
+
+    history = HistoryBuffer(HISTORY_CAPACITY)
+    stats = RollingStats(HISTORY_CAPACITY, rule.ewma_alpha)
+    append_history(history, stats, recent_data)
+    watermark = apg_data_service.advance_watermark(watermark, recent_data)
+    store_history(ctx, history, stats)
+    if watermark is not None:
+        ctx.set("watermark", watermark)
+
+    return history, stats, watermark
+
+
 @time_series_object.handler()
 async def validate_and_store(ctx: Context, data: Dict[str, Any]):
     """Validate and store a data point with history context"""
     data_point = data["data_point"]
     metric_id = data["metric_id"]
     scope_id = data["scope_id"]
-    recent_data = data.get("recent_data", [])
-
-    # Get historical data from state if needed
-    stored_history = await ctx.get("history") or []
-
-    # Combine with recent data from database for better context
-    validation_history = recent_data + stored_history
+    rule = data_validator.rule_for(data.get("metric_name", APG_METRIC_NAME))
 
-    # Validate data
-    validation_result = await ctx.run(
-        "validate_data",
-        lambda: data_validator.validate_imbalance_data(data_point, validation_history),
+    # Object state is the validation window (read once per invocation)
+    history, stats, watermark = await load_validation_context(
+        ctx, metric_id, scope_id, [data_point], rule
+    )
+    validation_history = history.to_points()
+
+    # Validate data, journaling the result as a plain dict
+    validation_result = ValidationResult.model_validate(
+        await ctx.run(
+            "validate_data",
+            metrics.instrument(
+                "validate_data",
+                lambda: metrics.record_validation(
+                    [
+                        data_validator.validate_imbalance_data(
+                            data_point, validation_history, rule, stats
+                        )
+                    ]
+                )[0].model_dump(mode="json"),
+            ),
+        )
     )
 
     if not validation_result.is_valid:
-        logger.warning(f"Data validation failed: {validation_result.reason}")
+        # Rejected points are processed too, later ticks need not fetch them
+        watermark = apg_data_service.advance_watermark(watermark, [data_point])
+        ctx.set("watermark", watermark)
+        await store_rejected(ctx, watermark, [data_point])
+        logger.warning("Data validation failed: %s", validation_result.reason)
         return {"success": False, "reason": validation_result.reason}
 
-    # Store in database
-    success = await ctx.run(
-        "save_data",
-        lambda: db_service.save_actual_data(
-            data_point["timestamp"],
-            data_point["value"],
-            uuid.UUID(metric_id),
-            uuid.UUID(scope_id),
-        ),
-    )
-
-    if success:
-        # Update history in object state
-        history = await ctx.get("history") or []
-        history.append(data_point)
+    # Store in database, journaling the write counts as a plain dict
+    async def save_data():
+        result = metrics.record_write(
+            await async_db_service.save_actual_batch(
+                [data_point], uuid.UUID(metric_id), uuid.UUID(scope_id)
+            )
+        )
+        return result.model_dump() if result is not None else None
 
-        # Keep only the last 100 entries
-        if len(history) > 100:
-            history = history[-100:]
+    write_result = await ctx.run(
+        "save_data", metrics.instrument("save_data", save_data)
+    )
 
-        ctx.set("history", history)
+    if write_result is not None:
+        # Update history in object state, the ring buffer keeps the last 100
+        append_history(history, stats, [data_point])
+        store_history(ctx, history, stats)
+        ctx.set(
+            "watermark", apg_data_service.advance_watermark(watermark, [data_point])
+        )
 
-        logger.info(f"Data point saved successfully: {data_point}")
+        logger.info("Data point saved successfully: %s", data_point, extra=SAMPLED)
         return {"success": True, "data_point": data_point}
     else:
-        logger.error(f"Failed to save data point: {data_point}")
+        logger.error("Failed to save data point: %s", data_point)
         return {"success": False, "reason": "Database error"}
 
 
+@time_series_object.handler()
+async def validate_and_store_window(ctx: Context, data: Dict[str, Any]):
+    """Validate a window of data points in order and store the valid ones at once"""
+    data_points = data["data_points"]
+    metric_id = data["metric_id"]
+    scope_id = data["scope_id"]
+    rule = data_validator.rule_for(data.get("metric_name", APG_METRIC_NAME))
+
+    # Object state is the validation window (read once per invocation)
+    history, stats, watermark = await load_validation_context(
+        ctx, metric_id, scope_id, data_points, rule
+    )
+    validation_history = history.to_points()
+
+    # Validate every point against the history accepted so far, journaling
+    # the results as plain dicts
+    validation_results = [
+        ValidationResult.model_validate(result)
+        for result in await ctx.run(
+            "validate_window",
+            metrics.instrument(
+                "validate_window",
+                lambda: [
+                    result.model_dump(mode="json")
+                    for result in metrics.record_validation(
+                        data_validator.validate_imbalance_points(
+                            data_points, validation_history, rule, stats
+                        )
+                    )
+                ],
+            ),
+        )
+    ]
+
+    accepted_points = [
+        data_point
+        for data_point, validation_result in zip(data_points, validation_results)
+        if validation_result.is_valid
+    ]
+
+    # Store all accepted points in a single write
+    write_result = None
+    if accepted_points:
+
+        # The write counts are journaled as a plain dict
+        async def save_window():
+            result = metrics.record_write(
+                await async_db_service.save_actual_batch(
+                    accepted_points, uuid.UUID(metric_id), uuid.UUID(scope_id)
+                )
+            )
+            return result.model_dump() if result is not None else None
+
+        write_result = await ctx.run(
+            "save_window", metrics.instrument("save_window", save_window)
+        )
+
+    if write_result is not None:
+        # Update history in object state, the ring buffer keeps the last 100
+        append_history(history, stats, accepted_points)
+        store_history(ctx, history, stats)
+
+    # The watermark covers rejected points as well, so later ticks do not
+    # validate them again; a failed write leaves it for the retry
+    if write_result is not None or not accepted_points:
+        watermark = apg_data_service.advance_watermark(watermark, data_points)
+        ctx.set("watermark", watermark)
+        await store_rejected(
+            ctx,
+            watermark,
+            [
+                data_point
+                for data_point, validation_result in zip(
+                    data_points, validation_results
+                )
+                if not validation_result.is_valid
+            ],
+        )
+
+    results = []
+    for data_point, validation_result in zip(data_points, validation_results):
+        if not validation_result.is_valid:
+            logger.warning(
+                "Data validation failed: %s", validation_result.reason, extra=SAMPLED
+            )
+            results.append({"success": False, "reason": validation_result.reason})
+        elif write_result is None:
+            results.append({"success": False, "reason": "Database error"})
+        else:
+            results.append({"success": True, "data_point": data_point})
+
+    # One summary line per window, the per-point lines above are sampled
+    if accepted_points and write_result is None:
+        logger.error("Failed to save window of %d data points", len(accepted_points))
+    logger.info(
+        "Window processed: %d of %d data points saved, %d rejected",
+        len(accepted_points) if write_result is not None else 0,
+        len(data_points),
+        len(data_points) - len(accepted_points),
+    )
+    return results
+
+
 @health_service.handler()
 async def health(ctx: Context):
     """Health check endpoint for Docker healthcheck"""
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
 
+@health_service.handler("metrics")
+async def get_metrics(ctx: Context) -> Dict[str, Any]:
+    """Per-stage latency histograms and pipeline counters of this process"""
+    return metrics.registry.snapshot()
+
+
 @time_series_object.handler()
 async def get_history(ctx: Context) -> List[Dict[str, Any]]:
     """Get historical data points from the time series"""
-    history = await ctx.get("history") or []
-    return history
+    history = await load_history(ctx)
+    return [
+        {
+            "timestamp": (item["timestamp"].isoformat() if item["timestamp"] else None),
+            "value": item["value"],
+        }
+        for item in history.to_points()
+    ]
+
+
+@query_service.handler()
+async def query_series(ctx: Context, request: SeriesQueryRequest) -> Dict[str, Any]:
+    """
+    Read a time range of a series as raw points or min/max/mean/last buckets
+
+    Large ranges are paged: pass the returned next_cursor as cursor to get
+    the following page.
+    """
+    # The resolutions query_series supports, read on first use like the driver
+    resolutions = tuple(db_service.QUERY_RESOLUTIONS)
+    if request.resolution not in resolutions:
+        raise TerminalError(
+            f"Unknown resolution {request.resolution!r}, "
+            f"expected one of {', '.join(resolutions)}"
+        )
+    try:
+        for timestamp in (request.start, request.end, request.cursor):
+            if timestamp is not None:
+                datetime.fromisoformat(timestamp)
+    except ValueError as e:
+        raise TerminalError(f"Invalid timestamp: {e}")
+
+    metric_id, scope_id = await resolve_series(
+        ctx, request.metric_name, request.scope_name
+    )
+
+    async def query():
+        return await async_db_service.query_series(
+            uuid.UUID(metric_id),
+            uuid.UUID(scope_id),
+            request.start,
+            request.end,
+            request.resolution,
+            request.limit,
+            request.cursor,
+        )
+
+    return await ctx.run("query_series", metrics.instrument("query_series", query))
+
+
+@time_series_object.handler(kind="shared")
+async def get_watermark(
+    ctx: ObjectSharedContext, overlap_minutes: int = 0
+) -> Dict[str, Any]:
+    """Get the last processed timestamp and the known values inside the overlap"""
+    watermark = await ctx.get("watermark")
+    if watermark is None:
+        return {"watermark": None, "values": {}}
+
+    history = await load_history(ctx)
+    overlap_start = datetime.fromisoformat(watermark) - timedelta(
+        minutes=overlap_minutes
+    )
+
+    values = {}
+    for item in history.to_points():
+        if item["timestamp"] is not None and item["timestamp"] >= overlap_start:
+            values[item["timestamp"].isoformat()] = item["value"]
+
+    # Rejected values are the latest seen for their timestamps
+    for key, value in (await ctx.get("rejected") or {}).items():
+        if datetime.fromisoformat(key) >= overlap_start:
+            values[key] = value
+
+    return {"watermark": watermark, "values": values}
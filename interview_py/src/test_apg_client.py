@@ -0,0 +1,73 @@
+import asyncio
+
+import httpx
+import pytest
+
+from apg_client import APGClient
+
+
+def make_client(handler, **kwargs):
+    return APGClient(
+        backoff_base=0,
+        transport=httpx.MockTransport(handler),
+        async_transport=httpx.MockTransport(handler),
+        **kwargs,
+    )
+
+
+class TestAPGClient:
+    def test_retries_retryable_status_then_succeeds(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            if len(calls) < 3:
+                return httpx.Response(503)
+            return httpx.Response(200, content=b'{"ok": true}')
+
+        result = make_client(handler).get_sync("https://apg.test/data")
+
+        assert result.content == b'{"ok": true}'
+        assert result.attempts == 3
+        assert result.latency_ms >= 0
+
+    def test_does_not_retry_client_errors(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(404)
+
+        with pytest.raises(httpx.HTTPStatusError):
+            make_client(handler).get_sync("https://apg.test/data")
+
+        assert len(calls) == 1
+
+    def test_gives_up_after_max_attempts(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            raise httpx.ConnectTimeout("timed out", request=request)
+
+        with pytest.raises(httpx.ConnectTimeout):
+            make_client(handler, max_attempts=2).get_sync("https://apg.test/data")
+
+        assert len(calls) == 2
+
+    def test_async_get_negotiates_compression(self):
+        def handler(request):
+            return httpx.Response(
+                200, content=request.headers["Accept-Encoding"].encode()
+            )
+
+        async def fetch():
+            client = make_client(handler)
+            try:
+                return await client.get("https://apg.test/data")
+            finally:
+                await client.aclose()
+
+        result = asyncio.run(fetch())
+
+        assert result.content == b"gzip, br"
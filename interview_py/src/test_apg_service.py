@@ -1,8 +1,11 @@
+import numpy as np
 import pytest
-from datetime import datetime
+from datetime import datetime, timedelta
 import apg_data_service
 import data_validator
+from history_buffer import HistoryBuffer
 from models import ValidationResult
+from rolling_stats import RollingStats
 
 
 class TestAPGDataService:
@@ -23,6 +26,116 @@ class TestAPGDataService:
         assert data_point["timestamp"] == datetime(2025, 5, 6, 12, 30, 0)
         assert data_point["value"] == 123.45
 
+    def test_compute_fetch_window_starts_before_watermark(self):
+        now = datetime(2025, 5, 6, 12, 30, 0)
+
+        start, end = apg_data_service.compute_fetch_window(
+            now, "2025-05-06T12:28:00", overlap_minutes=3
+        )
+
+        assert start == datetime(2025, 5, 6, 12, 25, 0)
+        assert end == now
+
+    def test_compute_fetch_window_without_watermark(self):
+        now = datetime(2025, 5, 6, 12, 30, 0)
+
+        start, _ = apg_data_service.compute_fetch_window(now, None, overlap_minutes=3)
+
+        assert start == datetime(2025, 5, 6, 12, 0, 0)
+
+    def test_skip_unchanged_points_keeps_new_and_corrected(self):
+        data_points = [
+            {"timestamp": datetime(2025, 5, 6, 12, 26, 0), "value": 10.0},
+            {"timestamp": datetime(2025, 5, 6, 12, 27, 0), "value": 25.0},
+            {"timestamp": datetime(2025, 5, 6, 12, 29, 0), "value": 30.0},
+        ]
+        known_values = {"2025-05-06T12:26:00": 10.0, "2025-05-06T12:27:00": 20.0}
+
+        kept = apg_data_service.skip_unchanged_points(
+            data_points, "2025-05-06T12:28:00", known_values
+        )
+
+        assert [point["value"] for point in kept] == [25.0, 30.0]
+
+    def test_advance_watermark(self):
+        data_points = [{"timestamp": datetime(2025, 5, 6, 12, 29, 0), "value": 1.0}]
+
+        assert (
+            apg_data_service.advance_watermark("2025-05-06T12:28:00", data_points)
+            == "2025-05-06T12:29:00"
+        )
+        assert apg_data_service.advance_watermark("2025-05-06T12:30:00", []) == (
+            "2025-05-06T12:30:00"
+        )
+
+    def test_has_watermark_gap(self):
+        overlap = [{"timestamp": datetime(2025, 5, 6, 12, 26, 0), "value": 1.0}]
+        after_gap = [{"timestamp": datetime(2025, 5, 6, 12, 40, 0), "value": 1.0}]
+
+        assert apg_data_service.has_watermark_gap(None, overlap, 5)
+        assert not apg_data_service.has_watermark_gap("2025-05-06T12:28:00", overlap, 5)
+        assert apg_data_service.has_watermark_gap("2025-05-06T12:28:00", after_gap, 5)
+
+    def test_fast_decode_matches_strict_decode(self):
+        content = b"""{"ResponseData": {
+            "Description": "Imbalance",
+            "ValueColumns": [{"InternalName": "imbalance"}],
+            "ValueRows": [
+                {"DF": "06.05.2025", "TF": "23:58", "DT": "06.05.2025", "TT": "23:59",
+                 "V": [{"V": 12.5, "E": false, "M": false}]},
+                {"DF": "06.05.2025", "TF": "23:59", "DT": "07.05.2025", "TT": "00:00",
+                 "V": [{"V": null, "E": false, "M": true}]},
+                {"DF": "07.05.2025", "TF": "00:00", "DT": "07.05.2025", "TT": "00:01",
+                 "V": []},
+                {"DF": "07.05.2025", "TF": "00:01", "DT": "07.05.2025", "TT": "00:02",
+                 "V": [{"V": -7, "E": true, "M": false}]}
+            ]}}"""
+
+        fast = apg_data_service.decode_data_points(content, strict=False)
+        strict = apg_data_service.decode_data_points(content, strict=True)
+
+        assert fast == strict
+        assert fast == [
+            {"timestamp": datetime(2025, 5, 6, 23, 58, 0), "value": 12.5},
+            {"timestamp": datetime(2025, 5, 7, 0, 1, 0), "value": -7.0},
+        ]
+
+    def test_decode_series_maps_columns_to_metrics(self, monkeypatch):
+        monkeypatch.setattr(
+            apg_data_service, "APG_COLUMN_METRICS", {"Afrr": "apg_afrr_activation"}
+        )
+        content = b"""{"ResponseData": {
+            "Description": "Imbalance",
+            "ValueColumns": [
+                {"InternalName": "imbalance"},
+                {"InternalName": "Afrr"},
+                {"InternalName": "Imbalance Price"}
+            ],
+            "ValueRows": [
+                {"DF": "06.05.2025", "TF": "23:58", "DT": "06.05.2025", "TT": "23:59",
+                 "V": [{"V": 12.5, "E": false, "M": false},
+                       {"V": 3, "E": false, "M": false},
+                       {"V": null, "E": false, "M": true}]},
+                {"DF": "06.05.2025", "TF": "23:59", "DT": "07.05.2025", "TT": "00:00",
+                 "V": [{"V": null, "E": false, "M": true},
+                       {"V": 4, "E": false, "M": false},
+                       {"V": 99.1, "E": false, "M": false}]}
+            ]}}"""
+        first, second = datetime(2025, 5, 6, 23, 58), datetime(2025, 5, 6, 23, 59)
+
+        fast = apg_data_service.decode_series(content, strict=False)
+        strict = apg_data_service.decode_series(content, strict=True)
+
+        assert fast == strict
+        assert fast == {
+            "apg_imbalance": [{"timestamp": first, "value": 12.5}],
+            "apg_afrr_activation": [
+                {"timestamp": first, "value": 3.0},
+                {"timestamp": second, "value": 4.0},
+            ],
+            "apg_imbalance_price": [{"timestamp": second, "value": 99.1}],
+        }
+
 
 class TestDataValidator:
     def test_valid_data_point(self):
@@ -61,3 +174,187 @@ class TestDataValidator:
 
         assert result.is_valid == False
         assert "Suspicious jump" in result.reason
+
+    def test_window_matches_point_by_point_validation(self):
+        history = [{"timestamp": datetime(2025, 5, 6, 12, 0, 0), "value": 100.0}]
+        data_points = [
+            {"timestamp": datetime(2025, 5, 6, 12, minute, 0), "value": value}
+            for minute, value in enumerate([150.0, 400.0, 1500.0, 320.0, None], 1)
+        ]
+
+        expected = []
+        stored = list(history)
+        for data_point in data_points:
+            result = data_validator.validate_imbalance_data(data_point, stored)
+            if result.is_valid:
+                stored.append(data_point)
+            expected.append(result)
+
+        results = data_validator.validate_imbalance_points(data_points, history)
+
+        assert results == expected
+        assert [result.is_valid for result in results] == [
+            True,
+            False,
+            False,
+            True,
+            False,
+        ]
+
+    def test_window_matches_scalar_rules(self):
+        cases = [
+            ({"timestamp": datetime(2025, 5, 6, 12, 30, 0), "value": 150.0}, None),
+            ({"timestamp": datetime(2025, 5, 6, 12, 30, 0), "value": None}, None),
+            ({"timestamp": None, "value": 10.0}, None),
+            ({"timestamp": datetime(2025, 5, 6, 12, 30, 0), "value": 1500.0}, None),
+            (
+                {"timestamp": datetime(2025, 5, 6, 12, 30, 0), "value": 500.0},
+                [{"timestamp": datetime(2025, 5, 6, 12, 25, 0), "value": 100.0}],
+            ),
+        ]
+
+        for data_point, history in cases:
+            window = data_validator.validate_imbalance_window(
+                [data_point["timestamp"]], [data_point["value"]], history
+            )
+
+            assert window.to_validation_results() == [
+                data_validator.validate_imbalance_data(data_point, history)
+            ]
+
+    def test_nan_is_missing_on_both_paths(self):
+        start = datetime(2025, 5, 6, 12, 0, 0)
+        history = [{"timestamp": start, "value": 100.0}]
+        data_points = [
+            {"timestamp": start + timedelta(minutes=minute), "value": value}
+            for minute, value in enumerate([120.0, float("nan"), 130.0, None], 1)
+        ]
+
+        window = data_validator.validate_imbalance_window(
+            [point["timestamp"] for point in data_points],
+            [point["value"] for point in data_points],
+            history,
+        ).to_validation_results()
+        # Out of order with the history, so the points are validated one by one
+        scalar = data_validator.validate_imbalance_points(
+            data_points,
+            history + [{"timestamp": start.replace(hour=13), "value": 100.0}],
+        )
+
+        assert window == scalar
+        assert [result.is_valid for result in window] == [True, False, True, False]
+        assert window[1].reason == "Missing value"
+
+    def test_window_jump_rule_chains_on_accepted_points(self):
+        random = np.random.default_rng(42)
+        start = datetime(2025, 5, 6, 0, 0, 0)
+        values = np.cumsum(random.normal(0, 120, 2000)).round(1)
+        values[500:700] += 600  # level shift that stays rejected for a while
+        data_points = [
+            {"timestamp": start + timedelta(minutes=i), "value": float(value)}
+            for i, value in enumerate(values)
+        ]
+        history = [{"timestamp": start - timedelta(minutes=1), "value": 0.0}]
+
+        expected = []
+        stored = list(history)
+        for data_point in data_points:
+            result = data_validator.validate_imbalance_data(data_point, stored)
+            if result.is_valid:
+                stored.append(data_point)
+            expected.append(result)
+
+        window = data_validator.validate_imbalance_window(
+            [point["timestamp"] for point in data_points],
+            [point["value"] for point in data_points],
+            history,
+        )
+
+        assert window.to_validation_results() == expected
+        assert window.is_valid.tolist() == [result.is_valid for result in expected]
+
+    def test_statistical_mode_rejects_outliers_of_the_window(self):
+        start = datetime(2025, 5, 6, 12, 0, 0)
+        history = [
+            {"timestamp": start + timedelta(minutes=i), "value": 100.0 + (i % 5)}
+            for i in range(50)
+        ]
+        rule = data_validator.ValidationRule(mode="statistical")
+        stats = RollingStats.from_values([item["value"] for item in history])
+        data_point = {"timestamp": start + timedelta(minutes=50), "value": 190.0}
+
+        # Within the threshold rule's jump limit, far outside the window spread
+        assert data_validator.validate_imbalance_data(data_point, history).is_valid
+        result = data_validator.validate_imbalance_data(
+            data_point, history, rule, stats
+        )
+
+        assert result.is_valid == False
+        assert "Z-score" in result.reason
+
+    def test_statistical_window_matches_point_by_point_validation(self):
+        random = np.random.default_rng(3)
+        start = datetime(2025, 5, 6, 0, 0, 0)
+        values = np.cumsum(random.normal(0, 10, 300)).round(1)
+        values[[40, 120, 121, 250]] += 150
+        history = [{"timestamp": start - timedelta(minutes=1), "value": 0.0}]
+        data_points = [
+            {"timestamp": start + timedelta(minutes=i), "value": float(value)}
+            for i, value in enumerate(values)
+        ]
+        rule = data_validator.ValidationRule(mode="statistical", max_zscore=3.0)
+        stats = RollingStats.from_values([0.0], window=100, alpha=rule.ewma_alpha)
+
+        expected = []
+        stored = HistoryBuffer(100)
+        stored.extend(history)
+        expected_stats = stats.copy()
+        for data_point in data_points:
+            result = data_validator.validate_imbalance_data(
+                data_point, stored.to_points(), rule, expected_stats
+            )
+            if result.is_valid:
+                expected_stats.add(
+                    data_point["value"],
+                    stored.append(data_point["timestamp"], data_point["value"]),
+                )
+            expected.append(result)
+
+        results = data_validator.validate_imbalance_points(
+            data_points, history, rule, stats
+        )
+
+        assert results == expected
+        assert len(stats) == 1  # the caller's statistics are left unchanged
+        assert not all(result.is_valid for result in results)
+
+    def test_overlap_window_mixes_journaled_and_history_timestamps(self):
+        # History from object state has datetimes, journaled points ISO strings
+        start = datetime(2025, 5, 6, 12, 0, 0)
+        history = HistoryBuffer(100)
+        for minute in range(10):
+            history.append(start + timedelta(minutes=minute), 100.0 + minute)
+        data_points = [
+            {"timestamp": (start + timedelta(minutes=8)).isoformat(), "value": 109.0},
+            {"timestamp": (start + timedelta(minutes=10)).isoformat(), "value": 110.0},
+        ]
+        # Statistical rule still warming up, so it falls back to the jump rule
+        warming_up = data_validator.ValidationRule(mode="statistical", min_samples=20)
+        stats = RollingStats.from_values(history.values())
+
+        for rule in (None, warming_up):
+            results = data_validator.validate_imbalance_points(
+                data_points, history.to_points(), rule, stats
+            )
+
+            assert [result.is_valid for result in results] == [True, True]
+
+    def test_load_validation_rules(self):
+        rules = data_validator.load_validation_rules(
+            '{"apg_imbalance": {"mode": "statistical", "max_zscore": 3}}'
+        )
+
+        assert rules["apg_imbalance"].mode == "statistical"
+        assert rules["apg_imbalance"].max_zscore == 3.0
+        assert data_validator.load_validation_rules(None) == {}
+        assert data_validator.rule_for("unknown") == data_validator.DEFAULT_RULE
@@ -0,0 +1,64 @@
+import asyncio
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from sqlmodel import Session, select
+
+import async_db_service
+import db_service
+from models import Actual
+
+
+def make_points(values, start=datetime(2025, 5, 6, 12, 0, 0)):
+    return [
+        {"timestamp": start + timedelta(minutes=i), "value": value}
+        for i, value in enumerate(values)
+    ]
+
+
+class TestAsyncDbService:
+    def test_save_actual_batch_counts_outcomes(
+        self, sqlite_engine, async_sqlite_engine
+    ):
+        metric_id, scope_id = uuid4(), uuid4()
+
+        async def save_twice():
+            await async_db_service.save_actual_batch(
+                make_points([1.0, 2.0]), metric_id, scope_id
+            )
+            return await async_db_service.save_actual_batch(
+                make_points([1.0, 5.0, 3.0]), metric_id, scope_id
+            )
+
+        result = asyncio.run(save_twice())
+
+        assert (result.inserted, result.updated, result.unchanged) == (1, 1, 1)
+        with Session(sqlite_engine) as session:
+            rows = session.exec(select(Actual).order_by(Actual.time)).all()
+        assert [row.data for row in rows] == [1.0, 5.0, 3.0]
+
+    def test_get_recent_data_newest_first(self, async_sqlite_engine):
+        metric_id, scope_id = uuid4(), uuid4()
+        db_service.save_actual_batch(make_points([1.0, 2.0, 3.0]), metric_id, scope_id)
+
+        recent = asyncio.run(async_db_service.get_recent_data(metric_id, scope_id, 2))
+
+        assert [row.data for row in recent] == [3.0, 2.0]
+
+    def test_ids_are_shared_with_sync_cache(self, async_sqlite_engine):
+        metric_id = asyncio.run(async_db_service.get_metric_id("apg_imbalance"))
+        scope_id = asyncio.run(async_db_service.get_scope_id("austria"))
+
+        assert db_service.get_metric_id("apg_imbalance") == metric_id
+        db_service.invalidate_id_caches()
+        assert db_service.get_scope_id("austria") == scope_id
+
+    def test_query_series_matches_sync(self, async_sqlite_engine):
+        metric_id, scope_id = uuid4(), uuid4()
+        db_service.save_actual_batch(make_points([1.0, 5.0, 3.0]), metric_id, scope_id)
+        arguments = (metric_id, scope_id, "2025-05-06T12:00:00", "2025-05-06T13:00:00")
+
+        result = asyncio.run(async_db_service.query_series(*arguments, "5m"))
+
+        assert result == db_service.query_series(*arguments, "5m")
+        assert result["buckets"][0]["last"] == 3.0
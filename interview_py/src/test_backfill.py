@@ -0,0 +1,109 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlmodel import Session, func, select
+
+import apg_data_service
+import backfill
+from models import Actual, ImbalanceResponse
+
+
+def make_response(start: datetime, end: datetime) -> ImbalanceResponse:
+    rows = []
+    time = start
+    while time < end:
+        rows.append(
+            {
+                "DF": time.strftime("%d.%m.%Y"),
+                "TF": time.strftime("%H:%M"),
+                "DT": time.strftime("%d.%m.%Y"),
+                "TT": time.strftime("%H:%M"),
+                "V": [{"V": float(time.minute), "E": False, "M": False}],
+            }
+        )
+        time += timedelta(minutes=1)
+    return ImbalanceResponse.model_validate(
+        {
+            "ResponseData": {
+                "Description": "test",
+                "ValueColumns": [{"InternalName": "imbalance"}],
+                "ValueRows": rows,
+            }
+        }
+    )
+
+
+def test_split_range():
+    start = datetime(2025, 5, 6, 0, 0)
+    chunks = backfill.split_range(start, start + timedelta(minutes=150), 60)
+
+    assert [
+        (chunk_end - chunk_start).seconds // 60 for chunk_start, chunk_end in chunks
+    ] == [
+        60,
+        60,
+        30,
+    ]
+
+
+def test_backfill_resumes_from_checkpoint(sqlite_engine, monkeypatch, tmp_path):
+    fetched = []
+
+    async def fake_fetch(start_date, end_date):
+        fetched.append(start_date)
+        start = datetime.strptime(start_date, "%Y-%m-%dT%H%M%S")
+        end = datetime.strptime(end_date, "%Y-%m-%dT%H%M%S")
+        return make_response(start, end).model_dump_json().encode()
+
+    monkeypatch.setattr(apg_data_service, "fetch_imbalance_content_async", fake_fetch)
+    start = datetime(2025, 5, 6, 0, 0)
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    backfill.BackfillCheckpoint(checkpoint_path).mark_done(start)
+
+    report = asyncio.run(
+        backfill.run_backfill(
+            start,
+            start + timedelta(hours=3),
+            chunk_minutes=60,
+            concurrency=2,
+            checkpoint_path=checkpoint_path,
+        )
+    )
+
+    assert report.chunks_skipped == 1
+    assert report.chunks_failed == 0
+    assert report.rows_fetched == report.rows_written == 120
+    assert len(fetched) == 2
+    assert backfill.BackfillCheckpoint(checkpoint_path).completed == {
+        (start + timedelta(hours=hour)).isoformat() for hour in range(3)
+    }
+    with Session(sqlite_engine) as session:
+        assert session.exec(select(func.count()).select_from(Actual)).one() == 120
+
+
+def test_backfill_stores_only_valid_rows(sqlite_engine, monkeypatch):
+    async def fake_fetch(start_date, end_date):
+        start = datetime.strptime(start_date, "%Y-%m-%dT%H%M%S")
+        end = datetime.strptime(end_date, "%Y-%m-%dT%H%M%S")
+        response = make_response(start, end)
+        # One out-of-range value and one implausible jump per chunk
+        response.ResponseData.ValueRows[10].V[0].V = 5000.0
+        response.ResponseData.ValueRows[20].V[0].V = 400.0
+        return response.model_dump_json().encode()
+
+    monkeypatch.setattr(apg_data_service, "fetch_imbalance_content_async", fake_fetch)
+    start = datetime(2025, 5, 6, 0, 0)
+
+    report = asyncio.run(
+        backfill.run_backfill(
+            start, start + timedelta(hours=2), chunk_minutes=60, checkpoint_path=None
+        )
+    )
+
+    assert report.rows_fetched == 120
+    assert report.rows_rejected == 4
+    assert report.rows_written == 116
+    with Session(sqlite_engine) as session:
+        values = session.exec(select(Actual.data)).all()
+    assert len(values) == 116
+    assert max(values) < 100
@@ -0,0 +1,110 @@
+import asyncio
+from datetime import datetime
+
+import httpx
+
+import apg_data_service
+from benchmarks.apg_standin import StandinSettings, create_app
+from benchmarks.load import run_load
+from benchmarks.payloads import generate_response_bytes
+from benchmarks.runner import compare_results, run_benchmarks
+
+STANDIN_PATH = "/api/v1/DRZ/Data/German/PT1M/2025-05-06T120000/2025-05-06T123000"
+
+
+def asgi_get(app, *paths):
+    async def get_all():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://t"
+        ) as client:
+            return [await client.get(path) for path in paths]
+
+    return asyncio.run(get_all())
+
+
+class TestBenchmarks:
+    def test_synthetic_payload_decodes_on_both_paths(self):
+        content = generate_response_bytes(500, seed=1)
+
+        fast = apg_data_service.decode_data_points(content, strict=False)
+        strict = apg_data_service.decode_data_points(content, strict=True)
+
+        assert fast == strict
+        assert 490 <= len(fast) <= 500
+
+    def test_compare_flags_regressions_beyond_threshold(self):
+        baseline = {"results": [{"stage": "decode", "size": 30, "seconds": 1.0}]}
+        current = {
+            "results": [
+                {"stage": "decode", "size": 30, "seconds": 1.2},
+                {"stage": "new_stage", "size": 30, "seconds": 1.0},
+            ]
+        }
+
+        comparisons = compare_results(baseline, current, threshold=0.1)
+
+        assert len(comparisons) == 1
+        assert comparisons[0]["regression"]
+        assert not compare_results(baseline, current, threshold=0.5)[0]["regression"]
+
+    def test_run_produces_result_per_stage(self, sqlite_engine):
+        results = run_benchmarks(sizes=[30], repeats=1, log=lambda line: None)
+
+        assert {result["stage"] for result in results["results"]} == {
+            "model_validate",
+            "extract_data_points",
+            "decode_data_points",
+            "validate_imbalance_data",
+            "validate_imbalance_window",
+            "save_actual_data",
+            "save_actual_batch",
+        }
+
+    def test_standin_serves_requested_range_consistently(self):
+        app = create_app(StandinSettings(latency_ms=0, jitter_ms=0, missing_rate=0))
+
+        first, second = asgi_get(app, STANDIN_PATH, STANDIN_PATH)
+        points = apg_data_service.decode_data_points(first.content, strict=True)
+
+        assert first.status_code == 200
+        assert first.content == second.content
+        assert len(points) == 30
+        assert points[0]["timestamp"] == datetime(2025, 5, 6, 12, 0)
+        assert all(abs(point["value"]) < 1000 for point in points)
+
+    def test_standin_injects_errors_and_revisions(self):
+        failing = create_app(StandinSettings(latency_ms=0, jitter_ms=0, error_rate=1))
+        revising = create_app(
+            StandinSettings(latency_ms=0, jitter_ms=0, revision_rate=0.5)
+        )
+
+        assert [
+            response.status_code
+            for response in asgi_get(failing, STANDIN_PATH, "/other")
+        ] == [503, 404]
+        first, second = asgi_get(revising, STANDIN_PATH, STANDIN_PATH)
+        assert first.content != second.content
+
+    def test_load_driver_reports_rate_and_latency(self):
+        paths = []
+
+        async def ingress(scope, receive, send):
+            paths.append(scope["path"])
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"{}"})
+
+        report = asyncio.run(
+            run_load(
+                "http://ingress",
+                "solar",
+                rate=200,
+                duration=0.1,
+                transport=httpx.ASGITransport(app=ingress),
+            )
+        )
+
+        assert report["requests"] == report["succeeded"] == 20
+        assert report["failed"] == 0
+        assert set(paths) == {"/SolarETLService/process_solar_data"}
+        assert 0 < report["latency_ms"]["p50"] <= report["latency_ms"]["p99"]
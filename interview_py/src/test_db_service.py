@@ -0,0 +1,471 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import text
+from sqlmodel import Session, select
+
+import db_service
+from models import Actual, ActualRollup, Metric
+
+
+def make_points(values, start=datetime(2025, 5, 6, 12, 0, 0)):
+    return [
+        {"timestamp": start + timedelta(minutes=i), "value": value}
+        for i, value in enumerate(values)
+    ]
+
+
+class TestSaveActualBatch:
+    def test_inserts_new_points(self, sqlite_engine):
+        metric_id, scope_id = uuid4(), uuid4()
+
+        result = db_service.save_actual_batch(
+            make_points([1.0, 2.0, 3.0]), metric_id, scope_id
+        )
+
+        assert (result.inserted, result.updated, result.unchanged) == (3, 0, 0)
+        with Session(sqlite_engine) as session:
+            rows = session.exec(select(Actual).order_by(Actual.time)).all()
+        assert [row.data for row in rows] == [1.0, 2.0, 3.0]
+
+    def test_counts_updated_and_unchanged(self, sqlite_engine):
+        metric_id, scope_id = uuid4(), uuid4()
+        db_service.save_actual_batch(make_points([1.0, 2.0]), metric_id, scope_id)
+
+        result = db_service.save_actual_batch(
+            make_points([1.0, 5.0, 3.0]), metric_id, scope_id
+        )
+
+        assert (result.inserted, result.updated, result.unchanged) == (1, 1, 1)
+        with Session(sqlite_engine) as session:
+            rows = session.exec(select(Actual).order_by(Actual.time)).all()
+        assert [row.data for row in rows] == [1.0, 5.0, 3.0]
+
+    def test_duplicate_timestamps_keep_last_value(self, sqlite_engine):
+        metric_id, scope_id = uuid4(), uuid4()
+        points = make_points([1.0]) + make_points([7.0])
+
+        result = db_service.save_actual_batch(points, metric_id, scope_id)
+
+        assert result.inserted == 1
+        with Session(sqlite_engine) as session:
+            assert session.exec(select(Actual.data)).all() == [7.0]
+
+    def test_series_batch_writes_every_series(self, sqlite_engine):
+        scope_id = uuid4()
+        first, second = uuid4(), uuid4()
+        db_service.save_actual_batch(make_points([1.0, 2.0]), first, scope_id)
+
+        result = db_service.save_series_batch(
+            {
+                (first, scope_id): make_points([1.0, 4.0]),
+                (second, scope_id): make_points([3.0, 5.0, 6.0]),
+            }
+        )
+
+        assert (result.inserted, result.updated, result.unchanged) == (3, 1, 1)
+        with Session(sqlite_engine) as session:
+            rollups = session.exec(
+                select(ActualRollup.metric_id, ActualRollup.sum).where(
+                    ActualRollup.resolution == "1h"
+                )
+            ).all()
+        assert sorted(rollups, key=lambda row: row[1]) == [
+            (first, 5.0),
+            (second, 14.0),
+        ]
+
+    def test_save_actual_data_uses_batch_path(self, sqlite_engine):
+        metric_id, scope_id = uuid4(), uuid4()
+        time = datetime(2025, 5, 6, 12, 0, 0)
+
+        assert db_service.save_actual_data(time, 1.0, metric_id, scope_id)
+        assert db_service.save_actual_data(time, 2.0, metric_id, scope_id)
+
+        with Session(sqlite_engine) as session:
+            assert session.exec(select(Actual.data)).all() == [2.0]
+
+    def test_copy_needs_psycopg2(self, monkeypatch, postgres_engine):
+        db_service.init_db()
+        metric_id = db_service.get_metric_id("apg_imbalance")
+        scope_id = db_service.get_scope_id("austria")
+        monkeypatch.setattr(db_service, "COPY_THRESHOLD", 1)
+
+        copied = db_service.save_actual_batch(
+            make_points([1.0, 2.0]), metric_id, scope_id
+        )
+        # Other drivers have no copy_expert and fall back to the unnest upsert
+        monkeypatch.setattr(postgres_engine.dialect, "driver", "asyncpg")
+        upserted = db_service.save_actual_batch(
+            make_points([1.0, 5.0, 6.0]), metric_id, scope_id
+        )
+
+        assert (copied.inserted, copied.updated) == (2, 0)
+        assert (upserted.inserted, upserted.updated, upserted.unchanged) == (1, 1, 1)
+
+
+class TestNameIdCache:
+    def test_expires_after_ttl(self):
+        now = [0.0]
+        cache = db_service.NameIdCache(max_size=10, ttl_seconds=5, clock=lambda: now[0])
+        metric_id = uuid4()
+        cache.put("apg_imbalance", metric_id)
+
+        assert cache.get("apg_imbalance") == metric_id
+        now[0] = 5.0
+        assert cache.get("apg_imbalance") is None
+
+    def test_evicts_least_recently_used(self):
+        cache = db_service.NameIdCache(max_size=2, ttl_seconds=60)
+        cache.put("a", uuid4())
+        cache.put("b", uuid4())
+        cache.get("a")
+        cache.put("c", uuid4())
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert len(cache) == 2
+
+
+class TestMetricScopeResolution:
+    def test_known_names_are_served_without_queries(self, query_log):
+        metric_id = db_service.get_metric_id("apg_imbalance")
+        scope_id = db_service.get_scope_id("austria")
+        query_log.clear()
+
+        assert db_service.get_metric_id("apg_imbalance") == metric_id
+        assert db_service.get_scope_id("austria") == scope_id
+        assert query_log == []
+
+    def test_known_rows_are_served_without_queries(self, query_log):
+        metric = db_service.get_or_create_metric("apg_imbalance")
+        scope = db_service.get_or_create_scope("austria")
+        query_log.clear()
+
+        assert db_service.get_or_create_metric("apg_imbalance") is metric
+        assert db_service.get_or_create_scope("austria").scope_id == scope.scope_id
+        assert query_log == []
+
+    def test_existing_row_is_reused_after_invalidation(self, sqlite_engine):
+        metric_id = db_service.get_metric_id("apg_imbalance")
+        db_service.invalidate_id_caches()
+
+        assert db_service.get_metric_id("apg_imbalance") == metric_id
+        with Session(sqlite_engine) as session:
+            assert len(session.exec(select(Metric)).all()) == 1
+
+    def test_init_db_merges_duplicate_names(self, postgres_engine):
+        db_service.init_db()
+        scope_id = db_service.get_scope_id("austria")
+        metric_id = db_service.get_metric_id("apg_imbalance")
+        db_service.save_actual_batch(make_points([1.0, 2.0]), metric_id, scope_id)
+
+        # A duplicate name written before the constraint existed
+        duplicate_id = uuid4()
+        with postgres_engine.begin() as connection:
+            connection.execute(
+                text("ALTER TABLE public.metric DROP CONSTRAINT uq_metric_name")
+            )
+            connection.execute(
+                text("CREATE INDEX ix_public_metric_name ON public.metric (name)")
+            )
+            connection.execute(
+                text("INSERT INTO public.metric VALUES (:id, 'apg_imbalance', NULL)"),
+                {"id": duplicate_id},
+            )
+        db_service.save_actual_batch(
+            make_points([10.0, 20.0, 30.0]), duplicate_id, scope_id
+        )
+
+        db_service.init_db()
+
+        keep_id = min(metric_id, duplicate_id, key=str)
+        with Session(postgres_engine) as session:
+            assert session.exec(select(Metric.metric_id)).all() == [keep_id]
+            rows = session.exec(select(Actual).order_by(Actual.time)).all()
+            rollup = session.exec(select(ActualRollup)).all()
+        kept = [1.0, 2.0] if keep_id == metric_id else [10.0, 20.0]
+        assert [(row.metric_id, row.data) for row in rows] == [
+            (keep_id, kept[0]),
+            (keep_id, kept[1]),
+            (keep_id, 30.0),
+        ]
+        assert {row.metric_id for row in rollup} == {keep_id}
+        assert {row.count for row in rollup} == {3}
+        assert db_service.get_metric_id("apg_imbalance") == keep_id
+
+        # Only the constraint's index is left on the name
+        with postgres_engine.connect() as connection:
+            indexes = connection.execute(
+                text("SELECT indexname FROM pg_indexes WHERE tablename = 'metric'")
+            ).scalars()
+            assert sorted(indexes) == ["metric_pkey", "uq_metric_name"]
+
+    def test_get_or_create_metric_returns_row(self, sqlite_engine):
+        metric = db_service.get_or_create_metric("apg_imbalance", "APG imbalance")
+
+        assert metric.name == "apg_imbalance"
+        assert metric.description == "APG imbalance"
+        assert db_service.get_or_create_metric("apg_imbalance").metric_id == (
+            metric.metric_id
+        )
+
+
+class TestQuerySeries:
+    def test_raw_rows_are_paged(self, sqlite_engine):
+        metric_id, scope_id = uuid4(), uuid4()
+        db_service.save_actual_batch(make_points([1.0, 2.0, 3.0]), metric_id, scope_id)
+        start, end = datetime(2025, 5, 6, 12, 0), datetime(2025, 5, 6, 13, 0)
+
+        first = db_service.query_series(metric_id, scope_id, start, end, limit=2)
+        second = db_service.query_series(
+            metric_id, scope_id, start, end, limit=2, cursor=first["next_cursor"]
+        )
+
+        assert [bucket["last"] for bucket in first["buckets"]] == [1.0, 2.0]
+        assert first["next_cursor"] == "2025-05-06T12:01:00"
+        assert [bucket["last"] for bucket in second["buckets"]] == [3.0]
+        assert second["next_cursor"] is None
+
+    def test_buckets_report_min_max_mean_last(self, sqlite_engine):
+        metric_id, scope_id = uuid4(), uuid4()
+        values = [4.0, 1.0, 7.0, 2.0, 3.0, 10.0, 20.0]
+        db_service.save_actual_batch(
+            make_points(values, start=datetime(2025, 5, 6, 11, 58)),
+            metric_id,
+            scope_id,
+        )
+
+        result = db_service.query_series(
+            metric_id,
+            scope_id,
+            "2025-05-06T11:00:00",
+            "2025-05-06T13:00:00",
+            resolution="5m",
+        )
+
+        assert result["buckets"] == [
+            {
+                "bucket": "2025-05-06T11:55:00",
+                "min": 1.0,
+                "max": 4.0,
+                "mean": 2.5,
+                "last": 1.0,
+                "count": 2,
+            },
+            {
+                "bucket": "2025-05-06T12:00:00",
+                "min": 2.0,
+                "max": 20.0,
+                "mean": 8.4,
+                "last": 20.0,
+                "count": 5,
+            },
+        ]
+
+    def test_bucket_pages_continue_after_cursor(self, sqlite_engine):
+        metric_id, scope_id = uuid4(), uuid4()
+        db_service.save_actual_batch(make_points([1.0] * 40), metric_id, scope_id)
+        start, end = datetime(2025, 5, 6, 12, 0), datetime(2025, 5, 6, 13, 0)
+
+        first = db_service.query_series(
+            metric_id, scope_id, start, end, resolution="15m", limit=2
+        )
+        second = db_service.query_series(
+            metric_id,
+            scope_id,
+            start,
+            end,
+            resolution="15m",
+            limit=2,
+            cursor=first["next_cursor"],
+        )
+
+        assert [bucket["count"] for bucket in first["buckets"]] == [15, 15]
+        assert [bucket["count"] for bucket in second["buckets"]] == [10]
+        assert second["next_cursor"] is None
+
+
+def rollups(engine, resolution="15m"):
+    with Session(engine) as session:
+        statement = (
+            select(ActualRollup)
+            .where(ActualRollup.resolution == resolution)
+            .order_by(ActualRollup.bucket)
+        )
+        return [
+            (row.bucket, row.count, row.sum, row.min, row.max, row.first, row.last)
+            for row in session.exec(statement).all()
+        ]
+
+
+class TestRollups:
+    def test_writes_maintain_rollups(self, sqlite_engine):
+        metric_id, scope_id = uuid4(), uuid4()
+        start = datetime(2025, 5, 6, 12, 10)
+
+        db_service.save_actual_batch(
+            make_points([1.0, 2.0, 3.0, 4.0, 5.0, 6.0], start), metric_id, scope_id
+        )
+
+        assert rollups(sqlite_engine) == [
+            (datetime(2025, 5, 6, 12, 0), 5, 15.0, 1.0, 5.0, 1.0, 5.0),
+            (datetime(2025, 5, 6, 12, 15), 1, 6.0, 6.0, 6.0, 6.0, 6.0),
+        ]
+        assert rollups(sqlite_engine, "1h") == [
+            (datetime(2025, 5, 6, 12, 0), 6, 21.0, 1.0, 6.0, 1.0, 6.0)
+        ]
+
+    def test_corrections_only_touch_affected_buckets(self, sqlite_engine, query_log):
+        metric_id, scope_id = uuid4(), uuid4()
+        db_service.save_actual_batch(
+            make_points([1.0] * 30, datetime(2025, 5, 6, 12, 0)), metric_id, scope_id
+        )
+        query_log.clear()
+
+        db_service.save_actual_batch(
+            [{"timestamp": datetime(2025, 5, 6, 12, 20), "value": 9.0}],
+            metric_id,
+            scope_id,
+        )
+
+        refreshes = [sql for sql in query_log if "actual_rollup" in sql]
+        assert len(refreshes) == 2  # one bucket per resolution
+        assert rollups(sqlite_engine) == [
+            (datetime(2025, 5, 6, 12, 0), 15, 15.0, 1.0, 1.0, 1.0, 1.0),
+            (datetime(2025, 5, 6, 12, 15), 15, 23.0, 1.0, 9.0, 1.0, 1.0),
+        ]
+
+    def test_unchanged_writes_skip_rollups(self, sqlite_engine, query_log):
+        metric_id, scope_id = uuid4(), uuid4()
+        db_service.save_actual_batch(make_points([1.0, 2.0]), metric_id, scope_id)
+        query_log.clear()
+
+        db_service.save_actual_batch(make_points([1.0, 2.0]), metric_id, scope_id)
+
+        assert not [sql for sql in query_log if "actual_rollup" in sql]
+
+    def test_rebuild_restores_rollups(self, sqlite_engine):
+        metric_id, scope_id = uuid4(), uuid4()
+        db_service.save_actual_batch(make_points([1.0, 2.0, 3.0]), metric_id, scope_id)
+        expected = rollups(sqlite_engine)
+        with Session(sqlite_engine) as session:
+            session.exec(select(ActualRollup)).first().sum = 100.0
+            session.commit()
+
+        written = db_service.rebuild_rollups(
+            datetime(2025, 5, 6, 12, 0), datetime(2025, 5, 6, 12, 5)
+        )
+
+        assert written == 2
+        assert rollups(sqlite_engine) == expected
+
+    def test_rollup_query_matches_raw_aggregation(self, monkeypatch, sqlite_engine):
+        metric_id, scope_id = uuid4(), uuid4()
+        values = [float(i % 7) for i in range(90)]
+        db_service.save_actual_batch(
+            make_points(values, datetime(2025, 5, 6, 12, 3)), metric_id, scope_id
+        )
+        arguments = (metric_id, scope_id, "2025-05-06T12:00:00", "2025-05-06T14:00:00")
+
+        from_rollups = db_service.query_series(*arguments, "15m")
+        # Same width, but not a rollup resolution, so aggregated from Actual
+        monkeypatch.setitem(db_service.QUERY_RESOLUTIONS, "15m_raw", 900)
+        from_actual = db_service.query_series(*arguments, "15m_raw")
+
+        assert from_rollups["buckets"] == from_actual["buckets"]
+
+
+class TestPartitions:
+    def test_partition_bounds(self):
+        start = db_service.partition_start(datetime(2024, 12, 31, 23, 59), "month")
+
+        assert start == datetime(2024, 12, 1)
+        assert db_service.partition_end(start, "month") == datetime(2025, 1, 1)
+        assert db_service.partition_end(datetime(2024, 2, 1), "month") == datetime(
+            2024, 3, 1
+        )
+        assert db_service.partition_end(start, "day") == datetime(2024, 12, 2)
+        assert db_service.partition_name(start) == "actual_p20241201"
+
+    def test_plan_creates_ahead_and_retires_expired(self):
+        existing = [
+            (datetime(2024, 1, 1), datetime(2024, 2, 1)),
+            (datetime(2024, 2, 1), datetime(2024, 3, 1)),
+            (datetime(2024, 5, 1), datetime(2024, 6, 1)),
+        ]
+
+        missing, expired = db_service.plan_partitions(
+            existing, datetime(2024, 5, 20), "month", premake=2, retention_days=90
+        )
+
+        assert missing == [datetime(2024, 6, 1), datetime(2024, 7, 1)]
+        assert expired == [(datetime(2024, 1, 1), datetime(2024, 2, 1))]
+
+    def test_plan_partitions_rows_of_the_default_partition(self):
+        existing = [(datetime(2024, 5, 1), datetime(2024, 6, 1))]
+
+        missing, expired = db_service.plan_partitions(
+            existing,
+            datetime(2024, 5, 20),
+            "month",
+            premake=0,
+            retention_days=60,
+            unpartitioned=(datetime(2024, 2, 10), datetime(2024, 3, 5, 12, 0)),
+        )
+
+        assert missing == [datetime(2024, 2, 1), datetime(2024, 3, 1)]
+        assert expired == [(datetime(2024, 2, 1), datetime(2024, 3, 1))]
+
+    def test_past_rows_move_into_partitions(self, postgres_engine):
+        db_service.init_db(partitioned=True)
+        metric_id = db_service.get_metric_id("apg_imbalance")
+        scope_id = db_service.get_scope_id("austria")
+
+        def save(start):
+            db_service.save_actual_batch(
+                [
+                    {"timestamp": start + timedelta(hours=i), "value": float(i)}
+                    for i in range(48)
+                ],
+                metric_id,
+                scope_id,
+            )
+
+        def partitions_holding_rows():
+            with postgres_engine.connect() as connection:
+                return set(
+                    connection.execute(
+                        text("SELECT DISTINCT tableoid::regclass::text FROM actual")
+                    ).scalars()
+                )
+
+        # Rows of a month without a partition land in the default partition
+        save(datetime(2024, 2, 10))
+        assert partitions_holding_rows() == {"actual_default"}
+
+        result = db_service.maintain_partitions(now=datetime(2024, 5, 20), premake=0)
+        assert result["created"] == ["actual_p20240201", "actual_p20240501"]
+        assert partitions_holding_rows() == {"actual_p20240201"}
+
+        # Backfills create the partitions of their range before writing
+        created = db_service.ensure_partitions(
+            datetime(2023, 11, 15), datetime(2024, 1, 1)
+        )
+        assert created == ["actual_p20231101", "actual_p20231201"]
+        save(datetime(2023, 12, 10))
+        assert partitions_holding_rows() == {
+            "actual_p20231201",
+            "actual_p20240201",
+        }
+
+    def test_maintenance_is_a_no_op_without_postgres(self, sqlite_engine):
+        assert db_service.maintain_partitions(retention_days=1) == {
+            "created": [],
+            "retired": [],
+        }
+
+    def test_migration_requires_postgres(self, sqlite_engine):
+        with pytest.raises(ValueError, match="requires PostgreSQL"):
+            db_service.migrate_actual_to_partitioned()
@@ -0,0 +1,14 @@
+import pytest
+
+import db_statements
+from models import Metric
+
+
+def test_inserts_need_on_conflict_support():
+    with pytest.raises(ValueError, match="not supported for mysql"):
+        db_statements.dialect_insert("mysql", Metric.__table__)
+
+
+def test_bucketed_queries_need_a_bucket_function():
+    with pytest.raises(ValueError, match="not supported for mysql"):
+        db_statements.bucket_expression("mysql", 300)
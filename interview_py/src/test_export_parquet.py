@@ -0,0 +1,146 @@
+import os
+from datetime import datetime, timedelta
+
+import pyarrow.parquet as pq
+
+import db_service
+import export_parquet
+
+
+def make_points(start, count, step=timedelta(hours=1)):
+    return [{"timestamp": start + i * step, "value": float(i)} for i in range(count)]
+
+
+def day_files(directory):
+    return sorted(
+        os.path.relpath(os.path.join(root, name), directory)
+        for root, _, names in os.walk(directory)
+        for name in names
+        if name.endswith(".parquet")
+    )
+
+
+def test_export_writes_one_file_per_day(sqlite_engine, tmp_path):
+    metric_id = db_service.get_metric_id("apg_imbalance")
+    scope_id = db_service.get_scope_id("austria")
+    start = datetime(2025, 5, 6, 0, 0)
+    db_service.save_actual_batch(make_points(start, 72), metric_id, scope_id)
+
+    report = export_parquet.export_series(
+        str(tmp_path),
+        "apg_imbalance",
+        "austria",
+        start + timedelta(hours=12),
+        start + timedelta(hours=60),
+        chunk_rows=7,
+    )
+
+    directory = export_parquet.series_directory(
+        str(tmp_path), "apg_imbalance", "austria"
+    )
+    assert (report.rows, report.files) == (48, 3)
+    assert day_files(directory) == [
+        "date=2025-05-06/part-20250506T120000.parquet",
+        "date=2025-05-07/part-20250507T000000.parquet",
+        "date=2025-05-08/part-20250508T000000.parquet",
+    ]
+
+    table = pq.read_table(os.path.join(directory, "date=2025-05-07"))
+    assert table.column("time").to_pylist()[0] == datetime(2025, 5, 7, 0, 0)
+    assert table.column("value").to_pylist() == [float(i) for i in range(24, 48)]
+
+
+def test_incremental_export_only_writes_new_rows(sqlite_engine, tmp_path):
+    metric_id = db_service.get_metric_id("apg_imbalance")
+    scope_id = db_service.get_scope_id("austria")
+    start = datetime(2025, 5, 6, 0, 0)
+    db_service.save_actual_batch(make_points(start, 30), metric_id, scope_id)
+
+    first = export_parquet.export_series(
+        str(tmp_path), "apg_imbalance", "austria", incremental=True
+    )
+    db_service.save_actual_batch(
+        make_points(start + timedelta(hours=30), 4), metric_id, scope_id
+    )
+    second = export_parquet.export_series(
+        str(tmp_path), "apg_imbalance", "austria", incremental=True
+    )
+    third = export_parquet.export_series(
+        str(tmp_path), "apg_imbalance", "austria", incremental=True
+    )
+
+    assert (first.rows, second.rows, third.rows) == (30, 4, 0)
+    assert second.last_time == datetime(2025, 5, 7, 9, 0)
+
+    directory = export_parquet.series_directory(
+        str(tmp_path), "apg_imbalance", "austria"
+    )
+    assert day_files(directory) == [
+        "date=2025-05-06/part-20250506T000000.parquet",
+        "date=2025-05-07/part-20250507T000000.parquet",
+        "date=2025-05-07/part-20250507T060000.parquet",
+    ]
+    assert pq.read_table(directory).num_rows == 34
+
+
+def test_full_export_replaces_days_and_keeps_incremental_state(sqlite_engine, tmp_path):
+    metric_id = db_service.get_metric_id("apg_imbalance")
+    scope_id = db_service.get_scope_id("austria")
+    start = datetime(2025, 5, 6, 0, 0)
+    db_service.save_actual_batch(make_points(start, 48), metric_id, scope_id)
+    directory = export_parquet.series_directory(
+        str(tmp_path), "apg_imbalance", "austria"
+    )
+
+    export_parquet.export_series(
+        str(tmp_path), "apg_imbalance", "austria", incremental=True
+    )
+    # Re-export the older day in full, then continue incrementally
+    export_parquet.export_series(
+        str(tmp_path),
+        "apg_imbalance",
+        "austria",
+        start,
+        start + timedelta(days=1),
+    )
+    db_service.save_actual_batch(
+        make_points(start + timedelta(hours=48), 2), metric_id, scope_id
+    )
+    last = export_parquet.export_series(
+        str(tmp_path), "apg_imbalance", "austria", incremental=True
+    )
+
+    assert last.rows == 2
+    assert export_parquet.read_last_exported(directory) == datetime(2025, 5, 8, 1, 0)
+    assert day_files(directory) == [
+        "date=2025-05-06/part-20250506T000000.parquet",
+        "date=2025-05-07/part-20250507T000000.parquet",
+        "date=2025-05-08/part-20250508T000000.parquet",
+    ]
+    assert pq.read_table(directory).num_rows == 50
+
+
+def test_full_export_after_a_gap_keeps_incremental_state(sqlite_engine, tmp_path):
+    metric_id = db_service.get_metric_id("apg_imbalance")
+    scope_id = db_service.get_scope_id("austria")
+    start = datetime(2025, 5, 6, 0, 0)
+    db_service.save_actual_batch(make_points(start, 72), metric_id, scope_id)
+    directory = export_parquet.series_directory(
+        str(tmp_path), "apg_imbalance", "austria"
+    )
+
+    export_parquet.export_series(
+        str(tmp_path), "apg_imbalance", "austria", end=start + timedelta(days=1)
+    )
+    export_parquet.export_series(
+        str(tmp_path), "apg_imbalance", "austria", start + timedelta(days=2)
+    )
+    gap = export_parquet.export_series(
+        str(tmp_path), "apg_imbalance", "austria", incremental=True
+    )
+
+    # The skipped day is exported, the last day again into the same part file
+    assert gap.rows == 48
+    assert export_parquet.read_last_exported(directory) == datetime(2025, 5, 8, 23, 0)
+    assert len(day_files(directory)) == 3
+    assert pq.read_table(directory).num_rows == 72
@@ -0,0 +1,60 @@
+import json
+from datetime import datetime, timedelta
+
+from history_buffer import FORMAT_VERSION, HistoryBuffer
+
+
+def make_points(count, start=datetime(2025, 5, 6, 12, 0, 0)):
+    return [
+        {"timestamp": start + timedelta(minutes=i), "value": float(i)}
+        for i in range(count)
+    ]
+
+
+class TestHistoryBuffer:
+    def test_round_trip_keeps_last_entries_in_order(self):
+        buffer = HistoryBuffer(capacity=100)
+        buffer.extend(make_points(250))
+
+        restored = HistoryBuffer.from_state(buffer.to_state(), capacity=100)
+
+        assert restored.to_points() == make_points(250)[-100:]
+        assert restored.to_state()[0] == FORMAT_VERSION
+
+    def test_migrates_legacy_json_state(self):
+        legacy = [
+            {"timestamp": point["timestamp"].isoformat(), "value": point["value"]}
+            for point in make_points(3)
+        ]
+
+        buffer = HistoryBuffer.from_state(json.dumps(legacy).encode())
+
+        assert buffer.to_points() == make_points(3)
+
+    def test_migrates_legacy_value_list(self):
+        buffer = HistoryBuffer.from_state(b"[1.5, 2.5, 3.5]", capacity=2)
+
+        assert buffer.values() == [2.5, 3.5]
+        assert [point["timestamp"] for point in buffer.to_points()] == [None, None]
+
+        # Untimed values stay untimed through the packed state
+        buffer.append(datetime(2025, 5, 6, 12, 0, 0), 4.5)
+        restored = HistoryBuffer.from_state(buffer.to_state(), capacity=2)
+        assert restored.to_points() == [
+            {"timestamp": None, "value": 3.5},
+            {"timestamp": datetime(2025, 5, 6, 12, 0, 0), "value": 4.5},
+        ]
+
+    def test_state_is_smaller_than_json(self):
+        points = make_points(100)
+        buffer = HistoryBuffer()
+        buffer.extend(points)
+
+        legacy = json.dumps(
+            [
+                {"timestamp": p["timestamp"].isoformat(), "value": p["value"]}
+                for p in points
+            ]
+        )
+
+        assert len(buffer.to_state()) < len(legacy) / 2
@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+
+import lazy_imports
+from lazy_imports import lazy_import
+
+
+class TestLazyImports:
+    def test_module_body_runs_on_first_attribute_access(self, monkeypatch, tmp_path):
+        (tmp_path / "lazy_probe.py").write_text(
+            "import sys\nsys.lazy_probe_ran = True\n"
+        )
+        monkeypatch.syspath_prepend(str(tmp_path))
+        monkeypatch.delitem(sys.modules, "lazy_probe", raising=False)
+        monkeypatch.setattr(lazy_imports, "LAZY_IMPORTS", True)
+
+        module = lazy_import("lazy_probe")
+        assert not hasattr(sys, "lazy_probe_ran")
+
+        assert module.sys is sys
+        assert sys.lazy_probe_ran
+        del sys.lazy_probe_ran
+        del sys.modules["lazy_probe"]
+
+    def test_worker_import_skips_heavy_dependencies(self):
+        probe = (
+            "import sys, main; "
+            "print(','.join(sorted(name for name in "
+            "('sqlalchemy', 'sqlmodel', 'numpy', 'asyncpg') if name in sys.modules)))"
+        )
+        completed = subprocess.run(
+            [sys.executable, "-c", probe],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=dict(os.environ, LAZY_IMPORTS="1"),
+        )
+
+        assert completed.stdout.strip() == ""
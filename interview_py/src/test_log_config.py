@@ -0,0 +1,81 @@
+import io
+import json
+import logging
+import queue
+
+from log_config import (
+    SAMPLED,
+    BoundedQueueHandler,
+    JsonFormatter,
+    SamplingFilter,
+    _Listener,
+)
+
+
+def make_logger(name, *handlers):
+    logger = logging.getLogger(name)
+    logger.handlers = list(handlers)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+class TestLogConfig:
+    def test_sampling_keeps_one_in_rate_per_call_site(self):
+        discarded = []
+        records = queue.Queue()
+        handler = BoundedQueueHandler(records)
+        sampling = SamplingFilter(10, discarded.append)
+        handler.addFilter(sampling)
+        logger = make_logger("test_log_config.sampling", handler)
+
+        for index in range(25):
+            logger.info("Saved point %d", index, extra=SAMPLED)
+            logger.info("Rejected point %d", index, extra=SAMPLED)
+        logger.info("Window processed")
+
+        kept = [records.get_nowait() for _ in range(records.qsize())]
+        assert [record.getMessage() for record in kept] == [
+            "Saved point 0",
+            "Rejected point 0",
+            "Saved point 10",
+            "Rejected point 10",
+            "Saved point 20",
+            "Rejected point 20",
+            "Window processed",
+        ]
+        assert kept[0].sample_rate == 10
+        assert sampling.suppressed == len(discarded) == 44
+
+    def test_full_queue_drops_and_counts(self):
+        discarded = []
+        handler = BoundedQueueHandler(queue.Queue(maxsize=2), discarded.append)
+        logger = make_logger("test_log_config.bounded", handler)
+
+        for index in range(5):
+            logger.info("Point %d", index)
+
+        assert handler.queue.qsize() == 2
+        assert handler.dropped == 3
+        assert discarded == ["queue_full"] * 3
+
+    def test_listener_formats_json_off_the_calling_thread(self):
+        records = queue.Queue()
+        stream = io.StringIO()
+        output = logging.StreamHandler(stream)
+        output.setFormatter(JsonFormatter())
+        logger = make_logger("test_log_config.json", BoundedQueueHandler(records))
+
+        logger.info("Fetched %d data points", 12, extra={"request_id": "abc"})
+        queued = records.queue[0]
+        assert queued.msg == "Fetched %d data points" and queued.args == (12,)
+
+        listener = _Listener(records, output)
+        listener.start()
+        listener.stop()
+
+        entry = json.loads(stream.getvalue())
+        assert entry["message"] == "Fetched 12 data points"
+        assert entry["level"] == "INFO"
+        assert entry["logger"] == "test_log_config.json"
+        assert entry["request_id"] == "abc"
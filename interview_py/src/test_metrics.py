@@ -0,0 +1,88 @@
+import asyncio
+
+import metrics
+from metrics import Counter, MetricsRegistry
+from models import BatchWriteResult, ValidationResult
+
+
+class TestMetrics:
+    def test_histogram_renders_cumulative_buckets(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram(
+            "stage_seconds", "Stage durations", ["stage"], buckets=(0.1, 1.0)
+        )
+        histogram.observe(0.05, stage="fetch")
+        histogram.observe(0.5, stage="fetch")
+        histogram.observe(5.0, stage="fetch")
+
+        text = registry.render_prometheus()
+
+        assert "# TYPE stage_seconds histogram" in text
+        assert 'stage_seconds_bucket{stage="fetch",le="0.1"} 1' in text
+        assert 'stage_seconds_bucket{stage="fetch",le="1.0"} 2' in text
+        assert 'stage_seconds_bucket{stage="fetch",le="+Inf"} 3' in text
+        assert 'stage_seconds_count{stage="fetch"} 3' in text
+        assert registry.snapshot()["stage_seconds"]["fetch"]["p50"] == 1.0
+
+    def test_counter_snapshot_by_label(self):
+        counter = Counter("rejections_total", "Rejections", ["reason"])
+        counter.inc(reason="jump")
+        counter.inc(2, reason="jump")
+
+        assert counter.snapshot() == {"jump": 3}
+
+    def test_rejection_reason(self):
+        assert metrics.rejection_reason("Missing value") == "missing_value"
+        assert (
+            metrics.rejection_reason(
+                "Value 1500 outside acceptable range (-1000 to 1000)"
+            )
+            == "out_of_range"
+        )
+        assert metrics.rejection_reason("Suspicious jump from 1 to 300") == "jump"
+        assert metrics.rejection_reason("Database error") == "database_error"
+
+    def test_record_validation_and_write(self):
+        jumps = metrics.VALIDATION_REJECTIONS.value(reason="jump")
+        inserted = metrics.ROWS_WRITTEN.value(outcome="inserted")
+
+        metrics.record_validation(
+            [
+                ValidationResult(is_valid=True),
+                ValidationResult(
+                    is_valid=False, reason="Suspicious jump from 1 to 300"
+                ),
+            ]
+        )
+        metrics.record_write(BatchWriteResult(inserted=2, updated=1, unchanged=0))
+
+        assert metrics.VALIDATION_REJECTIONS.value(reason="jump") == jumps + 1
+        assert metrics.ROWS_WRITTEN.value(outcome="inserted") == inserted + 2
+
+    def test_instrument_keeps_coroutine_actions_async(self):
+        async def fetch():
+            return 42
+
+        before = metrics.STAGE_DURATION.count(stage="test_async")
+        timed = metrics.instrument("test_async", fetch)
+
+        assert asyncio.run(timed()) == 42
+        assert metrics.STAGE_DURATION.count(stage="test_async") == before + 1
+        assert metrics.instrument("test_sync", lambda: 7)() == 7
+
+    def test_metrics_endpoint_serves_prometheus_text(self):
+        sent = []
+
+        async def inner(scope, receive, send):
+            sent.append("inner")
+
+        async def send(message):
+            sent.append(message)
+
+        app = metrics.with_metrics_endpoint(inner)
+        asyncio.run(app({"type": "http", "path": "/metrics"}, None, send))
+        asyncio.run(app({"type": "http", "path": "/restate"}, None, send))
+
+        assert sent[0]["status"] == 200
+        assert b"etl_stage_duration_seconds" in sent[1]["body"]
+        assert sent[2] == "inner"
@@ -0,0 +1,172 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+import apg_data_service
+import response_cache
+from test_backfill import make_response
+
+NOW = datetime(2025, 5, 6, 12, 0)
+
+
+def fake_fetch(calls):
+    def fetch(start, end):
+        calls.append((start, end))
+        return make_response(start, end).model_dump_json().encode()
+
+    return fetch
+
+
+def timestamps(data_points):
+    return [point["timestamp"] for point in data_points]
+
+
+def test_cache_stitches_buckets_and_fetches_only_missing(tmp_path):
+    cache = response_cache.ResponseCache(str(tmp_path), clock=lambda: NOW)
+    calls = []
+    start = datetime(2025, 5, 6, 1, 0)
+
+    first = cache.fetch(
+        start + timedelta(minutes=70),
+        start + timedelta(minutes=130),
+        fake_fetch(calls),
+        apg_data_service.decode_data_points,
+    )
+    assert calls == [(start + timedelta(hours=1), start + timedelta(hours=3))]
+    assert len(first) == 120
+
+    # Hours 1 and 4 are missing, 2 and 3 are served from disk
+    calls.clear()
+    data_points = cache.fetch(
+        start + timedelta(minutes=30),
+        start + timedelta(minutes=210),
+        fake_fetch(calls),
+        apg_data_service.decode_data_points,
+    )
+    assert calls == [
+        (start, start + timedelta(hours=1)),
+        (start + timedelta(hours=3), start + timedelta(hours=4)),
+    ]
+    assert timestamps(data_points) == [
+        start + timedelta(minutes=minute) for minute in range(240)
+    ]
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def test_open_bucket_expires_and_closed_bucket_is_mapped(tmp_path):
+    cache = response_cache.ResponseCache(
+        str(tmp_path), open_ttl_seconds=30, settle_minutes=0, clock=lambda: NOW
+    )
+    calls = []
+    closed, current = datetime(2025, 5, 6, 10, 0), datetime(2025, 5, 6, 12, 0)
+
+    cache.fetch(closed, current + timedelta(hours=1), fake_fetch(calls), list)
+    assert sorted(os.listdir(tmp_path)) == [
+        "20250506T1000-60.json",
+        "20250506T1100-60.json",
+        "20250506T1200-60.open.json",
+    ]
+
+    body_types = cache.fetch(
+        closed, current + timedelta(hours=1), fake_fetch(calls), lambda b: [type(b)]
+    )
+    assert calls[1:] == []
+    assert body_types == [memoryview, memoryview, bytes]
+    assert (cache.hits, cache.misses) == (3, 3)
+
+    open_path = tmp_path / "20250506T1200-60.open.json"
+    stale = open_path.stat().st_mtime - 60
+    os.utime(open_path, (stale, stale))
+    cache.fetch(current, current + timedelta(hours=1), fake_fetch(calls), list)
+    assert calls[1:] == [(current, current + timedelta(hours=1))]
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    calls = []
+    day = datetime(2025, 5, 5)
+    body = make_response(day, day + timedelta(hours=1)).model_dump_json().encode()
+    cache = response_cache.ResponseCache(
+        str(tmp_path), max_bytes=int(len(body) * 2.5), clock=lambda: NOW
+    )
+
+    for hour in (0, 1, 0, 2):
+        start = day + timedelta(hours=hour)
+        cache.fetch(start, start + timedelta(hours=1), fake_fetch(calls), list)
+
+    assert cache.evictions == 1
+    assert cache.size_bytes <= cache.max_bytes
+    assert sorted(os.listdir(tmp_path)) == [
+        "20250505T0000-60.json",
+        "20250505T0200-60.json",
+    ]
+
+    # The index is rebuilt from the directory
+    assert response_cache.ResponseCache(str(tmp_path)).size_bytes == cache.size_bytes
+
+
+def test_fetch_data_points_uses_cache(tmp_path, monkeypatch):
+    calls = []
+
+    async def fetch(start_date, end_date):
+        calls.append(start_date)
+        start = apg_data_service.parse_api_date(start_date)
+        end = apg_data_service.parse_api_date(end_date)
+        return make_response(start, end).model_dump_json().encode()
+
+    monkeypatch.setattr(apg_data_service, "fetch_imbalance_content_async", fetch)
+    monkeypatch.setattr(
+        response_cache, "_cache", response_cache.ResponseCache(str(tmp_path))
+    )
+    start = datetime(2025, 5, 6, 0, 30)
+
+    for _ in range(2):
+        data_points = asyncio.run(
+            apg_data_service.fetch_data_points_async(
+                apg_data_service.format_date_for_api(start),
+                apg_data_service.format_date_for_api(start + timedelta(minutes=45)),
+            )
+        )
+        assert timestamps(data_points) == [
+            start + timedelta(minutes=minute) for minute in range(45)
+        ]
+
+    assert calls == ["2025-05-06T000000"]
+
+
+def test_incomplete_settled_bucket_stays_open(tmp_path):
+    cache = response_cache.ResponseCache(
+        str(tmp_path), open_ttl_seconds=30, clock=lambda: NOW
+    )
+    start = datetime(2025, 5, 6, 10, 0)
+    calls = []
+
+    def fetch_partial(start, end):
+        calls.append((start, end))
+        # APG has not published the last ten minutes of the hour yet
+        partial = make_response(start, end - timedelta(minutes=10))
+        return partial.model_dump_json().encode()
+
+    first = cache.fetch(
+        start,
+        start + timedelta(hours=1),
+        fetch_partial,
+        apg_data_service.decode_data_points,
+    )
+    assert len(first) == 50
+    assert os.listdir(tmp_path) == ["20250506T1000-60.open.json"]
+
+    open_path = tmp_path / "20250506T1000-60.open.json"
+    stale = open_path.stat().st_mtime - 60
+    os.utime(open_path, (stale, stale))
+    complete = cache.fetch(
+        start,
+        start + timedelta(hours=1),
+        fake_fetch(calls),
+        apg_data_service.decode_data_points,
+    )
+
+    assert len(complete) == 60
+    assert len(calls) == 2
+    # The open file is replaced by the closed one
+    assert os.listdir(tmp_path) == ["20250506T1000-60.json"]
+    assert cache.size_bytes == os.path.getsize(tmp_path / "20250506T1000-60.json")
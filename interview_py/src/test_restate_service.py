@@ -0,0 +1,238 @@
+import asyncio
+import inspect
+from datetime import datetime, timedelta
+
+import pytest
+from restate import TerminalError
+from restate.serde import DefaultSerde
+
+import apg_data_service
+import async_db_service
+import db_service
+import metrics
+import restate_service
+from models import Actual, BatchWriteResult, SeriesQueryRequest
+
+
+class FakeContext:
+    """
+    In-memory Restate context that journals like the SDK
+
+    ctx.run results are round-tripped through DefaultSerde. A context built
+    from another one's journal replays it: journaled steps return their
+    recorded result without running the action again.
+    """
+
+    def __init__(self, journal=None, calls=None):
+        self.journal = list(journal or [])
+        self.calls = calls or {}
+        self.state = {}
+        self.sent = []
+        self._position = 0
+
+    async def run(self, name, action, serde=None, type_hint=None, **kwargs):
+        if serde is None:
+            if type_hint is None:
+                type_hint = inspect.signature(action, eval_str=True).return_annotation
+            serde = DefaultSerde(type_hint)
+
+        if self._position < len(self.journal):
+            journaled_name, buffer = self.journal[self._position]
+            assert journaled_name == name
+        else:
+            result = action()
+            if inspect.isawaitable(result):
+                result = await result
+            buffer = serde.serialize(result)
+            self.journal.append((name, buffer))
+        self._position += 1
+        return serde.deserialize(buffer)
+
+    async def object_call(self, handler, key, arg):
+        return self.calls[handler.__name__](key, arg)
+
+    def service_send(self, handler, arg, send_delay=None):
+        self.sent.append((handler.__name__, arg))
+
+    async def get(self, name, serde=None, type_hint=None):
+        if name not in self.state:
+            return None
+        return (serde or DefaultSerde(type_hint)).deserialize(self.state[name])
+
+    def set(self, name, value, serde=None):
+        self.state[name] = (serde or DefaultSerde(type(value))).serialize(value)
+
+
+START = datetime(2025, 5, 6, 12, 0)
+
+
+def make_points(values, start=START):
+    return [
+        {"timestamp": start + timedelta(minutes=i), "value": value}
+        for i, value in enumerate(values)
+    ]
+
+
+def iso_points(points):
+    return [
+        {"timestamp": p["timestamp"].isoformat(), "value": p["value"]} for p in points
+    ]
+
+
+def patch_database(monkeypatch, history_values):
+    """Serve history_values as the stored series and record every write"""
+    writes = []
+    history = make_points(history_values, start=START - timedelta(hours=1))
+
+    async def get_recent_data(metric_id, scope_id, limit=5):
+        return [
+            Actual(
+                time=p["timestamp"],
+                data=p["value"],
+                metric_id=metric_id,
+                scope_id=scope_id,
+            )
+            for p in reversed(history)
+        ]
+
+    async def save_actual_batch(points, metric_id, scope_id):
+        writes.append([p["value"] for p in points])
+        return BatchWriteResult(inserted=len(points))
+
+    monkeypatch.setattr(async_db_service, "get_recent_data", get_recent_data)
+    monkeypatch.setattr(async_db_service, "save_actual_batch", save_actual_batch)
+    return writes
+
+
+SERIES = {
+    "metric_name": "apg_imbalance",
+    "metric_id": "00000000-0000-0000-0000-000000000001",
+    "scope_id": "00000000-0000-0000-0000-000000000002",
+}
+
+
+def test_window_results_survive_the_journal(monkeypatch):
+    writes = patch_database(monkeypatch, [0.0, 10.0, 20.0])
+    data = {**SERIES, "data_points": iso_points(make_points([30.0, 900.0, 40.0]))}
+
+    ctx = FakeContext()
+    results = asyncio.run(restate_service.validate_and_store_window(ctx, data))
+    replayed = asyncio.run(
+        restate_service.validate_and_store_window(FakeContext(ctx.journal), data)
+    )
+
+    assert results == replayed
+    assert [result["success"] for result in results] == [True, False, True]
+    assert "jump" in results[1]["reason"]
+    assert [name for name, _ in ctx.journal] == [
+        "load_recent_data",
+        "validate_window",
+        "save_window",
+    ]
+    # The replay reads the write from the journal instead of repeating it
+    assert writes == [[30.0, 40.0]]
+
+
+def test_watermark_covers_rejected_points(monkeypatch):
+    writes = patch_database(monkeypatch, [0.0, 10.0, 20.0])
+    window = iso_points(make_points([30.0, 40.0, 900.0]))
+    ctx = FakeContext()
+
+    asyncio.run(
+        restate_service.validate_and_store_window(
+            ctx, {**SERIES, "data_points": window}
+        )
+    )
+    watermark = asyncio.run(restate_service.get_watermark(ctx, 3))
+
+    assert writes == [[30.0, 40.0]]
+    assert watermark["watermark"] == window[-1]["timestamp"]
+    assert watermark["values"] == {
+        point["timestamp"]: point["value"] for point in window
+    }
+    # The next tick re-fetches the overlap and skips the rejected point too
+    assert (
+        apg_data_service.skip_unchanged_points(
+            window, watermark["watermark"], watermark["values"]
+        )
+        == []
+    )
+
+
+def test_failed_write_keeps_the_watermark(monkeypatch):
+    patch_database(monkeypatch, [0.0, 10.0, 20.0])
+
+    async def save_actual_batch(points, metric_id, scope_id):
+        return None
+
+    monkeypatch.setattr(async_db_service, "save_actual_batch", save_actual_batch)
+    window = iso_points(make_points([30.0, 900.0]))
+    ctx = FakeContext()
+
+    results = asyncio.run(
+        restate_service.validate_and_store_window(
+            ctx, {**SERIES, "data_points": window}
+        )
+    )
+
+    assert [result["success"] for result in results] == [False, False]
+    # Still the newest point reloaded from the database
+    watermark = asyncio.run(restate_service.get_watermark(ctx, 3))["watermark"]
+    assert watermark == datetime(2025, 5, 6, 11, 2).isoformat()
+
+
+def test_point_results_survive_the_journal(monkeypatch):
+    writes = patch_database(monkeypatch, [0.0, 10.0, 20.0])
+    results = []
+
+    for value in (30.0, 900.0):
+        data = {**SERIES, "data_point": iso_points(make_points([value]))[0]}
+        ctx = FakeContext()
+        result = asyncio.run(restate_service.validate_and_store(ctx, data))
+        replayed = asyncio.run(
+            restate_service.validate_and_store(FakeContext(ctx.journal), data)
+        )
+        assert result == replayed
+        results.append(result["success"])
+
+    assert results == [True, False]
+    assert writes == [[30.0]]
+
+
+def test_skipped_points_are_counted_once_across_replays(monkeypatch):
+    async def fetch_series(start_date, end_date):
+        return {"apg_imbalance": make_points([0.0, 1.0, 2.0, 3.0, 4.0])}
+
+    def get_watermark(key, overlap_minutes):
+        stored = make_points([0.0, 1.0, 2.0])
+        return {
+            "watermark": stored[-1]["timestamp"].isoformat(),
+            "values": {p["timestamp"].isoformat(): p["value"] for p in stored},
+        }
+
+    monkeypatch.setattr(apg_data_service, "fetch_series_async", fetch_series)
+    calls = {"get_watermark": get_watermark}
+    skipped_before = metrics.POINTS_SKIPPED.value()
+
+    ctx = FakeContext(calls=calls)
+    result = asyncio.run(restate_service.fetch_and_process_data(ctx))
+    replayed = asyncio.run(
+        restate_service.fetch_and_process_data(FakeContext(ctx.journal, calls))
+    )
+
+    assert result == replayed
+    assert (result["skipped_count"], result["data_points_count"]) == (3, 2)
+    assert metrics.POINTS_SKIPPED.value() == skipped_before + 3
+    [(handler, request)] = ctx.sent
+    assert handler == "process_data_window"
+    assert [p["value"] for p in request.data_points] == [3.0, 4.0]
+
+
+def test_query_accepts_the_resolutions_of_db_service(monkeypatch):
+    monkeypatch.setitem(db_service.QUERY_RESOLUTIONS, "30m", 1800)
+    request = SeriesQueryRequest(
+        start=START.isoformat(), end=START.isoformat(), resolution="2h"
+    )
+
+    with pytest.raises(TerminalError, match="raw, 5m, 15m, 1h, 30m"):
+        asyncio.run(restate_service.query_series(FakeContext(), request))
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from history_buffer import HistoryBuffer
+from rolling_stats import FORMAT_VERSION, RollingStats
+
+
+class TestRollingStats:
+    def test_matches_window_of_history_buffer(self):
+        values = np.random.default_rng(7).normal(50, 20, 500).round(2)
+        history = HistoryBuffer(capacity=25)
+        stats = RollingStats(window=25, alpha=0.2)
+
+        ewma = None
+        for index, value in enumerate(values):
+            stats.add(value, history.append(f"2025-05-06T00:{index % 60:02d}", value))
+            ewma = value if ewma is None else ewma + 0.2 * (value - ewma)
+
+            window = np.array(history.values())
+            assert len(stats) == window.size
+            assert stats.mean == pytest.approx(window.mean())
+            if window.size > 1:
+                assert stats.variance == pytest.approx(window.var(ddof=1))
+            assert stats.ewma == pytest.approx(ewma)
+            assert stats.last == value
+
+    def test_from_values_matches_incremental_updates(self):
+        values = [float(value) for value in range(40)]
+
+        stats = RollingStats.from_values(values, window=10)
+
+        assert len(stats) == 10
+        assert stats.mean == pytest.approx(np.mean(values[-10:]))
+        assert stats.variance == pytest.approx(np.var(values[-10:], ddof=1))
+
+    def test_state_round_trip(self):
+        stats = RollingStats.from_values([1.0, 4.0, 2.5], window=100, alpha=0.3)
+
+        restored = RollingStats.from_state(stats.to_state(), window=100, alpha=0.3)
+
+        assert stats.to_state()[0] == FORMAT_VERSION
+        assert vars(restored) == vars(stats)
+        assert RollingStats.from_state(stats.to_state(), window=50) is None
+        assert RollingStats.from_state(None) is None
+
+    def test_zscore_uses_std_floor(self):
+        stats = RollingStats.from_values([10.0] * 20)
+
+        assert stats.zscore(10.0) == 0.0
+        assert stats.zscore(11.0) == float("inf")
+        assert stats.zscore(13.0, min_std=1.0) == pytest.approx(3.0)